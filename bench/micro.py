@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks of catalog lookups and budget search on synthetic catalogs.
+
+Each case runs against catalogs generated by bench.synthetic_catalog at
+several sizes, and the budget solvers also run at several surface counts.
+Timing follows pytest-benchmark: warm-up, then rounds until ``--min-time``.
+It reports min/max/mean/stddev/median/ops, and ``--json`` writes a report
+in the same layout. ``--compare`` diffs the current run against an earlier
+report, so regressions show up commit to commit.
+
+Usage:
+    python bench/micro.py                                   # 10k and 100k variants
+    python bench/micro.py --sizes 10000,100000,1000000 --json bench/micro_report.json
+    python bench/micro.py --filter budget --surfaces 2,4,8
+    python bench/micro.py --compare old_report.json
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+sys.path.insert(0, REPO_ROOT)
+
+from bench.synthetic_catalog import generate_catalog  # noqa: E402
+
+
+def measure(func: Callable[[], Any], min_time: float, max_rounds: int = 10000, warmup: int = 1) -> Dict[str, float]:
+    """Time ``func`` like pytest-benchmark's pedantic mode and return its stats (seconds)."""
+    for _ in range(warmup):
+        func()
+    timings: List[float] = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        deadline = time.perf_counter() + min_time
+        while len(timings) < max_rounds and (len(timings) < 3 or time.perf_counter() < deadline):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    mean = statistics.fmean(timings)
+    return {
+        "min": min(timings),
+        "max": max(timings),
+        "mean": mean,
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "median": statistics.median(timings),
+        "rounds": len(timings),
+        "ops": 1 / mean if mean else 0.0,
+    }
+
+
+@contextmanager
+def use_catalog(data: Dict[str, Any]) -> Iterator[None]:
+    """Make ``data`` the shared catalog for the duration of the block."""
+    from react_agent.catalog import PriceCatalog, pinned_catalog
+
+    with pinned_catalog(PriceCatalog(data)):
+        yield
+
+
+def _first_subtype_paths(data: Dict[str, Any], count: int) -> List[List[str]]:
+    """Paths of ``count`` subtypes spread over the categories (surfaces for the solvers)."""
+    paths = []
+    categories = list(data)
+    for i in range(count):
+        category = categories[i % len(categories)]
+        types = list(data[category])
+        material_type = types[(i // len(categories)) % len(types)]
+        subtype = next(iter(data[category][material_type]))
+        paths.append([category, material_type, subtype])
+    return paths
+
+
+def build_cases(data: Dict[str, Any], surface_counts: List[int]) -> List[Dict[str, Any]]:
+    """Benchmark cases for one catalog: [{"name", "group", "params", "func"}]."""
+    from react_agent.database_utils import get_price_range, search_materials
+    from react_agent.exhaustive_search import find_best_variant_for_budget
+    from react_agent.path_resolver import fold
+    from react_agent.quote_generator import VIETNAMESE_MATERIAL_MAP, calculate_optimal_combinations
+    from react_agent.tools_quotes import find_price_range, resolve_path
+
+    category = next(iter(data))
+    material_type = next(iter(data[category]))
+    subtype = next(iter(data[category][material_type]))
+    variant = next(iter(data[category][material_type][subtype]))
+    # Lowercased, truncated names of the LAST subtree miss the exact lookup and take the fuzzy search
+    last_category = list(data)[-1]
+    last_type = list(data[last_category])[-1]
+    last_subtype = list(data[last_category][last_type])[-1]
+    last_variant = list(data[last_category][last_type][last_subtype])[-1]
+    fuzzy_path = [last_category.lower(), last_type.lower()[:-2], last_subtype.lower()[:-2], last_variant]
+
+    cases = [
+        {"name": "search_materials[hit]", "group": "search", "func": lambda: search_materials("600x600")},
+        {"name": "search_materials[miss]", "group": "search", "func": lambda: search_materials("không tồn tại")},
+        {"name": "search_materials[top10]", "group": "search",
+         "func": lambda: search_materials(f"{material_type} mẫu", limit=10)},
+        {"name": "search_materials[unaccented]", "group": "search",
+         "func": lambda: search_materials(fold(f"{subtype} 600x600"), limit=10)},
+        {"name": "get_price_range[type]", "group": "price_range",
+         "func": lambda: get_price_range(category, material_type)},
+        {"name": "get_price_range[subtype]", "group": "price_range",
+         "func": lambda: get_price_range(category, material_type, subtype)},
+        {"name": "find_price_range[category]", "group": "price_range",
+         "func": lambda: find_price_range(data[category])},
+        {"name": "resolve_path[exact]", "group": "resolve",
+         "func": lambda: resolve_path(data, [category, material_type, subtype, variant])},
+        {"name": "resolve_path[fuzzy]", "group": "resolve", "func": lambda: resolve_path(data, fuzzy_path)},
+        {"name": "resolve_path[miss]", "group": "resolve",
+         "func": lambda: resolve_path(data, [category, "không tồn tại", "không tồn tại"])},
+    ]
+
+    for surfaces in surface_counts:
+        paths = _first_subtype_paths(data, surfaces)
+        area_map = {"surfaces": {f"surface {i}": {"path": path, "area": 20} for i, path in enumerate(paths)}}
+        budget = 30_000_000 * surfaces
+        cases.append({
+            "name": f"find_best_variant_for_budget[{surfaces}]", "group": "budget", "params": {"surfaces": surfaces},
+            "func": lambda area_map=area_map, budget=budget: find_best_variant_for_budget(data, area_map, budget),
+        })
+
+        # calculate_optimal_combinations looks materials up by Vietnamese keyword -> category
+        keywords = [k for k, v in VIETNAMESE_MATERIAL_MAP.items() if v in data] or ["sàn"]
+        components = [
+            {"position": f"surface {i}", "material_type": keywords[i % len(keywords)], "area": "20m2"}
+            for i in range(surfaces)
+        ]
+        cases.append({
+            "name": f"calculate_optimal_combinations[{surfaces}]", "group": "budget", "params": {"surfaces": surfaces},
+            "func": lambda components=components, budget=budget: calculate_optimal_combinations(components, budget),
+        })
+    return cases
+
+
+def _commit_info() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+    except OSError:
+        commit, dirty = None, None
+    return {"id": commit, "dirty": dirty}
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    """Print mean-time ratios of the current run against an earlier report."""
+    before = {b["fullname"]: b["stats"]["mean"] for b in previous.get("benchmarks", [])}
+    print(f"\n{'benchmark':70} {'before':>12} {'after':>12} {'ratio':>8}")
+    for bench in current["benchmarks"]:
+        old = before.get(bench["fullname"])
+        new = bench["stats"]["mean"]
+        ratio = f"{new / old:7.2f}x" if old else "    new"
+        old_text = f"{old * 1000:10.3f}ms" if old else " " * 12
+        print(f"{bench['fullname']:70} {old_text} {new * 1000:10.3f}ms {ratio}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated catalog sizes (variants)")
+    parser.add_argument("--surfaces", default="2,4,6", help="Comma-separated surface counts for the budget solvers")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds each case keeps running")
+    parser.add_argument("--filter", default=None, help="Only run cases whose name or group contains this text")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Write a pytest-benchmark style report to this file")
+    parser.add_argument("--compare", default=None, help="Earlier report to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    surface_counts = [int(count) for count in args.surfaces.split(",")]
+
+    benchmarks = []
+    for size in sizes:
+        start = time.perf_counter()
+        data = generate_catalog(size, seed=args.seed)
+        print(f"\n== catalog: {size:,} variants (generated in {time.perf_counter() - start:.2f}s) ==")
+        with use_catalog(data):
+            for case in build_cases(data, surface_counts):
+                if args.filter and args.filter not in case["name"] and args.filter not in case["group"]:
+                    continue
+                stats = measure(case["func"], args.min_time)
+                fullname = f"{case['name']}@{size}"
+                benchmarks.append({
+                    "name": case["name"],
+                    "fullname": fullname,
+                    "group": case["group"],
+                    "params": {"variants": size, **case.get("params", {})},
+                    "stats": stats,
+                })
+                print(f"{fullname:70} mean {stats['mean'] * 1000:10.3f}ms  "
+                      f"median {stats['median'] * 1000:10.3f}ms  rounds {stats['rounds']}")
+
+    report = {
+        "machine_info": {"python_version": platform.python_version(), "machine": platform.machine(),
+                         "system": platform.system()},
+        "commit_info": _commit_info(),
+        "datetime": datetime.datetime.now().isoformat(),
+        "benchmarks": benchmarks,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Replay recorded conversations through the graph with a stub LLM.
+
+Every session in ``sessions/`` (legacy ``.json`` lists and ``.jsonl`` logs)
+is replayed turn by turn through ``graph.astream``. All chat models are
+replaced by bench.stub_llm.StubChatModel, which answers from the recorded
+debug logs with a fixed synthetic latency, so the numbers measure the
+non-LLM overhead (routing, parsing, tools, serialization, file I/O)
+without a GPU or network.
+
+Usage:
+    python bench/replay.py                      # one pass, no synthetic latency
+    python bench/replay.py --latency-ms 50 --repeat 5 --concurrency 4
+    python bench/replay.py --json bench_report.json
+
+Reported: turns per second, per-node latency (p50/p95/max, taken from the
+graph's update stream), LLM/tool spans from the tracing layer, and memory
+blocks allocated per turn (``sys.getallocatedblocks`` delta, plus the
+tracemalloc peak with ``--tracemalloc``).
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+sys.path.insert(0, REPO_ROOT)
+
+# Mỗi lượt phải gọi stub thật sự, không lấy từ LLM cache
+os.environ.setdefault("LLM_CACHE", "0")
+
+
+def load_sessions(session_dir: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Read every recorded session as a list of {"type", "content"} messages."""
+    sessions = {}
+    for path in sorted(glob.glob(os.path.join(session_dir, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            messages = json.load(f)
+        if isinstance(messages, list) and messages:
+            sessions[os.path.splitext(os.path.basename(path))[0]] = messages
+    for path in sorted(glob.glob(os.path.join(session_dir, "*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            messages = [json.loads(line) for line in f if line.strip()]
+        if messages:
+            sessions[os.path.splitext(os.path.basename(path))[0]] = messages
+    return sessions
+
+
+def session_turns(messages: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Split a session into the message prefixes the graph saw, one per user turn."""
+    turns = [messages[:i + 1] for i, message in enumerate(messages) if message.get("type") == "human"]
+    # Phiên chỉ có ảnh (system report) vẫn là một lượt
+    return turns or [messages]
+
+
+def _to_langchain(messages: List[Dict[str, Any]]) -> list:
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+    classes = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+    return [classes[m["type"]](content=m["content"]) for m in messages if m.get("type") in classes]
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+async def _replay_turn(graph: Any, session_id: str, messages: List[Dict[str, Any]], node_times: Dict[str, List[float]]) -> int:
+    """Run one turn; returns the net number of memory blocks it left allocated."""
+    blocks_before = sys.getallocatedblocks()
+    state = {"messages": _to_langchain(messages), "session_id": session_id}
+    last = time.perf_counter()
+    async for update in graph.astream(state):
+        now = time.perf_counter()
+        for node_name in update:
+            node_times.setdefault(node_name, []).append((now - last) * 1000)
+        last = now
+    return sys.getallocatedblocks() - blocks_before
+
+
+async def replay(
+    sessions: Dict[str, List[Dict[str, Any]]],
+    repeat: int,
+    concurrency: int
+) -> Dict[str, Any]:
+    """Replay every session ``repeat`` times, ``concurrency`` sessions at a time."""
+    from react_agent.graph import graph
+
+    node_times: Dict[str, List[float]] = {}
+    turn_times: List[float] = []
+    allocated_blocks: List[int] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_session(run: int, name: str, messages: List[Dict[str, Any]]) -> None:
+        async with semaphore:
+            # Turns of one session run in order so incremental summaries behave as in production
+            for turn in session_turns(messages):
+                start = time.perf_counter()
+                allocated_blocks.append(await _replay_turn(graph, f"bench-{run}-{name}", turn, node_times))
+                turn_times.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        run_session(run, name, messages)
+        for run in range(repeat)
+        for name, messages in sessions.items()
+    ])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "turns": len(turn_times),
+        "elapsed_s": elapsed,
+        "turns_per_s": len(turn_times) / elapsed if elapsed else 0.0,
+        "turn_ms": _summary(turn_times),
+        "nodes": {name: _summary(times) for name, times in sorted(node_times.items())},
+        "allocated_blocks_per_turn": {
+            "mean": sum(allocated_blocks) / len(allocated_blocks) if allocated_blocks else 0,
+            "max": max(allocated_blocks, default=0),
+        },
+    }
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values),
+        "p50_ms": _percentile(values, 0.50),
+        "p95_ms": _percentile(values, 0.95),
+        "max_ms": max(values),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sessions", default=os.path.join(REPO_ROOT, "sessions"), help="Directory of recorded sessions")
+    parser.add_argument("--logs", default=os.path.join(REPO_ROOT, "debug_logs"), help="Directory of recorded LLM calls")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Synthetic latency per LLM call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Random extra latency per LLM call")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay every session this many times")
+    parser.add_argument("--concurrency", type=int, default=1, help="Sessions replayed at once")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report the tracemalloc peak (slower)")
+    parser.add_argument("--workdir", default=None, help="Working directory for files the graph writes (default: a temp dir)")
+    parser.add_argument("--json", default=None, help="Write the report to this file")
+    args = parser.parse_args()
+
+    from bench.stub_llm import StubChatModel, iter_recorded_calls
+
+    sessions = load_sessions(args.sessions)
+    stub = StubChatModel(list(iter_recorded_calls(args.logs)), args.latency_ms, args.jitter_ms)
+
+    # Summaries, quotes and debug logs go to a scratch directory, not the repo
+    os.chdir(args.workdir or tempfile.mkdtemp(prefix="bench-replay-"))
+
+    from react_agent.configuration import Configuration
+    from react_agent.model_registry import model_registry
+    from react_agent.tracing import latency_metrics, reset_metrics
+
+    config = Configuration()
+    for model_name in {config.model, config.fast_model}:
+        model_registry.register(model_name, stub)
+    reset_metrics()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    report = asyncio.run(replay(sessions, args.repeat, args.concurrency))
+    if args.tracemalloc:
+        report["tracemalloc_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    report["settings"] = {
+        "sessions": len(sessions),
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "repeat": args.repeat,
+        "concurrency": args.concurrency,
+    }
+    report["llm_calls"] = {"total": stub.calls, "exact_recorded": stub.exact_hits}
+    report["spans"] = latency_metrics()
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(os.path.join(REPO_ROOT, args.json) if not os.path.isabs(args.json) else args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
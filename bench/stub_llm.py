@@ -0,0 +1,144 @@
+"""Deterministic local chat model that replays recorded LLM responses.
+
+Responses come from the debug logs (the legacy per-call ``api_call_*.txt``
+files and the ``debug.jsonl`` sink). A prompt seen in the logs gets exactly
+its recorded answer; any other prompt gets the recorded answers of the same
+node in round-robin order, or a minimal valid default when the node has no
+recording. An optional synthetic latency stands in for generation time.
+"""
+
+import asyncio
+import glob
+import hashlib
+import itertools
+import json
+import os
+import random
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.messages import AIMessage
+
+# Debug-log node names -> model_policy node names
+_LOGGED_NODES = {
+    "executor_subtask_conversion": "subtask_converter",
+}
+
+# Phrases of each node's prompt (see prompts.py and executor.py)
+_PROMPT_MARKERS = [
+    ("subtask_converter", "Analyze the subtask"),
+    ("history_summarizer", "AI summarizer"),
+    ("planner", "AI Strategist"),
+    ("responder", "interior design consultant"),
+    ("responder", "professional AI consultant"),
+]
+
+DEFAULT_RESPONSES = {
+    "history_summarizer": '{"events_summary": [], "budget": null, "area_map": []}',
+    "planner": '{"plan": [], "response_reason": "Trả lời trực tiếp người dùng."}',
+    "subtask_converter": '{"name": "get_categories_new", "args": {}}',
+    "responder": "Cảm ơn anh/chị, DBplus xin gửi thông tin như trên.",
+}
+
+
+def _normalize(prompt: Any) -> str:
+    if isinstance(prompt, (list, tuple)):
+        prompt = "\n".join(str(getattr(message, "content", message)) for message in prompt)
+    return re.sub(r"\s+", " ", str(prompt)).strip()
+
+
+def prompt_hash(prompt: Any) -> str:
+    return hashlib.sha256(_normalize(prompt).encode("utf-8")).hexdigest()
+
+
+def classify_prompt(prompt: Any) -> str:
+    """Guess which graph node sent a prompt."""
+    text = _normalize(prompt)
+    for node_name, marker in _PROMPT_MARKERS:
+        if marker in text:
+            return node_name
+    return "responder"
+
+
+def _parse_legacy_log(path: str) -> Optional[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    node = re.search(r"^Node: (.+)$", text, re.M)
+    prompt = re.search(r"=== PROMPT SENT TO API ===\n(.*?)\n\n=== RESPONSE FROM API ===\n", text, re.S)
+    response = re.search(r"=== RESPONSE FROM API ===\n(.*?)\n\n=== (?:ADDITIONAL INFO|END DEBUG LOG) ===", text, re.S)
+    if not (node and prompt and response):
+        return None
+    return {"node": node.group(1).strip(), "prompt": prompt.group(1), "response": response.group(1)}
+
+
+def iter_recorded_calls(log_dir: str = "debug_logs") -> Iterator[Dict[str, str]]:
+    """Yield {"node", "prompt", "response"} for every recorded LLM call, oldest first."""
+    for path in sorted(glob.glob(os.path.join(log_dir, "api_call_*.txt"))):
+        record = _parse_legacy_log(path)
+        if record:
+            yield record
+    for path in sorted(glob.glob(os.path.join(log_dir, "debug*.jsonl"))):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("kind") == "api_call" and "prompt" in record and "response" in record:
+                    yield {"node": record["node"], "prompt": record["prompt"], "response": record["response"]}
+
+
+class StubChatModel:
+    """Chat model stand-in answering ``ainvoke`` from recorded responses.
+
+    Args:
+        recordings: Recorded calls as yielded by iter_recorded_calls
+        latency_ms: Synthetic generation time per call
+        jitter_ms: Uniform random extra latency (seeded, so runs are repeatable)
+        seed: Seed of the jitter generator
+    """
+
+    def __init__(
+        self,
+        recordings: Optional[List[Dict[str, str]]] = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        seed: int = 0
+    ):
+        self.model = "stub"
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.calls = 0
+        self.exact_hits = 0
+        self._random = random.Random(seed)
+        self._by_prompt: Dict[str, str] = {}
+        by_node: Dict[str, List[str]] = {}
+        for record in recordings or []:
+            node_name = _LOGGED_NODES.get(record["node"], record["node"])
+            self._by_prompt[prompt_hash(record["prompt"])] = record["response"]
+            by_node.setdefault(node_name, []).append(record["response"])
+        self._cycles = {node_name: itertools.cycle(responses) for node_name, responses in by_node.items()}
+
+    def respond(self, prompt: Any) -> str:
+        """Pick the response for a prompt (no latency)."""
+        self.calls += 1
+        recorded = self._by_prompt.get(prompt_hash(prompt))
+        if recorded is not None:
+            self.exact_hits += 1
+            return recorded
+        node_name = classify_prompt(prompt)
+        cycle = self._cycles.get(node_name)
+        return next(cycle) if cycle is not None else DEFAULT_RESPONSES[node_name]
+
+    async def ainvoke(self, prompt: Any, *args, **kwargs) -> AIMessage:
+        content = self.respond(prompt)
+        delay = self.latency_ms + (self._random.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        prompt_tokens = len(_normalize(prompt)) // 4
+        response_tokens = len(content) // 4
+        return AIMessage(content=content, usage_metadata={
+            "input_tokens": prompt_tokens,
+            "output_tokens": response_tokens,
+            "total_tokens": prompt_tokens + response_tokens,
+        })
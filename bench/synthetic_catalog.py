@@ -0,0 +1,84 @@
+"""Synthetic price catalogs with the DatabaseNoiThat.json shape.
+
+``generate_catalog(n)`` builds a nested tree of exactly ``n`` variants:
+category > material type > subtype > variant, with about one subtype in ten
+holding an extra grouping level (5-level paths, as in the real file). Every
+variant has a 'Vật tư' price and most also carry 'Nhân công'. Names reuse the
+real catalog's vocabulary so text search behaves realistically. Output is
+deterministic for a given seed.
+"""
+
+import math
+import random
+from typing import Any, Dict
+
+CATEGORIES = ["Sàn", "Tường và vách", "Trần", "Cầu thang", "Cửa", "Nội thất", "Ốp lát", "Chiếu sáng"]
+MATERIALS = ["Gỗ", "Đá", "Gạch", "Sơn", "Kính", "Thạch cao", "Nhôm", "Giấy dán tường", "Inox", "Nhựa"]
+GRADES = ["cao cấp", "trung cấp", "thấp cấp", "tự nhiên", "công nghiệp", "engineer", "Marble", "Granite"]
+SIZES = ["600x1200mm", "800x800mm", "600x600mm", "300x600mm", "300x300mm", "dày 9mm", "dày 12mm", "khung 75/76"]
+
+VARIANTS_PER_SUBTYPE = 20
+
+
+def _price(rng: random.Random) -> Dict[str, Any]:
+    prices: Dict[str, Any] = {"Vật tư": rng.randrange(50, 5000) * 1000}
+    if rng.random() < 0.7:
+        prices["Nhân công"] = rng.randrange(20, 800) * 1000
+    return prices
+
+
+def generate_catalog(n_variants: int, seed: int = 0) -> Dict[str, Any]:
+    """
+    Build a synthetic catalog tree.
+
+    Args:
+        n_variants: Exact number of priced variants in the tree
+        seed: Random seed (prices and the deeper subtypes)
+
+    Returns:
+        The nested catalog dictionary
+    """
+    rng = random.Random(seed)
+    per_category = n_variants / len(CATEGORIES)
+    # Material types and subtypes fan out equally: T * S * VARIANTS_PER_SUBTYPE ≈ per_category
+    fan_out = max(1, math.ceil(math.sqrt(per_category / VARIANTS_PER_SUBTYPE)))
+
+    data: Dict[str, Any] = {}
+    remaining = n_variants
+    for c, category in enumerate(CATEGORIES):
+        category_node = data.setdefault(category, {})
+        for t in range(fan_out):
+            if remaining <= 0:
+                break
+            material = MATERIALS[(c + t) % len(MATERIALS)]
+            type_node = category_node.setdefault(f"{category} {material.lower()} {t}", {})
+            for s in range(fan_out):
+                if remaining <= 0:
+                    break
+                subtype_node = type_node.setdefault(f"{material} {GRADES[(t + s) % len(GRADES)]} {s}", {})
+                deeper = rng.random() < 0.1
+                for v in range(min(VARIANTS_PER_SUBTYPE, remaining)):
+                    name = f"{material} {SIZES[v % len(SIZES)]} mẫu {v}"
+                    if deeper:
+                        subtype_node.setdefault(f"Nhóm {v % 3}", {})[name] = _price(rng)
+                    else:
+                        subtype_node[name] = _price(rng)
+                    remaining -= 1
+        if remaining <= 0:
+            break
+
+    # Khi fan-out làm tròn xuống, dồn phần còn lại vào một subtype cuối
+    if remaining > 0:
+        tail = data[CATEGORIES[-1]].setdefault("Phụ kiện", {}).setdefault("Khác", {})
+        for v in range(remaining):
+            tail[f"Phụ kiện mẫu {v}"] = _price(rng)
+    return data
+
+
+def count_variants(node: Any) -> int:
+    """Number of priced variants in a tree (for checking generated sizes)."""
+    if isinstance(node, dict):
+        if "Vật tư" in node:
+            return 1
+        return sum(count_variants(value) for value in node.values())
+    return 0
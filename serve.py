@@ -1,22 +1,31 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, Form, Request
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, Form, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import uuid
+import hmac
 from pathlib import Path
 import json
-from typing import Any
+from typing import Any, List
+import asyncio
 import traceback
 
 from src.react_agent.graph import graph
 from langgraph.graph import END
 from src.react_agent.state import State
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage, SystemMessage
-from fastapi.responses import JSONResponse
-import shutil
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
-from src.react_agent.vision import get_gemini_vision_report
+from src.react_agent.vision import analyze_image
+from src.react_agent.batch_quotes import area_map_from_report, price_rooms
 from src.react_agent.prompts import VISION_PROMPT
-from src.react_agent.quote_parser import parse_image_report
+from src.react_agent.session_store import create_session_store, is_valid_session_id
+from src.react_agent.model_registry import model_registry
+from src.react_agent.model_policy import node_latency_stats
+from src.react_agent.tracing import latency_metrics, trace_request
+from src.react_agent.llm_cache import llm_cache
+from src.react_agent.vision_cache import vision_cache
+from src.react_agent.catalog import pinned_catalog
+from src.react_agent.catalog_manager import DEFAULT_WATCH, catalog_manager
 
 # --- JSON Serialization Helper ---
 def _cleanup_state_for_json(data: Any) -> Any:
@@ -70,14 +79,101 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def watch_catalog():
+    """Reload the price catalog in the background when its JSON file changes."""
+    if DEFAULT_WATCH:
+        catalog_manager.start()
+
+@app.on_event("shutdown")
+async def close_model_clients():
+    """Close the pooled connections to the Ollama server."""
+    catalog_manager.stop()
+    await model_registry.aclose()
+
+def _node_trace(node_name: str, current_state: Any) -> dict:
+    """Build the JSON frame sent to the client after a graph node finishes."""
+    # Recursively clean the entire state object before sending
+    try:
+        serializable_state = _cleanup_state_for_json(current_state)
+        
+        # Extra validation step to catch any serialization issues
+        try:
+            # Test if the cleaned state can be properly serialized
+            json.dumps(serializable_state)
+        except Exception as json_err:
+            print(f"ERROR: State still not JSON serializable after cleaning: {json_err}")
+            # Fall back to a simpler representation
+            serializable_state = {
+                "error": "State serialization failed",
+                "node": node_name,
+                "available_keys": list(current_state.keys())
+            }
+        
+        return {
+            "node": node_name,
+            "state": serializable_state
+        }
+    except Exception as clean_err:
+        print(f"ERROR during state cleaning: {clean_err}")
+        print(traceback.format_exc())
+        # Send a simplified error state
+        return {
+            "node": node_name,
+            "state": {"error": f"Failed to process state: {str(clean_err)}"}
+        }
+
+# Nodes whose LLM tokens are forwarded to the client in streaming mode
+STREAMED_NODES = {"responder"}
+
+async def _stream_graph_tokens(websocket: WebSocket, initial_state: State) -> None:
+    """
+    Run the graph in streaming mode over the websocket.
+    
+    Frames sent, in order:
+    - {"type": "token", "node": ..., "content": ...} for every responder token as it is generated
+    - {"type": "node", "node": ..., "state": ...} after each node finishes (same payload as non-streaming mode)
+    - {"type": "final", "state": ...} with the merged state of the whole run
+    """
+    final_state: dict = {}
+    async for mode, chunk in graph.astream(initial_state, stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            message_chunk, metadata = chunk
+            node_name = metadata.get("langgraph_node")
+            # Only generated chunks; the node's final AIMessage arrives with its state update
+            if (node_name in STREAMED_NODES and isinstance(message_chunk, AIMessageChunk)
+                    and message_chunk.content):
+                await websocket.send_json({
+                    "type": "token",
+                    "node": node_name,
+                    "content": message_chunk.content
+                })
+            continue
+        
+        for node_name, node_state in chunk.items():
+            if node_name == END or not isinstance(node_state, dict):
+                continue
+            final_state.update(node_state)
+            await websocket.send_json({"type": "node", **_node_trace(node_name, node_state)})
+    
+    await websocket.send_json({"type": "final", **_node_trace("final", final_state)})
+
 # --- WebSocket Endpoint ---
 @app.websocket("/ws/invoke")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    # Một kết nối là một phiên nếu client không gửi session_id
+    connection_session_id = str(uuid.uuid4())
     try:
         while True:
             data = await websocket.receive_json()
             
+            # session_id từ client được dùng làm tên file bộ nhớ nên phải kiểm tra trước
+            session_id = data.get("session_id") or connection_session_id
+            if not is_valid_session_id(session_id):
+                await websocket.send_json({"type": "error", "error": "Invalid session_id"})
+                continue
+            
             # Reconstruct the message history from the client
             message_history: list[BaseMessage] = [
                 HumanMessage(content=msg["text"]) if msg["sender"] == "user" 
@@ -91,47 +187,25 @@ async def websocket_endpoint(websocket: WebSocket):
 
             initial_state: State = {
                 "messages": message_history,
+                "session_id": session_id,
             }
             
-            # Use astream() to get the full state after each node runs.
-            async for step in graph.astream(initial_state):
-                node_name = list(step.keys())[0]
-                
-                if node_name == END:
+            # Cả lượt dùng một snapshot bảng giá, kể cả khi catalog được reload giữa chừng
+            with pinned_catalog() as catalog, trace_request(
+                "ws", session_id=initial_state["session_id"], catalog_version=catalog.version
+            ):
+                if data.get("stream"):
+                    await _stream_graph_tokens(websocket, initial_state)
                     continue
-                    
-                current_state = step[node_name]
                 
-                # Recursively clean the entire state object before sending
-                try:
-                    serializable_state = _cleanup_state_for_json(current_state)
+                # Use astream() to get the full state after each node runs.
+                async for step in graph.astream(initial_state):
+                    node_name = list(step.keys())[0]
                     
-                    # Extra validation step to catch any serialization issues
-                    try:
-                        # Test if the cleaned state can be properly serialized
-                        json.dumps(serializable_state)
-                    except Exception as json_err:
-                        print(f"ERROR: State still not JSON serializable after cleaning: {json_err}")
-                        # Fall back to a simpler representation
-                        serializable_state = {
-                            "error": "State serialization failed",
-                            "node": node_name,
-                            "available_keys": list(current_state.keys())
-                        }
-                    
-                    trace_data = {
-                        "node": node_name,
-                        "state": serializable_state
-                    }
-                    await websocket.send_json(trace_data)
-                except Exception as clean_err:
-                    print(f"ERROR during state cleaning: {clean_err}")
-                    print(traceback.format_exc())
-                    # Send a simplified error state
-                    await websocket.send_json({
-                        "node": node_name,
-                        "state": {"error": f"Failed to process state: {str(clean_err)}"}
-                    })
+                    if node_name == END:
+                        continue
+                        
+                    await websocket.send_json(_node_trace(node_name, step[node_name]))
                     
     except WebSocketDisconnect:
         print(f"Client disconnected.")
@@ -150,30 +224,23 @@ def get_session_id(request: Request):
         session_id = str(uuid.uuid4())
     return session_id
 
+# Append-only session histories (backend chosen by the SESSION_STORE env var: jsonl | sqlite)
+session_store = create_session_store(directory=HISTORY_DIR)
+
 def load_history(session_id):
-    path = os.path.join(HISTORY_DIR, f"{session_id}.json")
-    if os.path.exists(path):
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return []
+    return session_store.load(session_id)
 
-def save_history(session_id, history):
-    path = os.path.join(HISTORY_DIR, f"{session_id}.json")
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(history, f, ensure_ascii=False, indent=2)
+def append_history(session_id, messages):
+    session_store.append(session_id, messages)
 
 @app.post("/api/upload")
 async def upload_image(file: UploadFile = File(None)):
     """Upload image and return image report only."""
-    temp_image_path = None
     try:
         if file:
-            temp_image_path = f"uploads/{uuid.uuid4()}_{file.filename}"
-            os.makedirs("uploads", exist_ok=True)
-            with open(temp_image_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            image_report = await get_gemini_vision_report(temp_image_path, prompt=VISION_PROMPT)
-            materials = parse_image_report(image_report)
+            # Ảnh được giải mã trực tiếp trong bộ nhớ, không ghi ra uploads/
+            image_bytes = await file.read()
+            image_report, materials = await analyze_image(image_bytes, prompt=VISION_PROMPT)
             return JSONResponse({
                 "image_report": image_report,
                 "materials": materials
@@ -182,90 +249,221 @@ async def upload_image(file: UploadFile = File(None)):
             return JSONResponse({"error": "No file provided"}, status_code=400)
     except Exception as e:
         return JSONResponse({"error": f"Image analysis failed: {e}"}, status_code=500)
-    finally:
-        if temp_image_path and os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
+
+# Số ảnh được phân tích đồng thời trong một batch
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+
+def _batch_field(values, index):
+    """Value of an optional per-file form list, or None."""
+    if values and index < len(values) and values[index]:
+        return values[index].strip()
+    return None
+
+@app.post("/api/upload/batch")
+async def upload_batch(
+    files: List[UploadFile] = File(...),
+    rooms: List[str] = Form(None),
+    room_sizes: List[str] = Form(None)
+):
+    """
+    Analyze many room photos concurrently and quote all rooms in one pass.
+    
+    `rooms` and `room_sizes` ("LxWxH") are optional lists aligned with `files`;
+    photos without a room name form a room of their own named after the file.
+    The response is NDJSON: one {"type": "image"} line per photo as soon as its
+    analysis finishes, then a final {"type": "quote"} line for all rooms.
+    """
+    images = [(index, file.filename, await file.read()) for index, file in enumerate(files)]
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    
+    async def analyze(index, filename, image_bytes):
+        async with semaphore:
+            try:
+                image_report, materials = await analyze_image(image_bytes, prompt=VISION_PROMPT)
+                return index, filename, image_report, materials, None
+            except Exception as e:
+                return index, filename, None, None, e
+    
+    async def stream():
+        analyzed = {}
+        for next_done in asyncio.as_completed([analyze(*image) for image in images]):
+            index, filename, image_report, materials, error = await next_done
+            room = _batch_field(rooms, index) or Path(filename or f"image_{index}").stem
+            line = {"type": "image", "index": index, "filename": filename, "room": room}
+            if error is not None:
+                line["error"] = f"Image analysis failed: {error}"
+            else:
+                area_map = area_map_from_report(image_report)
+                analyzed[index] = (room, area_map)
+                line.update({
+                    "image_report": image_report,
+                    "materials": materials,
+                    "surfaces": area_map["surfaces"]
+                })
+            yield json.dumps(_cleanup_state_for_json(line), ensure_ascii=False) + "\n"
+        
+        # Gộp theo phòng theo thứ tự file để kết quả không phụ thuộc thứ tự hoàn thành
+        room_inputs = {}
+        for index in sorted(analyzed):
+            room, area_map = analyzed[index]
+            room_input = room_inputs.setdefault(room, {"area_maps": [], "room_size": None})
+            room_input["area_maps"].append(area_map)
+            room_input["room_size"] = room_input["room_size"] or _batch_field(room_sizes, index)
+        try:
+            with pinned_catalog():
+                quote = price_rooms(room_inputs)
+            line = {"type": "quote", **quote}
+        except Exception as e:
+            line = {"type": "quote", "error": f"Quote calculation failed: {e}"}
+        yield json.dumps(_cleanup_state_for_json(line), ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 @app.post("/api/chat")
 async def chat_api(request: Request, message: str = Form(None), file: UploadFile = File(None)):
     session_id = get_session_id(request)
+    if not is_valid_session_id(session_id):
+        return JSONResponse({"error": "Invalid X-Session-Id header"}, status_code=400)
     history = load_history(session_id)
     image_report = None
-    temp_image_path = None
     materials = None
     try:
-        if file:
-            temp_image_path = f"uploads/{uuid.uuid4()}_{file.filename}"
-            os.makedirs("uploads", exist_ok=True)
-            with open(temp_image_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            image_report = await get_gemini_vision_report(temp_image_path, prompt=VISION_PROMPT)
-            materials = parse_image_report(image_report)
-            # Không thêm image report vào history - sẽ được xử lý trong graph
+        with pinned_catalog() as catalog, trace_request(
+            "chat", session_id=session_id, catalog_version=catalog.version
+        ) as trace:
+            if file:
+                image_bytes = await file.read()
+                image_report, materials = await analyze_image(image_bytes, prompt=VISION_PROMPT)
+                # Không thêm image report vào history - sẽ được xử lý trong graph
         
-        if message:
-            history.append({
-                'type': 'human',
-                'content': message
-            })
-        save_history(session_id, history)
+            if message:
+                new_message = {
+                    'type': 'human',
+                    'content': message
+                }
+                append_history(session_id, [new_message])
+                history.append(new_message)
         
-        # Truyền đầy đủ history vào graph
-        messages_for_graph = []
-        for msg in history:
-            if msg['type'] == 'human':
-                messages_for_graph.append(HumanMessage(content=msg['content']))
-            elif msg['type'] == 'ai':
-                messages_for_graph.append(AIMessage(content=msg['content']))
-            elif msg['type'] == 'system':
-                messages_for_graph.append(SystemMessage(content=msg['content']))
+            # Truyền đầy đủ history vào graph
+            messages_for_graph = []
+            for msg in history:
+                if msg['type'] == 'human':
+                    messages_for_graph.append(HumanMessage(content=msg['content']))
+                elif msg['type'] == 'ai':
+                    messages_for_graph.append(AIMessage(content=msg['content']))
+                elif msg['type'] == 'system':
+                    messages_for_graph.append(SystemMessage(content=msg['content']))
         
-        # Nếu có image report, thêm vào messages_for_graph
-        if image_report:
-            messages_for_graph.append(SystemMessage(content=f"[Image Analysis Report]:\n{image_report}"))
+            # Nếu có image report, thêm vào messages_for_graph
+            if image_report:
+                messages_for_graph.append(SystemMessage(content=f"[Image Analysis Report]:\n{image_report}"))
         
-        initial_state = {"messages": messages_for_graph}
-        if message or image_report:
-            final_state = None
-            async for output in graph.astream(initial_state):
-                final_state = output
-                print(f"DEBUG: Processing output: {list(output.keys())}")
-                for node_name, node_state in output.items():
-                    if node_name != END:
-                        print(f"DEBUG: Node {node_name} state keys: {list(node_state.keys())}")
+            initial_state = {"messages": messages_for_graph, "session_id": session_id}
+            if message or image_report:
+                final_state = None
+                async for output in graph.astream(initial_state):
+                    final_state = output
+                    print(f"DEBUG: Processing output: {list(output.keys())}")
+                    for node_name, node_state in output.items():
+                        if node_name != END:
+                            print(f"DEBUG: Node {node_name} state keys: {list(node_state.keys())}")
             
-            # Tìm AI message từ final state
-            ai_message = None
-            if final_state:
-                for node_name, node_state in final_state.items():
-                    if node_name != END and 'messages' in node_state:
-                        messages = node_state['messages']
-                        ai_messages = [msg for msg in messages if hasattr(msg, 'type') and msg.type == 'ai']
-                        if ai_messages:
-                            ai_message = ai_messages[-1].content
-                            print(f"DEBUG: Found AI message in {node_name}: {ai_message[:100]}...")
-                            break
+                # Tìm AI message từ final state
+                ai_message = None
+                if final_state:
+                    for node_name, node_state in final_state.items():
+                        if node_name != END and 'messages' in node_state:
+                            messages = node_state['messages']
+                            ai_messages = [msg for msg in messages if hasattr(msg, 'type') and msg.type == 'ai']
+                            if ai_messages:
+                                ai_message = ai_messages[-1].content
+                                print(f"DEBUG: Found AI message in {node_name}: {ai_message[:100]}...")
+                                break
             
-            if not ai_message:
-                print("DEBUG: No AI message found in any node")
+                if not ai_message:
+                    print("DEBUG: No AI message found in any node")
             
-            return JSONResponse({
-                "image_report": image_report,
-                "materials": materials,
-                "ai_message": ai_message,
-                "session_id": session_id
-            })
-        else:
-            return JSONResponse({
-                "image_report": image_report,
-                "materials": materials,
-                "session_id": session_id
-            })
+                return JSONResponse({
+                    "image_report": image_report,
+                    "materials": materials,
+                    "ai_message": ai_message,
+                    "session_id": session_id,
+                    "trace_id": trace.trace_id,
+                    "catalog_version": catalog.version
+                })
+            else:
+                return JSONResponse({
+                    "image_report": image_report,
+                    "materials": materials,
+                    "session_id": session_id,
+                    "trace_id": trace.trace_id,
+                    "catalog_version": catalog.version
+                })
     except Exception as e:
         return JSONResponse({"error": f"Image analysis failed: {e}"}, status_code=500)
-    finally:
-        if temp_image_path and os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
+
+@app.get("/api/metrics")
+async def metrics_api():
+    """Latency percentiles per span, per-node model stats and cache hit rates."""
+    return JSONResponse({
+        "spans": latency_metrics(),
+        "nodes": node_latency_stats(),
+        "llm_cache": llm_cache.stats() if llm_cache is not None else None,
+        "vision_cache": vision_cache.stats(),
+        "catalog": catalog_manager.stats(),
+    })
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def _admin_denied(token):
+    """403 response unless ADMIN_TOKEN is set and the request carries it (denied by default)."""
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "Admin endpoints are disabled (ADMIN_TOKEN not set)"}, status_code=403)
+    if not token or not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    return None
+
+@app.get("/api/admin/catalog")
+async def catalog_status(x_admin_token: str = Header(None)):
+    """Current catalog version and reload history."""
+    return _admin_denied(x_admin_token) or JSONResponse(catalog_manager.stats())
+
+@app.post("/api/admin/catalog/reload")
+async def reload_catalog(x_admin_token: str = Header(None)):
+    """Rebuild the catalog from its JSON file now; requests in flight keep their snapshot."""
+    denied = _admin_denied(x_admin_token)
+    if denied:
+        return denied
+    # Rebuild chạy trong thread để không chặn event loop
+    reloaded = await asyncio.to_thread(catalog_manager.reload, True)
+    return JSONResponse({"reloaded": reloaded, **catalog_manager.stats()})
+
+@app.post("/api/admin/catalog/price")
+async def update_catalog_price(request: Request, x_admin_token: str = Header(None)):
+    """Change one variant's price: {"path": [...], "material_cost"?, "labor_cost"?, "remove_labor"?}."""
+    denied = _admin_denied(x_admin_token)
+    if denied:
+        return denied
+    try:
+        body = await request.json()
+        path = body["path"]
+        if not isinstance(path, list) or not all(isinstance(segment, str) for segment in path):
+            raise ValueError("path must be a list of strings")
+        material_cost = body.get("material_cost")
+        labor_cost = body.get("labor_cost")
+        for price in (material_cost, labor_cost):
+            if price is not None and (not isinstance(price, (int, float)) or isinstance(price, bool) or price < 0):
+                raise ValueError("prices must be non-negative numbers")
+        remove_labor = bool(body.get("remove_labor", False))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return JSONResponse({"error": f"Invalid request: {e}"}, status_code=400)
+    try:
+        catalog = await asyncio.to_thread(
+            catalog_manager.update_price, path, material_cost, labor_cost, remove_labor
+        )
+    except KeyError:
+        return JSONResponse({"error": f"Unknown variant: {' > '.join(path)}"}, status_code=404)
+    return JSONResponse({"variant": catalog.variant(catalog.index_of(path)), **catalog_manager.stats()})
 
 # --- Main Entry Point ---
 if __name__ == "__main__":
@@ -8,8 +8,11 @@ import os
 from datetime import datetime
 
 from ..new_tools import execute_tool, TOOLS
-from .planner import MODELS
+from ..llm_cache import semantic_text
+from ..model_policy import invoke_for_node
+from .tool_router import route_subtask
 from ..debug_utils import log_api_call
+from ..tracing import span
 
 def _log_debug_info(subtask: str, tools_description: str, tool_results: List[Any], step_id: str):
     """Log debug information to file for troubleshooting."""
@@ -146,9 +149,47 @@ def _extract_budget_from_step(subtask: str) -> Optional[float]:
     
     return None
 
+def _parse_tool_call_json(raw_response_text: str) -> Dict[str, Any]:
+    """Extract the tool-call JSON object from the converter output (raises json.JSONDecodeError)."""
+    clean_response = raw_response_text
+    # Look for JSON in code blocks first
+    json_block = re.search(r"```json\s*(\{[\s\S]*?\})\s*```", clean_response)
+    if json_block:
+        clean_response = json_block.group(1)
+    else:
+        # Look for JSON after </system> or similar markers
+        markers = ["</system>", "</think>", "Output:", "Result:"]
+        for marker in markers:
+            if marker in clean_response:
+                start = clean_response.find(marker) + len(marker)
+                clean_response = clean_response[start:].strip()
+                break
+    
+    # Try to find the first complete JSON object
+    brace_count = 0
+    start_idx = clean_response.find('{')
+    if start_idx != -1:
+        for i in range(start_idx, len(clean_response)):
+            if clean_response[i] == '{':
+                brace_count += 1
+            elif clean_response[i] == '}':
+                brace_count -= 1
+                if brace_count == 0:
+                    clean_response = clean_response[start_idx:i+1]
+                    break
+    
+    return json.loads(clean_response)
+
+
 async def _convert_subtask_to_tool_call(subtask: str, previous_results: List[Any], context: Dict[str, Any]) -> Dict[str, Any]:
     """Converts a natural language subtask to a tool call with improved logic."""
     
+    # Fast path: planner subtasks in a known shape are routed without an LLM round-trip
+    routed = route_subtask(subtask)
+    if routed is not None:
+        print(f"Fast-path tool call for subtask: {routed}")
+        return routed
+    
     # Create detailed tools description
     tools_description = []
     for name, tool in TOOLS.items():
@@ -337,8 +378,14 @@ Output:
 Analyze the subtask and return the appropriate JSON tool call:
 </system>"""
     
-    llm = MODELS["LLM_PLANNER"]
-    response = await llm.ainvoke(prompt)
+    response, response_dict = await invoke_for_node(
+        "subtask_converter", prompt, parse=_parse_tool_call_json,
+        semantic_text=semantic_text(
+            subtask,
+            json.dumps(context, ensure_ascii=False) if context else None,
+            json.dumps(previous_results[-3:], ensure_ascii=False, default=str) if previous_results else None
+        )
+    )
     raw_response_text = response.content
     print(f"LLM Raw Response for Subtask Conversion: {raw_response_text}")
     
@@ -356,34 +403,9 @@ Analyze the subtask and return the appropriate JSON tool call:
     
     # Parse the response
     try:
-        clean_response = raw_response_text
-        # Look for JSON in code blocks first
-        json_block = re.search(r"```json\s*(\{[\s\S]*?\})\s*```", clean_response)
-        if json_block:
-            clean_response = json_block.group(1)
-        else:
-            # Look for JSON after </system> or similar markers
-            markers = ["</system>", "</think>", "Output:", "Result:"]
-            for marker in markers:
-                if marker in clean_response:
-                    start = clean_response.find(marker) + len(marker)
-                    clean_response = clean_response[start:].strip()
-                    break
-        
-        # Try to find the first complete JSON object
-        brace_count = 0
-        start_idx = clean_response.find('{')
-        if start_idx != -1:
-            for i in range(start_idx, len(clean_response)):
-                if clean_response[i] == '{':
-                    brace_count += 1
-                elif clean_response[i] == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        clean_response = clean_response[start_idx:i+1]
-                        break
-        
-        response_dict = json.loads(clean_response)
+        if response_dict is None:
+            # Even the escalated answer did not parse; re-parse to report the error
+            response_dict = _parse_tool_call_json(raw_response_text)
         
         # Enhanced post-processing for specific tools
         if response_dict.get("name") == "propose_options_for_budget":
@@ -455,7 +477,8 @@ async def _execute_single_step(subtask: str, step_id: str, context: Dict[str, An
         
         # Execute the tool
         if tool_name in TOOLS:
-            result = await execute_tool(tool_name, tool_args)
+            with span(f"tool.{tool_name}", step_id=step_id):
+                result = await execute_tool(tool_name, tool_args)
             
             # Store result in context for future steps
             context[f"step_{step_id}"] = result
@@ -1,5 +1,6 @@
 """Planner agent for the AI interior design quotation system."""
 
+import asyncio
 import json
 import re
 from typing import Dict, Any, List, Optional
@@ -7,16 +8,19 @@ from typing import Dict, Any, List, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage, SystemMessage
 
-from ..prompts import STRATEGIST_PROMPT, SUMMARIZER_PROMPT
-from ..utils import load_chat_model
+from ..prompts import STRATEGIST_PROMPT, SUMMARIZER_PROMPT, INCREMENTAL_HISTORY_TEMPLATE
 from ..configuration import Configuration
 from ..new_tools import TOOLS  # removed _parse_image_report_to_area_map
 from ..debug_utils import log_api_call
+from ..catalog import get_catalog
+from ..memory import summary_memory
+from ..model_registry import get_chat_model
+from ..llm_cache import semantic_text
+from ..model_policy import invoke_for_node
 
-# Load models once at the module level
-config = Configuration.from_context()
+# Kept for the legacy executors; nodes pick their model per run (see model_policy)
 MODELS = {
-    "LLM_PLANNER": load_chat_model(config.model),  # Main powerful model for planning
+    "LLM_PLANNER": get_chat_model(Configuration().model),
 }
 
 
@@ -28,9 +32,113 @@ def _format_history(messages: list) -> str:
     return "\n".join([f"{msg.type}: {msg.content}" for msg in messages])
 
 
+# Words in a new turn that may change area_map, budget or events_summary
+_SUMMARY_KEYWORDS = (
+    "ngân sách", "budget", "triệu", "tỷ", "nghìn", "báo giá", "quote",
+    "phòng", "room", "diện tích", "kích thước", "dài", "rộng", "cao", "m2", "m²",
+    "đổi", "thay", "thêm", "bỏ", "xóa", "vật liệu", "material",
+    "sàn", "tường", "trần", "cầu thang", "gỗ", "đá", "gạch", "sơn", "kính",
+    "floor", "wall", "ceiling", "stair",
+)
+
+
+def _message_digests(messages: list) -> List[str]:
+    return [summary_memory.message_digest(msg.type, msg.content) for msg in messages]
+
+
+def _needs_summary_update(new_messages: list) -> bool:
+    """Check whether new messages can change the summary, so chitchat turns skip the LLM."""
+    catalog = get_catalog()
+    catalog_names = set()
+    for category in catalog.children():
+        catalog_names.add(category.casefold())
+        catalog_names.update(name.casefold() for name in catalog.children([category]))
+
+    for msg in new_messages:
+        # AI replies only echo earlier information; image reports always matter
+        if msg.type == "ai":
+            continue
+        if msg.type == "system":
+            return True
+        text = str(msg.content).casefold()
+        if any(ch.isdigit() for ch in text):
+            return True
+        if any(keyword in text for keyword in _SUMMARY_KEYWORDS):
+            return True
+        if any(name in text for name in catalog_names):
+            return True
+    return False
+
+
+def _parse_summary(summary: str) -> Optional[Dict[str, Any]]:
+    """Parse the summarizer's JSON answer into state fields, or None if it has no valid JSON."""
+    try:
+        # Find JSON in the response
+        start_idx = summary.find('{')
+        end_idx = summary.rfind('}') + 1
+        if start_idx == -1 or end_idx == 0:
+            print("Warning: Could not parse JSON from history summary")
+            return None
+        parsed_summary = json.loads(summary[start_idx:end_idx])
+    except json.JSONDecodeError as e:
+        print(f"Error parsing history summary JSON: {e}")
+        return None
+
+    # Convert area_map list to dict for easier access
+    area_map_dict = {}
+    for item in parsed_summary.get("area_map", []) or []:
+        position = item.get("position", "")
+        area_map_dict[position] = item
+
+    return {
+        "history_summary": summary,
+        "area_map": area_map_dict,
+        "budget": parsed_summary.get("budget"),
+        "events_summary": parsed_summary.get("events_summary", [])
+    }
+
+
+def _format_previous_summary(record: Dict[str, Any]) -> str:
+    """Render a stored summary as the JSON shape the summarizer itself returns."""
+    return json.dumps({
+        "events_summary": record.get("events_summary") or [],
+        "budget": record.get("budget"),
+        "area_map": list((record.get("area_map") or {}).values())
+    }, ensure_ascii=False, indent=2)
+
+
+def _summary_state(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "history_summary": record.get("history_summary"),
+        "area_map": record.get("area_map") or {},
+        "budget": record.get("budget"),
+        "events_summary": record.get("events_summary") or []
+    }
+
+
+def _load_session_summary(state: Dict[str, Any], digests: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """Load the session's stored summary if it covers the start of this conversation."""
+    session_id = state.get("session_id")
+    messages = state.get("messages") or []
+    if not session_id or not messages:
+        return None
+    record = summary_memory.get_summary(session_id)
+    if not record:
+        return None
+    first_digest = digests[0] if digests else _message_digests(messages[:1])[0]
+    if first_digest not in record.get("message_digests", []):
+        return None
+    return record
+
+
 async def history_summarizer_node(state: Dict[str, Any]) -> Dict[str, Any]:
     """Summarizes the chat history to simplify context for the planner.
 
+    When the state carries a session_id, the summary is incremental: the last
+    summary and the digests of the messages it covers are stored per session,
+    only messages added since then are sent to the LLM, and turns without any
+    area, budget or material content reuse the stored summary without a call.
+
     NOTE: Image report is intentionally ignored per requirement.
     """
     print("---NODE: History Summarizer---")
@@ -38,51 +146,36 @@ async def history_summarizer_node(state: Dict[str, Any]) -> Dict[str, Any]:
     if len(messages) <= 1:
         return {"history_summary": "Không có lịch sử.", "area_map": {}}
 
-    chat_history_str = _format_history(messages)
+    session_id = state.get("session_id")
+    digests = _message_digests(messages)
+    record = _load_session_summary(state, digests)
+
+    if record:
+        summarized = set(record.get("message_digests", []))
+        new_messages = [msg for msg, digest in zip(messages, digests) if digest not in summarized]
+
+        if not _needs_summary_update(new_messages):
+            print(f"Reusing stored history summary ({len(new_messages)} new messages without summary content)")
+            summary_memory.save_summary(session_id, record, sorted(summarized.union(digests)))
+            return _summary_state(record)
+
+        chat_history_str = INCREMENTAL_HISTORY_TEMPLATE.format(
+            previous_summary=_format_previous_summary(record),
+            new_messages=_format_history(new_messages)
+        )
+    else:
+        new_messages = messages
+        chat_history_str = _format_history(messages)
 
     # ❌ Removed: Any extraction/augmentation from image report
     # We do NOT append image-derived materials info to the summary.
 
     prompt = SUMMARIZER_PROMPT.format(chat_history=chat_history_str)
-    llm = MODELS["LLM_PLANNER"]
-    response = await llm.ainvoke(prompt)
+    response, _ = await invoke_for_node("history_summarizer", prompt, semantic_text=semantic_text(chat_history_str))
 
     summary = response.content
     print(f"Generated History Summary: {summary}")
     
-    # Parse the summary to extract area_map and other info
-    try:
-        # Find JSON in the response
-        start_idx = summary.find('{')
-        end_idx = summary.rfind('}') + 1
-        if start_idx != -1 and end_idx != 0:
-            json_str = summary[start_idx:end_idx]
-            parsed_summary = json.loads(json_str)
-            
-            # Extract components
-            events_summary = parsed_summary.get("events_summary", [])
-            budget = parsed_summary.get("budget")
-            area_map = parsed_summary.get("area_map", [])
-            
-            # Convert area_map list to dict for easier access
-            area_map_dict = {}
-            for item in area_map:
-                position = item.get("position", "")
-                area_map_dict[position] = item
-            
-            return {
-                "history_summary": summary,
-                "area_map": area_map_dict,
-                "budget": budget,
-                "events_summary": events_summary
-            }
-        else:
-            print("Warning: Could not parse JSON from history summary")
-            return {"history_summary": summary, "area_map": {}}
-    except json.JSONDecodeError as e:
-        print(f"Error parsing history summary JSON: {e}")
-        return {"history_summary": summary, "area_map": {}}
-    
     # Log API call
     log_api_call(
         node_name="history_summarizer",
@@ -90,10 +183,60 @@ async def history_summarizer_node(state: Dict[str, Any]) -> Dict[str, Any]:
         response=response.content,
         additional_info={
             "chat_history_length": len(chat_history_str),
-            "messages_count": len(messages)
+            "messages_count": len(messages),
+            "new_messages_count": len(new_messages),
+            "incremental": record is not None
         }
     )
 
+    parsed = _parse_summary(summary)
+    if parsed is None:
+        # Keep the last good summary; the unsummarized messages are retried next turn
+        if record:
+            return _summary_state(record)
+        return {"history_summary": summary, "area_map": {}}
+
+    if session_id:
+        covered = set(record.get("message_digests", [])) if record else set()
+        summary_memory.save_summary(session_id, parsed, sorted(covered.union(digests)))
+    return parsed
+
+def _extract_plan_json(raw_response_text: str) -> Optional[Dict[str, Any]]:
+    """Return the LAST valid top-level JSON object in the planner output, or None."""
+    valid_json_strings: List[str] = []
+    start_index = 0
+    while start_index < len(raw_response_text):
+        first_brace = raw_response_text.find('{', start_index)
+        if first_brace == -1:
+            break
+
+        brace_level = 1
+        for i in range(first_brace + 1, len(raw_response_text)):
+            char = raw_response_text[i]
+            if char == '{':
+                brace_level += 1
+            elif char == '}':
+                brace_level -= 1
+                if brace_level == 0:
+                    potential_json = raw_response_text[first_brace:i + 1]
+                    try:
+                        json.loads(potential_json)
+                        valid_json_strings.append(potential_json)
+                    except json.JSONDecodeError:
+                        pass
+                    start_index = i + 1
+                    break
+        else:
+            break
+
+    if not valid_json_strings:
+        return None
+    json_str = valid_json_strings[-1]
+    print(f"--- DEBUG: Taking the LAST valid JSON found ---\n{json_str}\n-------------------------------------------------")
+    parsed_json = json.loads(json_str)
+    return parsed_json if isinstance(parsed_json, dict) else None
+
+
 async def planner_node(state: Dict[str, Any]) -> Dict[str, Any]:
     """The planner node that decides the course of action and creates a plan.
 
@@ -137,8 +280,10 @@ async def planner_node(state: Dict[str, Any]) -> Dict[str, Any]:
         if budget:
             prompt += f"\n\nBudget: {budget:,} VND"
 
-    llm = MODELS["LLM_PLANNER"]
-    response = await llm.ainvoke(prompt)
+    response, parsed_json = await invoke_for_node(
+        "planner", prompt, parse=_extract_plan_json,
+        semantic_text=semantic_text(user_input, history_summary, area_map, budget)
+    )
     raw_response_text = response.content
     print(f"LLM Raw Response for Planner: {raw_response_text}")
     
@@ -154,48 +299,59 @@ async def planner_node(state: Dict[str, Any]) -> Dict[str, Any]:
         }
     )
 
-    try:
-        valid_json_strings: List[str] = []
-        start_index = 0
-        while start_index < len(raw_response_text):
-            first_brace = raw_response_text.find('{', start_index)
-            if first_brace == -1:
-                break
+    if parsed_json is None:
+        print("Error: No valid JSON object found in the planner response. Defaulting to no plan.")
+        return {"plan": [], "response_reason": "Không thể parse được response từ Planner."}
 
-            brace_level = 1
-            for i in range(first_brace + 1, len(raw_response_text)):
-                char = raw_response_text[i]
-                if char == '{':
-                    brace_level += 1
-                elif char == '}':
-                    brace_level -= 1
-                    if brace_level == 0:
-                        potential_json = raw_response_text[first_brace:i + 1]
-                        try:
-                            json.loads(potential_json)
-                            valid_json_strings.append(potential_json)
-                        except json.JSONDecodeError:
-                            pass
-                        start_index = i + 1
-                        break
-            else:
-                break
+    plan = parsed_json.get("plan", [])
+    response_reason = parsed_json.get("response_reason", "")
 
-        if valid_json_strings:
-            json_str = valid_json_strings[-1]
-            print(f"--- DEBUG: Taking the LAST valid JSON found ---\n{json_str}\n-------------------------------------------------")
-            parsed_json = json.loads(json_str)
-            plan = parsed_json.get("plan", [])
-            response_reason = parsed_json.get("response_reason", "")
-
-            if plan:
-                return {"plan": plan}
-            else:
-                return {"plan": [], "response_reason": response_reason}
-        else:
-            print("Error: No valid JSON object found in the planner response. Defaulting to no plan.")
-            return {"plan": [], "response_reason": "Không thể parse được response từ Planner."}
+    if plan:
+        return {"plan": plan}
+    else:
+        return {"plan": [], "response_reason": response_reason}
+
+
+def _same_planning_inputs(cached: Dict[str, Any], fresh: Dict[str, Any]) -> bool:
+    """Check whether the fresh summary leaves the planner's area_map and budget unchanged."""
+    def _budget(value: Any) -> Optional[float]:
+        try:
+            return float(value) if value is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    return (
+        (cached.get("area_map") or {}) == (fresh.get("area_map") or {})
+        and _budget(cached.get("budget")) == _budget(fresh.get("budget"))
+    )
+
+
+async def speculative_planner_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs the history summarizer and the planner concurrently.
+
+    The planner starts right away against the previous turn's stored summary.
+    Its plan is committed when the fresh summary has the same area_map and
+    budget; otherwise the planner runs again on the fresh summary. Without a
+    stored summary the two nodes run in sequence as usual.
+    """
+    print("---NODE: Speculative Summarizer + Planner---")
+    cached = _load_session_summary(state)
+    if cached is None:
+        summary_update = await history_summarizer_node(state)
+        plan_update = await planner_node({**state, **summary_update})
+        return {**summary_update, **plan_update}
+
+    cached_state = _summary_state(cached)
+    summary_update, speculative_plan = await asyncio.gather(
+        history_summarizer_node(state),
+        planner_node({**state, **cached_state})
+    )
+
+    if _same_planning_inputs(cached_state, summary_update):
+        print("Speculative plan committed: area_map and budget unchanged")
+        plan_update = speculative_plan
+    else:
+        print("Summary changed area_map/budget, re-planning with the fresh summary")
+        plan_update = await planner_node({**state, **summary_update})
 
-    except Exception as e:
-        print(f"An unexpected error occurred during JSON parsing: {e}")
-        return {"plan": [], "response_reason": f"Lỗi khi parse JSON: {e}"}
+    return {**summary_update, **plan_update}
@@ -6,15 +6,10 @@ from typing import Dict, Any, List
 from langchain_core.messages import AIMessage
 
 from ..prompts import FINAL_RESPONDER_PROMPT_TOOL_RESULTS, FINAL_RESPONDER_PROMPT_DIRECT_RESPONSE
-from ..utils import load_chat_model
-from ..configuration import Configuration
 from ..debug_utils import log_api_call
+from ..llm_cache import semantic_text
+from ..model_policy import invoke_for_node
 
-# Load models once at the module level
-config = Configuration.from_context()
-MODELS = {
-    "LLM_RESPONDER": load_chat_model(config.model)  # Main model for final responses
-}
 
 def _format_history(messages: list) -> str:
     """Helper to format the history for the prompt."""
@@ -234,8 +229,15 @@ Hãy trả lời người dùng dựa trên context trên.
                 response_reason=response_reason
             )
         
-        llm = MODELS["LLM_RESPONDER"]
-        response = await llm.ainvoke(prompt)
+        response, _ = await invoke_for_node(
+            "responder", prompt,
+            semantic_text=semantic_text(
+                user_input, history_summary, response_reason, execution_summary,
+                _stringify_tool_results(tool_results) if tool_results else None,
+                json.dumps(quotes, ensure_ascii=False) if quotes else None,
+                area_map, budget
+            )
+        )
         
         # Log API call with enhanced context
         log_api_call(
@@ -0,0 +1,240 @@
+"""Deterministic fast-path router from planner subtasks to tool calls.
+
+The planner emits subtasks in a small set of fixed shapes (see STRATEGIST_PROMPT),
+e.g. "Step 1: Query internal price for Sàn - Sàn gỗ". Those shapes are matched
+here with regular expressions and their arguments are resolved against the
+catalog's known names, so the executor can skip the LLM conversion round-trip.
+Anything that does not match a rule exactly returns None and goes to the LLM.
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ..catalog import get_catalog
+from ..path_resolver import fold
+
+# English terms the planner sometimes leaks, mapped to catalog names
+_ALIASES = {
+    "floor": "Sàn",
+    "walls": "Tường và vách",
+    "wall": "Tường và vách",
+    "ceiling": "Trần",
+    "stairs": "Cầu thang",
+    "wood flooring": "Sàn gỗ",
+    "tile flooring": "Sàn gạch",
+    "stone flooring": "Sàn đá",
+    "paint": "Sơn",
+    "wallpaper": "Giấy dán tường",
+    "gypsum wall": "Vách thạch cao khung xương 75/76",
+    "glass wall": "Vách kính cường lực",
+    "gypsum ceiling": "Trần thạch cao",
+    "stair wood cladding": "Ốp gỗ cầu thang",
+}
+
+# Budget multipliers by unit word
+_BUDGET_UNITS = {
+    "tỷ": 1_000_000_000,
+    "billion": 1_000_000_000,
+    "triệu": 1_000_000,
+    "million": 1_000_000,
+    "tr": 1_000_000,
+    "nghìn": 1_000,
+    "ngàn": 1_000,
+    "thousand": 1_000,
+    "k": 1_000,
+}
+
+_STEP_PREFIX = re.compile(r"^\s*(?:step|bước)\s*\d+\s*[:.)-]\s*", re.IGNORECASE)
+_QUOTED = r"['\"‘“]([^'\"’”]+)['\"’”]"
+_BUDGET = re.compile(
+    r"budget\s+(?:of\s+)?([\d.,]+)\s*(" + "|".join(_BUDGET_UNITS) + r")?\b",
+    re.IGNORECASE,
+)
+_SURFACE = re.compile(r"([^,:()]+?)\s*\(([^()]*)\)")
+_AREA = re.compile(r"^([\d.]+)\s*(?:m2|m²)?$", re.IGNORECASE)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.strip().strip("'\"‘’“”.").split()).casefold()
+
+
+def _resolve(name: str, parent: Sequence[str] = ()) -> Optional[str]:
+    """Resolve a name to a child of ``parent`` in the catalog, case- and diacritic-insensitively."""
+    wanted = _normalize(name)
+    wanted = _normalize(_ALIASES.get(wanted, wanted))
+    children = get_catalog().children(parent)
+    for child in children:
+        if _normalize(child) == wanted:
+            return child
+    # Gõ không dấu ("san go") chỉ được chấp nhận khi khớp đúng một mục
+    folded = [child for child in children if fold(child) == fold(wanted)]
+    return folded[0] if len(folded) == 1 else None
+
+
+def _resolve_path(segments: Sequence[str]) -> Optional[List[str]]:
+    """Resolve 'category - material_type - ...' segments; None if any segment is unknown."""
+    path: List[str] = []
+    for segment in segments:
+        child = _resolve(segment, path)
+        if child is None:
+            return None
+        path.append(child)
+    return path
+
+
+def _parse_budget(text: str) -> Optional[float]:
+    match = _BUDGET.search(text)
+    if not match:
+        return None
+    number, unit = match.groups()
+    if unit:
+        # "1.5 tỷ" dùng dấu chấm thập phân, còn "300,000,000" dùng dấu phẩy hàng nghìn
+        value = float(number.replace(",", "."))
+        return value * _BUDGET_UNITS[unit.lower()]
+    if re.fullmatch(r"\d{1,3}(?:\.\d{3})+", number):
+        # Dấu chấm phân cách hàng nghìn kiểu Việt Nam: "300.000.000"
+        number = number.replace(".", "")
+    value = float(number.replace(",", ""))
+    return value if value >= 1_000_000 else None
+
+
+def _parse_surfaces(text: str, require_area: bool) -> Optional[List[Dict[str, Any]]]:
+    """
+    Parse "position (category - material_type[ - subtype][, area])" entries.
+
+    Returns None when any entry cannot be resolved against the catalog.
+    """
+    _, _, listing = text.partition(":")
+    entries = _SURFACE.findall(listing)
+    if not entries:
+        return None
+
+    surfaces = []
+    for position, details in entries:
+        material_info, _, area_info = details.partition(",")
+        path = _resolve_path(material_info.split(" - "))
+        if path is None or len(path) < 2:
+            return None
+
+        area = None
+        if area_info.strip():
+            area_match = _AREA.match(area_info.strip())
+            if not area_match:
+                return None
+            area = float(area_match.group(1))
+        if require_area and not area:
+            return None
+
+        surface = {
+            "position": position.strip(),
+            "category": path[0],
+            "material_type": path[1],
+            "area": area,
+        }
+        if len(path) > 2:
+            surface["subtype"] = path[2]
+        surfaces.append(surface)
+    return surfaces
+
+
+# --- Rules ---
+
+def _route_budget_proposal(match: re.Match, subtask: str) -> Optional[Dict[str, Any]]:
+    budget = _parse_budget(subtask)
+    surfaces = _parse_surfaces(subtask, require_area=True)
+    if budget is None or surfaces is None:
+        return None
+    return {"name": "propose_options_for_budget", "args": {"budget": budget, "surfaces": surfaces}}
+
+
+def _route_price_ranges(match: re.Match, subtask: str) -> Optional[Dict[str, Any]]:
+    surfaces = _parse_surfaces(subtask, require_area=False)
+    if surfaces is None:
+        return None
+    return {"name": "get_material_price_ranges", "args": {"surfaces": surfaces}}
+
+
+def _route_internal_price(match: re.Match, subtask: str) -> Optional[Dict[str, Any]]:
+    path = _resolve_path(match.group(1).split(" - "))
+    if path is None or len(path) < 2:
+        return None
+    args = {"category": path[0], "material_type": path[1]}
+    if len(path) > 2:
+        args["subtype"] = path[2]
+    if len(path) > 3:
+        args["variant"] = " > ".join(path[3:])
+    return {"name": "get_internal_price_new", "args": args}
+
+
+def _route_search_materials(match: re.Match, subtask: str) -> Optional[Dict[str, Any]]:
+    return {"name": "search_materials_new", "args": {"query": match.group(1).strip()}}
+
+
+def _route_market_price(match: re.Match, subtask: str) -> Optional[Dict[str, Any]]:
+    return {"name": "get_market_price_new", "args": {"material": match.group(1).strip()}}
+
+
+def _route_categories(match: re.Match, subtask: str) -> Optional[Dict[str, Any]]:
+    return {"name": "get_categories_new", "args": {}}
+
+
+def _route_material_types(match: re.Match, subtask: str) -> Optional[Dict[str, Any]]:
+    category = _resolve(match.group(1))
+    if category is None:
+        return None
+    return {"name": "get_material_types_new", "args": {"category": category}}
+
+
+def _route_subtypes(match: re.Match, subtask: str) -> Optional[Dict[str, Any]]:
+    path = _resolve_path(match.group(1).split(" - "))
+    if path is None or len(path) != 2:
+        return None
+    return {"name": "get_material_subtypes_new", "args": {"category": path[0], "material_type": path[1]}}
+
+
+def _route_saved_quotes(match: re.Match, subtask: str) -> Optional[Dict[str, Any]]:
+    args = {"project_name": match.group(1).strip()} if match.group(1) else {}
+    return {"name": "get_saved_quotes_new", "args": args}
+
+
+# (pattern, handler) pairs, matched in order against the subtask without its "Step N:" prefix.
+# Each pattern must consume the whole subtask so compound steps still go to the LLM.
+RULES: List[Tuple[re.Pattern, Callable[[re.Match, str], Optional[Dict[str, Any]]]]] = [
+    (re.compile(r"^propose material options suitable for budget .+ for surfaces\s*:.+$", re.IGNORECASE),
+     _route_budget_proposal),
+    (re.compile(r"^provide material price ranges for surfaces\s*:.+$", re.IGNORECASE),
+     _route_price_ranges),
+    (re.compile(r"^query internal prices? for ([^'\"]+?)\.?$", re.IGNORECASE),
+     _route_internal_price),
+    (re.compile(r"^search materials with keyword " + _QUOTED + r"\.?$", re.IGNORECASE),
+     _route_search_materials),
+    (re.compile(r"^search market prices? for " + _QUOTED + r"\.?$", re.IGNORECASE),
+     _route_market_price),
+    (re.compile(r"^get all(?: available)? material categories\.?$", re.IGNORECASE),
+     _route_categories),
+    (re.compile(r"^get material types for category " + _QUOTED + r"\.?$", re.IGNORECASE),
+     _route_material_types),
+    (re.compile(r"^get (?:material )?subtypes for ([^'\"]+?)\.?$", re.IGNORECASE),
+     _route_subtypes),
+    (re.compile(r"^get saved quotes(?: for project " + _QUOTED + r")?\.?$", re.IGNORECASE),
+     _route_saved_quotes),
+]
+
+
+def route_subtask(subtask: str) -> Optional[Dict[str, Any]]:
+    """
+    Build a tool call for a subtask without calling the LLM.
+
+    Args:
+        subtask: One plan step as emitted by the planner
+
+    Returns:
+        {"name": ..., "args": ...} when a rule matches and every name resolves
+        against the catalog, otherwise None
+    """
+    text = _STEP_PREFIX.sub("", subtask).strip()
+    for pattern, handler in RULES:
+        match = pattern.match(text)
+        if match:
+            return handler(match, text)
+    return None
@@ -0,0 +1,95 @@
+"""Merge vision reports from many photos into one multi-room quote."""
+
+from typing import Any, Dict, List, Optional
+
+from .catalog import get_catalog
+from .new_tools import _calculate_from_area_map_with_fallback, _format_quote_result, _parse_image_report_to_area_map
+from .room_parser import calculate_surface_areas, parse_room_dimensions
+from .utils import cleanup_llm_output
+
+# Marker the vision model adds to surfaces it could not see
+INFERRED_MARKER = "(phán đoán)"
+
+# Vision positions -> keys of room_parser.calculate_surface_areas
+_POSITION_AREAS = {
+    "sàn": "floor",
+    "trần": "ceiling",
+    "tường trái": "wall1",
+    "tường phải": "wall2",
+    "tường đối diện": "wall3",
+    "tường sau lưng": "wall4",
+}
+
+
+def area_map_from_report(image_report: str) -> Dict[str, Any]:
+    """Parse one vision report (possibly wrapped in a ```json block) into an area map."""
+    return _parse_image_report_to_area_map(cleanup_llm_output(image_report))
+
+
+def _base_position(position: str) -> str:
+    return position.replace(INFERRED_MARKER, "").strip()
+
+
+def merge_room_surfaces(area_maps: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Merge the surfaces seen in several photos of the same room.
+
+    A surface observed in any photo wins over one the model only inferred
+    ("(phán đoán)"); between equals the first photo wins.
+
+    Args:
+        area_maps: Area maps parsed from each photo of the room
+
+    Returns:
+        Surfaces keyed by position without the inferred marker
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    inferred: Dict[str, bool] = {}
+    for area_map in area_maps:
+        for position, surface in area_map.get("surfaces", {}).items():
+            base = _base_position(position)
+            is_inferred = INFERRED_MARKER in position
+            if base not in merged or (inferred[base] and not is_inferred):
+                merged[base] = dict(surface)
+                inferred[base] = is_inferred
+    return merged
+
+
+def apply_room_size(surfaces: Dict[str, Dict[str, Any]], room_size: Optional[str]) -> None:
+    """Fill in surface areas from room dimensions "LxWxH" when the photos carry none."""
+    if not room_size:
+        return
+    areas = calculate_surface_areas(parse_room_dimensions(room_size))
+    for position, surface in surfaces.items():
+        key = _POSITION_AREAS.get(position)
+        if key and surface.get("area") is None:
+            surface["area"] = f"{areas[key]:.1f}"
+
+
+def price_rooms(rooms: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Price every surface of every room in one pass.
+
+    Args:
+        rooms: {room name: {"area_maps": [...], "room_size": "LxWxH" or None}}
+
+    Returns:
+        {"rooms": merged surfaces per room, "result": raw calculation, "quote": markdown table,
+         "catalog_version": version of the catalog the quote was priced from}
+    """
+    merged_rooms = {}
+    area_map = {"surfaces": {}}
+    for room, info in rooms.items():
+        surfaces = merge_room_surfaces(info.get("area_maps", []))
+        apply_room_size(surfaces, info.get("room_size"))
+        merged_rooms[room] = surfaces
+        for position, surface in surfaces.items():
+            area_map["surfaces"][f"{room} - {position}"] = surface
+
+    result = _calculate_from_area_map_with_fallback(get_catalog().data, area_map)
+    return {
+        "rooms": merged_rooms,
+        "result": result,
+        "quote": _format_quote_result(result),
+        "catalog_version": result["summary"].get("catalog_version"),
+    }
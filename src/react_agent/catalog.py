@@ -0,0 +1,453 @@
+"""Compiled, indexed view of the DatabaseNoiThat.json price tree."""
+
+import hashlib
+import json
+import os
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Keys that mark a variant node in the nested price tree
+MATERIAL_KEY = "Vật tư"
+LABOR_KEY = "Nhân công"
+
+_current_dir = os.path.dirname(os.path.abspath(__file__))
+_data_dir = os.path.join(_current_dir, '..', '..', 'data')
+DATABASE_PATH = os.path.join(_data_dir, 'DatabaseNoiThat.json')
+
+
+def tree_version(data: Any) -> str:
+    """Content hash of a price tree; changes whenever any price or name changes."""
+    return hashlib.sha256(
+        json.dumps(data, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+
+
+class PriceAggregate:
+    """Count, sum, min and max of the material, labor and combined prices under one node.
+
+    Labor statistics only cover variants that carry a 'Nhân công' price;
+    combined prices treat a missing labor price as 0.
+    """
+
+    __slots__ = (
+        "count", "labor_count",
+        "material_min", "material_max", "material_sum",
+        "labor_min", "labor_max", "labor_sum",
+        "combined_min", "combined_max", "combined_sum",
+    )
+
+    def __init__(self):
+        self.count = 0
+        self.labor_count = 0
+        self.material_min = self.labor_min = self.combined_min = None
+        self.material_max = self.labor_max = self.combined_max = None
+        self.material_sum = self.labor_sum = self.combined_sum = 0.0
+
+    def add(self, material: float, labor: Optional[float]) -> None:
+        """Fold one variant row into the aggregate."""
+        combined = material + (labor or 0)
+        self.count += 1
+        self.material_sum += material
+        self.combined_sum += combined
+        if self.material_min is None or material < self.material_min:
+            self.material_min = material
+        if self.material_max is None or material > self.material_max:
+            self.material_max = material
+        if self.combined_min is None or combined < self.combined_min:
+            self.combined_min = combined
+        if self.combined_max is None or combined > self.combined_max:
+            self.combined_max = combined
+        if labor is not None:
+            self.labor_count += 1
+            self.labor_sum += labor
+            if self.labor_min is None or labor < self.labor_min:
+                self.labor_min = labor
+            if self.labor_max is None or labor > self.labor_max:
+                self.labor_max = labor
+
+    def merge(self, other: "PriceAggregate") -> None:
+        """Fold a child node's aggregate into this one."""
+        if not other.count:
+            return
+        self.count += other.count
+        self.labor_count += other.labor_count
+        self.material_sum += other.material_sum
+        self.labor_sum += other.labor_sum
+        self.combined_sum += other.combined_sum
+        for field, pick in (("material_min", min), ("material_max", max), ("labor_min", min),
+                            ("labor_max", max), ("combined_min", min), ("combined_max", max)):
+            theirs = getattr(other, field)
+            if theirs is not None:
+                mine = getattr(self, field)
+                setattr(self, field, theirs if mine is None else pick(mine, theirs))
+
+    def as_range(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "labor_count": self.labor_count,
+            "material_min": self.material_min,
+            "material_max": self.material_max,
+            "material_avg": self.material_sum / self.count,
+            "labor_min": self.labor_min,
+            "labor_max": self.labor_max,
+            "labor_avg": self.labor_sum / self.labor_count if self.labor_count else None,
+            "combined_min": self.combined_min,
+            "combined_max": self.combined_max,
+            "combined_avg": self.combined_sum / self.count,
+        }
+
+
+class PriceCatalog:
+    """Flattened, prefix-indexed price catalog built once from the nested JSON tree.
+
+    Every variant (a node carrying a 'Vật tư' price) becomes one row stored in
+    columnar arrays. Rows are laid out in depth-first order, so all variants
+    below any path prefix occupy one contiguous slice ``[start, end)``; the
+    prefix index maps each prefix to that slice. Path resolution is therefore
+    a dict lookup and enumerating the ``k`` variants under a prefix is O(k).
+    Price aggregates of every internal node are computed during the same
+    pass, so range queries at any depth are O(1). A catalog is never modified
+    once built; with_price derives an updated copy.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self.version = tree_version(data)
+
+        # Interned path segments; the *_ids columns below index into this list
+        self.segments: List[str] = []
+        self._segment_ids: Dict[str, int] = {}
+
+        # One entry per variant row
+        self.paths: List[Tuple[str, ...]] = []
+        self.category_ids = array("i")
+        self.type_ids = array("i")
+        self.subtype_ids = array("i")
+        self.variant_ids = array("i")
+        self.material_costs = array("d")
+        self.labor_costs = array("d")
+        self.has_labor = array("b")
+
+        # Prefix indexes over path segments
+        self._spans: Dict[Tuple[str, ...], Tuple[int, int]] = {}
+        self._children: Dict[Tuple[str, ...], List[str]] = {}
+        self._rows: Dict[Tuple[str, ...], int] = {}
+        # Price aggregates of internal nodes (variant-only nodes are read from their row)
+        self._aggregates: Dict[Tuple[str, ...], PriceAggregate] = {}
+        # id() of each dict node in ``data`` -> its path, for callers holding a node
+        self._node_paths: Dict[int, Tuple[str, ...]] = {}
+
+        if isinstance(data, dict):
+            self._compile(data, ())
+
+    @classmethod
+    def from_file(cls, path: str = DATABASE_PATH) -> "PriceCatalog":
+        """Load and compile a catalog from a JSON file."""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    # --- Build ---
+
+    def _intern(self, segment: Optional[str]) -> int:
+        if segment is None:
+            return -1
+        segment_id = self._segment_ids.get(segment)
+        if segment_id is None:
+            segment_id = len(self.segments)
+            self.segments.append(segment)
+            self._segment_ids[segment] = segment_id
+        return segment_id
+
+    def _compile(self, node: Dict[str, Any], prefix: Tuple[str, ...]) -> None:
+        start = len(self.paths)
+        self._node_paths[id(node)] = prefix
+
+        if MATERIAL_KEY in node:
+            self._add_row(prefix, node)
+
+        children = []
+        for key, value in node.items():
+            if isinstance(value, dict):
+                children.append(key)
+                self._compile(value, prefix + (key,))
+
+        self._children[prefix] = children
+        self._spans[prefix] = (start, len(self.paths))
+        if children:
+            self._aggregates[prefix] = self._aggregate_node(prefix)
+
+    def _aggregate_node(self, prefix: Tuple[str, ...]) -> PriceAggregate:
+        """Build a node's aggregate from its own row (if any) and its children's aggregates."""
+        aggregate = PriceAggregate()
+        row = self._rows.get(prefix)
+        if row is not None:
+            aggregate.add(*self._row_prices(row))
+        for child in self._children[prefix]:
+            child_path = prefix + (child,)
+            child_aggregate = self._aggregates.get(child_path)
+            if child_aggregate is not None:
+                aggregate.merge(child_aggregate)
+            elif child_path in self._rows:
+                aggregate.add(*self._row_prices(self._rows[child_path]))
+        return aggregate
+
+    def _row_prices(self, index: int) -> Tuple[float, Optional[float]]:
+        return self.material_costs[index], (self.labor_costs[index] if self.has_labor[index] else None)
+
+    def _add_row(self, path: Tuple[str, ...], node: Dict[str, Any]) -> None:
+        category, material_type, subtype, variant = split_path(path)
+        labor = node.get(LABOR_KEY)
+
+        self._rows[path] = len(self.paths)
+        self.paths.append(path)
+        self.category_ids.append(self._intern(category))
+        self.type_ids.append(self._intern(material_type))
+        self.subtype_ids.append(self._intern(subtype))
+        self.variant_ids.append(self._intern(variant))
+        self.material_costs.append(float(node[MATERIAL_KEY] or 0))
+        self.labor_costs.append(float(labor or 0))
+        self.has_labor.append(1 if labor is not None else 0)
+
+    # --- Lookups ---
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def span(self, path: Sequence[str]) -> Optional[Tuple[int, int]]:
+        """Return the ``[start, end)`` row slice under an exact path prefix."""
+        return self._spans.get(tuple(path))
+
+    def index_of(self, path: Sequence[str]) -> Optional[int]:
+        """Return the row index of the variant at exactly ``path``."""
+        return self._rows.get(tuple(path))
+
+    def path_of(self, node: Any) -> Optional[Tuple[str, ...]]:
+        """Return the path of a dict node of ``data`` (by identity), or None."""
+        return self._node_paths.get(id(node))
+
+    def contains(self, path: Sequence[str]) -> bool:
+        """Check whether ``path`` is a node (internal or variant) of the tree."""
+        return tuple(path) in self._spans
+
+    def children(self, path: Sequence[str] = ()) -> List[str]:
+        """List the child segment names of a node, in catalog order."""
+        return list(self._children.get(tuple(path), []))
+
+    def variant_paths(self, path: Sequence[str] = ()) -> List[Tuple[str, ...]]:
+        """List the paths of all variants under a prefix."""
+        span = self.span(path)
+        if span is None:
+            return []
+        return self.paths[span[0]:span[1]]
+
+    def variant(self, index: int) -> Dict[str, Any]:
+        """Return one variant row as a dictionary."""
+        category, material_type, subtype, variant = split_path(self.paths[index])
+        material_cost = self.material_costs[index]
+        labor_cost = self.labor_costs[index] if self.has_labor[index] else None
+        return {
+            "path": list(self.paths[index]),
+            "category": category,
+            "material_type": material_type,
+            "subtype": subtype,
+            "variant": variant,
+            "material_cost": material_cost,
+            "labor_cost": labor_cost,
+            "combined_cost": material_cost + (labor_cost or 0),
+        }
+
+    def price_range(self, path: Sequence[str] = ()) -> Optional[Dict[str, Any]]:
+        """Return min/max/avg prices over every variant under a prefix, in O(1).
+
+        Labor min/max/avg only consider variants that carry a 'Nhân công' price;
+        combined prices treat a missing labor price as 0. Returns None when the
+        prefix does not exist or has no variants.
+        """
+        path = tuple(path)
+        aggregate = self._aggregates.get(path)
+        if aggregate is None:
+            row = self._rows.get(path)
+            if row is None:
+                return None
+            aggregate = PriceAggregate()
+            aggregate.add(*self._row_prices(row))
+        if not aggregate.count:
+            return None
+        return aggregate.as_range()
+
+    # --- Updates ---
+
+    def with_price(
+        self,
+        path: Sequence[str],
+        material_cost: Optional[float] = None,
+        labor_cost: Optional[float] = None,
+        remove_labor: bool = False
+    ) -> "PriceCatalog":
+        """
+        Return a new catalog with the price of one variant changed (copy-on-write).
+
+        Published catalogs are never modified, so requests pinned to this one
+        keep their prices. The new catalog shares everything the change does
+        not touch: only the dict nodes along ``path`` are copied, the price
+        columns are copied as flat arrays, and only the aggregates of the
+        variant's ancestors are rebuilt, each from its children's aggregates.
+        Its version is derived from this catalog's version and the changed
+        row, without hashing the tree again; a catalog later loaded from the
+        same content gets a different (tree_version) version.
+
+        Args:
+            path: Exact variant path
+            material_cost: New 'Vật tư' price (unchanged when None)
+            labor_cost: New 'Nhân công' price (unchanged when None)
+            remove_labor: Drop the 'Nhân công' price of the variant
+
+        Returns:
+            The updated catalog
+
+        Raises:
+            KeyError: If ``path`` is not a variant of the catalog
+        """
+        path = tuple(path)
+        index = self._rows.get(path)
+        if index is None:
+            raise KeyError(" > ".join(path))
+
+        new = PriceCatalog.__new__(PriceCatalog)
+        # Cấu trúc (đường dẫn, chỉ mục tiền tố) không đổi: dùng chung với bản cũ
+        new.segments, new._segment_ids, new.paths = self.segments, self._segment_ids, self.paths
+        new.category_ids, new.type_ids = self.category_ids, self.type_ids
+        new.subtype_ids, new.variant_ids = self.subtype_ids, self.variant_ids
+        new._spans, new._children, new._rows = self._spans, self._children, self._rows
+        new.material_costs = array("d", self.material_costs)
+        new.labor_costs = array("d", self.labor_costs)
+        new.has_labor = array("b", self.has_labor)
+        new._aggregates = dict(self._aggregates)
+        new._node_paths = dict(self._node_paths)
+
+        # Chỉ sao chép các nút dict trên đường dẫn; nhánh anh em dùng chung
+        new.data = dict(self.data)
+        old_node, node = self.data, new.data
+        new._node_paths.pop(id(old_node), None)
+        new._node_paths[id(node)] = ()
+        for depth, key in enumerate(path, 1):
+            old_node = old_node[key]
+            node[key] = dict(old_node)
+            node = node[key]
+            new._node_paths.pop(id(old_node), None)
+            new._node_paths[id(node)] = path[:depth]
+
+        if material_cost is not None:
+            new.material_costs[index] = float(material_cost)
+            node[MATERIAL_KEY] = material_cost
+        if remove_labor:
+            new.labor_costs[index] = 0.0
+            new.has_labor[index] = 0
+            node.pop(LABOR_KEY, None)
+        elif labor_cost is not None:
+            new.labor_costs[index] = float(labor_cost)
+            new.has_labor[index] = 1
+            node[LABOR_KEY] = labor_cost
+
+        # Từ nút sâu nhất lên gốc, mỗi tổ tiên gộp lại từ các con
+        for depth in range(len(path), -1, -1):
+            prefix = path[:depth]
+            if prefix in new._aggregates:
+                new._aggregates[prefix] = new._aggregate_node(prefix)
+
+        new.version = hashlib.sha256(json.dumps(
+            [self.version, list(path), node.get(MATERIAL_KEY), node.get(LABOR_KEY)], ensure_ascii=False
+        ).encode("utf-8")).hexdigest()[:16]
+        return new
+
+
+def split_path(path: Sequence[str]) -> Tuple[Optional[str], Optional[str], Optional[str], Optional[str]]:
+    """Split a variant path into (category, material_type, subtype, variant).
+
+    The tree is 3 to 5 levels deep; anything below the subtype level is joined
+    into the variant name with ' > '.
+    """
+    category = path[0] if len(path) > 0 else None
+    material_type = path[1] if len(path) > 1 else None
+    subtype = path[2] if len(path) > 2 else None
+    variant = " > ".join(path[3:]) if len(path) > 3 else None
+    return category, material_type, subtype, variant
+
+
+# Compile the shared catalog once at module level; catalog_manager swaps in reloaded snapshots
+CATALOG = PriceCatalog.from_file(DATABASE_PATH)
+
+# Snapshot pinned for the current request (see pinned_catalog)
+_pinned_catalog: ContextVar[Optional[PriceCatalog]] = ContextVar("pinned_catalog", default=None)
+
+
+# Catalogs compiled for trees other than the shared one, by id() of the tree
+_compiled: "OrderedDict[int, PriceCatalog]" = OrderedDict()
+_compiled_lock = threading.Lock()
+# Number of such catalogs kept
+COMPILED_CACHE_SIZE = 4
+
+
+def _current() -> PriceCatalog:
+    pinned = _pinned_catalog.get()
+    return pinned if pinned is not None else CATALOG
+
+
+def get_catalog(data: Optional[Dict[str, Any]] = None) -> PriceCatalog:
+    """Return the shared catalog, or the compiled catalog of a different tree.
+
+    Other trees are compiled once and kept in a small LRU, so a caller holding
+    a stale or foreign tree does not pay for a full build on every call.
+
+    Inside pinned_catalog() the shared catalog is the pinned snapshot, so a
+    request keeps reading the prices it started with across a reload.
+    """
+    current = _current()
+    if data is None or data is current.data:
+        return current
+    if data is CATALOG.data:
+        return CATALOG
+
+    with _compiled_lock:
+        cached = _compiled.get(id(data))
+        if cached is not None and cached.data is data:
+            _compiled.move_to_end(id(data))
+            return cached
+    catalog = PriceCatalog(data)
+    with _compiled_lock:
+        _compiled[id(data)] = catalog
+        _compiled.move_to_end(id(data))
+        while len(_compiled) > COMPILED_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return catalog
+
+
+def set_catalog(catalog: PriceCatalog) -> None:
+    """Make ``catalog`` the shared catalog (a single reference swap, atomic for readers)."""
+    global CATALOG
+    CATALOG = catalog
+
+
+def catalog_version(data: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """Version of the catalog ``data`` belongs to (the shared one when None); None for other trees."""
+    current = _current()
+    if data is None or data is current.data:
+        return current.version
+    if data is CATALOG.data:
+        return CATALOG.version
+    return None
+
+
+@contextmanager
+def pinned_catalog(catalog: Optional[PriceCatalog] = None) -> Iterator[PriceCatalog]:
+    """Pin a catalog snapshot (the current one by default) for the enclosed block and its tasks."""
+    catalog = catalog if catalog is not None else get_catalog()
+    token = _pinned_catalog.set(catalog)
+    try:
+        yield catalog
+    finally:
+        _pinned_catalog.reset(token)
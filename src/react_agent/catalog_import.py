@@ -0,0 +1,745 @@
+"""Bulk import of supplier price lists (CSV/XLSX) into the price catalog.
+
+Supplier spreadsheets are read row by row (csv.reader, or openpyxl in
+read-only mode), so memory is bounded by the size of the catalog, not of
+the file. A 500k-row list merges in about two to three times the memory of
+the resulting JSON tree. Each row is validated and normalized:
+
+- names: Unicode NFC, whitespace collapsed, control characters rejected. A
+  name matching an existing sibling with diacritics and case folded
+  ("san go" vs "Sàn gỗ") takes the catalog's spelling instead of adding a
+  duplicate node.
+- prices: Vietnamese number formats ("1.500.000", "1,5tr", "850k",
+  "450.000 đ/m2"), below MAX_PRICE; 'Vật tư' must be positive, 'Nhân công'
+  may be 0 (labor included in the material price).
+
+Valid rows are merged into the nested 'Vật tư'/'Nhân công' tree. The result
+is written to the JSON file that database_utils reads and, on request
+(--snapshot), to a compact binary snapshot of the catalog's columnar rows
+(see write_snapshot). Files are written to a temporary file first and then
+renamed, so the catalog_manager watcher of a running server never reads a
+half-written file. The report lists the variants added, changed and removed against the
+version the import started from.
+
+A sheet holds either one column per level (Danh mục, Loại, Phân loại,
+optional Nhóm, Tên) or one 'Đường dẫn' column with the levels joined by
+'>', plus 'Vật tư' and optionally 'Nhân công' price columns. Title rows
+above the header are skipped.
+
+Usage:
+    PYTHONPATH=src python -m react_agent.catalog_import bang_gia.xlsx --dry-run
+    PYTHONPATH=src python -m react_agent.catalog_import bang_gia.csv
+    PYTHONPATH=src python -m react_agent.catalog_import bang_gia.xlsx --sheet "Sàn" --replace
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import struct
+import unicodedata
+import zlib
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from .catalog import DATABASE_PATH, LABOR_KEY, MATERIAL_KEY, PriceCatalog, tree_version
+from .path_resolver import fold
+
+# Prices above this (VND per unit) are treated as typos
+MAX_PRICE = 10_000_000_000
+MAX_NAME_LENGTH = 200
+# Variant paths: category > material type > subtype > [group >] variant
+MIN_DEPTH = 3
+MAX_DEPTH = 5
+# The header must appear within the first rows (title rows above it are skipped)
+HEADER_SCAN_ROWS = 20
+# Rows kept as examples per report section; everything else is only counted
+MAX_SAMPLES = 20
+# Distinct upper-level names and price cells memoized while streaming
+PARSE_CACHE_SIZE = 10_000
+
+Price = Union[int, float]
+
+SNAPSHOT_MAGIC = b"RACATSNP"
+SNAPSHOT_FORMAT = 1
+
+# Folded header text -> column role
+HEADER_ALIASES = {
+    "category": ("danh muc", "hang muc", "category"),
+    "material_type": ("loai", "loai vat lieu", "chung loai", "material type", "type"),
+    "subtype": ("phan loai", "dong san pham", "subtype"),
+    "group": ("nhom", "group"),
+    "variant": ("ten", "ten san pham", "bien the", "mau", "quy cach", "variant", "name"),
+    "path": ("duong dan", "path"),
+    "material": ("vat tu", "gia vat tu", "don gia vat tu", "gia", "don gia", "material", "material cost"),
+    "labor": ("nhan cong", "gia nhan cong", "don gia nhan cong", "labor", "labor cost"),
+}
+_HEADER_ROLES = {alias: role for role, aliases in HEADER_ALIASES.items() for alias in aliases}
+LEVEL_COLUMNS = ("category", "material_type", "subtype", "group", "variant")
+
+_RESERVED_NAMES = {fold(MATERIAL_KEY), fold(LABOR_KEY)}
+# Unicode category Cc
+_CONTROL_CHARS = re.compile(r"[\x00-\x1f\x7f-\x9f]")
+_CURRENCY = re.compile(r"(vnđ|vnd|đồng|dong|đ|₫)")
+_MULTIPLIERS = (("triệu", 1_000_000), ("trieu", 1_000_000), ("tr", 1_000_000),
+                ("nghìn", 1_000), ("ngàn", 1_000), ("nghin", 1_000), ("ngan", 1_000), ("k", 1_000))
+
+
+class RowError(ValueError):
+    """A supplier row that cannot be imported; the message says why."""
+
+
+def normalize_name(value: Any) -> str:
+    """
+    Clean one path segment from a spreadsheet cell.
+
+    Raises:
+        RowError: If the name is empty, too long or contains control characters
+    """
+    text = unicodedata.normalize("NFC", str(value if value is not None else ""))
+    text = " ".join(text.replace("\u200b", "").replace("\ufeff", "").split())
+    if not text:
+        raise RowError("tên trống")
+    if len(text) > MAX_NAME_LENGTH:
+        raise RowError(f"tên dài hơn {MAX_NAME_LENGTH} ký tự")
+    if _CONTROL_CHARS.search(text):
+        raise RowError(f"tên chứa ký tự điều khiển: {text!r}")
+    return text
+
+
+def parse_price(value: Any, allow_zero: bool = False) -> Optional[Price]:
+    """
+    Parse a Vietnamese-formatted price cell.
+
+    Accepts numbers and text such as "1.500.000", "1,500,000", "1.500.000 đ/m2",
+    "1,5tr", "850k" or "1.2 triệu". Dots and commas are thousands separators
+    when they group digits by three, decimal marks otherwise.
+
+    Args:
+        value: Cell value
+        allow_zero: Accept a price of 0 (a 'Nhân công' included in 'Vật tư')
+
+    Returns:
+        The price (int when whole), or None for an empty cell
+
+    Raises:
+        RowError: If the cell is not a valid price
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise RowError(f"giá không hợp lệ: {value!r}")
+    if isinstance(value, (int, float)):
+        number = float(value)
+    else:
+        text = unicodedata.normalize("NFC", str(value)).strip().lower()
+        if not text:
+            return None
+        # Bỏ đơn vị tính ("/m2", "/bộ") và ký hiệu tiền tệ
+        text = _CURRENCY.sub("", text.split("/", 1)[0]).replace(" ", "").replace("\xa0", "")
+        multiplier = 1
+        for suffix, factor in _MULTIPLIERS:
+            if text.endswith(suffix):
+                text, multiplier = text[:-len(suffix)], factor
+                break
+        try:
+            number = _parse_number(text) * multiplier
+        except ValueError:
+            raise RowError(f"giá không hợp lệ: {value!r}") from None
+    if not math.isfinite(number) or number < 0 or (number == 0 and not allow_zero):
+        raise RowError(f"giá phải lớn hơn 0: {value!r}" if not allow_zero else f"giá không được âm: {value!r}")
+    if number > MAX_PRICE:
+        raise RowError(f"giá vượt {MAX_PRICE:,}: {value!r}")
+    number = round(number, 2)
+    return int(number) if number.is_integer() else number
+
+
+def _parse_price_or_zero(value: Any) -> Optional[Price]:
+    return parse_price(value, allow_zero=True)
+
+
+def _parse_number(text: str) -> float:
+    if not re.fullmatch(r"[0-9.,]*[0-9][0-9.,]*", text):
+        raise ValueError(text)
+    dots, commas = text.count("."), text.count(",")
+    if dots and commas:
+        # Dấu xuất hiện sau cùng là dấu thập phân: "1.500.000,50" / "1,500,000.50"
+        decimal = "," if text.rfind(",") > text.rfind(".") else "."
+        thousands = "." if decimal == "," else ","
+        text = text.replace(thousands, "").replace(decimal, ".")
+    elif dots or commas:
+        separator = "." if dots else ","
+        groups = text.split(separator)
+        if len(groups) > 2 or (len(groups[-1]) == 3 and groups[0] not in ("", "0")):
+            # "1.500.000" hoặc "450,000": phân cách hàng nghìn
+            if not all(len(group) == 3 for group in groups[1:]) or not groups[0]:
+                raise ValueError(text)
+            text = "".join(groups)
+        else:
+            text = text.replace(separator, ".")
+    return float(text)
+
+
+# --- Streaming readers ---
+
+def _sniff_delimiter(sample: str) -> str:
+    """Delimiter splitting the most sample lines into the same number of columns."""
+    lines = [line for line in sample.splitlines()[:HEADER_SCAN_ROWS * 5] if line.strip()]
+    best, best_key = ",", (0, 0)
+    for delimiter in (",", ";", "\t", "|"):
+        counts = Counter(line.count(delimiter) for line in lines)
+        counts.pop(0, None)
+        if counts:
+            # Dòng tiêu đề phía trên và dấu phẩy trong tên sản phẩm làm lệch số cột, chọn theo số dòng nhất quán
+            columns, agreeing = counts.most_common(1)[0]
+            if (agreeing, columns) > best_key:
+                best, best_key = delimiter, (agreeing, columns)
+    return best
+
+
+def _iter_csv(path: str, encoding: str) -> Iterator[Tuple[int, List[Any]]]:
+    with open(path, "r", encoding=encoding, newline="") as f:
+        delimiter = _sniff_delimiter(f.read(65536))
+        f.seek(0)
+        for line, row in enumerate(csv.reader(f, delimiter=delimiter), 1):
+            yield line, row
+
+
+def _iter_xlsx(path: str, sheet: Optional[str]) -> Iterator[Tuple[int, List[Any]]]:
+    try:
+        import openpyxl
+    except ImportError as e:
+        raise ImportError("Reading .xlsx price lists requires openpyxl (pip install openpyxl)") from e
+
+    # read_only: các dòng được đọc dần từ file nén, không dựng cả bảng tính trong bộ nhớ
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        for line, row in enumerate(worksheet.iter_rows(values_only=True), 1):
+            yield line, list(row)
+    finally:
+        workbook.close()
+
+
+def iter_rows(path: str, sheet: Optional[str] = None, encoding: str = "utf-8-sig") -> Iterator[Tuple[int, List[Any]]]:
+    """
+    Stream the rows of a CSV or XLSX file as (line number, cell values).
+
+    Raises:
+        ValueError: If the file type is not supported
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        return _iter_xlsx(path, sheet)
+    if extension in (".csv", ".tsv", ".txt"):
+        return _iter_csv(path, encoding)
+    raise ValueError(f"Unsupported price list format: {extension or path}")
+
+
+def detect_columns(row: Sequence[Any]) -> Optional[Dict[str, int]]:
+    """Map column roles to indexes if ``row`` looks like a header row, else None."""
+    columns: Dict[str, int] = {}
+    for index, cell in enumerate(row):
+        # "Đơn giá vật tư (VNĐ)" -> "don gia vat tu"
+        role = _HEADER_ROLES.get(fold(re.sub(r"\(.*?\)", "", str(cell)))) if cell is not None else None
+        if role is not None and role not in columns:
+            columns[role] = index
+    has_path = "path" in columns or all(role in columns for role in ("category", "material_type", "subtype", "variant"))
+    return columns if has_path and "material" in columns else None
+
+
+# --- Merge ---
+
+@dataclass
+class ImportReport:
+    """Outcome of one import: row counts, diff against the base version and sample rows."""
+
+    source: str
+    base_version: str
+    new_version: Optional[str] = None
+    rows: int = 0
+    imported: int = 0
+    rejected: int = 0
+    duplicates: int = 0
+    renamed: int = 0
+    added: int = 0
+    changed: int = 0
+    unchanged: int = 0
+    removed: int = 0
+    variants: int = 0
+    by_category: Dict[str, Counter] = field(default_factory=dict)
+    rejected_reasons: Counter = field(default_factory=Counter)
+    rejected_samples: List[Tuple[int, str]] = field(default_factory=list)
+    added_samples: List[Dict[str, Any]] = field(default_factory=list)
+    changed_samples: List[Dict[str, Any]] = field(default_factory=list)
+    removed_samples: List[Dict[str, Any]] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+
+    def record(self, kind: str, path: Tuple[str, ...], before: Optional[Dict[str, Any]] = None,
+                after: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Count one added/changed/removed variant; returns its sample entry if one was kept."""
+        setattr(self, kind, getattr(self, kind) + 1)
+        self.by_category.setdefault(path[0], Counter())[kind] += 1
+        samples = getattr(self, f"{kind}_samples")
+        if len(samples) >= MAX_SAMPLES:
+            return None
+        sample = {"path": list(path), "before": before, "after": after}
+        samples.append(sample)
+        return sample
+
+    def reject(self, line: int, reason: str) -> None:
+        self.rejected += 1
+        # Gom lý do theo loại (phần trước dấu ':') để thống kê
+        self.rejected_reasons[reason.split(":", 1)[0]] += 1
+        if len(self.rejected_samples) < MAX_SAMPLES:
+            self.rejected_samples.append((line, reason))
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {key: value for key, value in self.__dict__.items() if key != "by_category"}
+        result["by_category"] = {category: dict(counts) for category, counts in self.by_category.items()}
+        result["rejected_reasons"] = dict(self.rejected_reasons)
+        return result
+
+    def format(self) -> str:
+        """Human-readable summary for the command line."""
+        lines = [
+            f"Nguồn: {self.source}",
+            f"Phiên bản: {self.base_version} -> {self.new_version or self.base_version}",
+            f"Dòng: {self.rows:,} đọc, {self.imported:,} hợp lệ, {self.rejected:,} bị loại, "
+            f"{self.duplicates:,} trùng lặp, {self.renamed:,} tên khớp theo bảng giá",
+            f"Thay đổi: +{self.added:,} thêm, ~{self.changed:,} đổi giá, -{self.removed:,} xóa, "
+            f"{self.unchanged:,} không đổi ({self.variants:,} biến thể sau khi nhập)",
+        ]
+        for category, counts in self.by_category.items():
+            lines.append(f"  {category}: +{counts['added']} ~{counts['changed']} -{counts['removed']}")
+        for kind, title in (("changed", "Đổi giá"), ("added", "Thêm mới"), ("removed", "Xóa")):
+            samples = getattr(self, f"{kind}_samples")
+            if samples:
+                lines.append(f"{title} (tối đa {MAX_SAMPLES}):")
+                lines.extend(f"  {' > '.join(s['path'])}: {_format_prices(s['before'])} -> {_format_prices(s['after'])}"
+                             for s in samples)
+        if self.rejected:
+            reasons = ", ".join(f"{reason} ({count})" for reason, count in self.rejected_reasons.most_common())
+            lines.append(f"Dòng bị loại: {reasons}")
+            lines.extend(f"  dòng {line}: {reason}" for line, reason in self.rejected_samples)
+        lines.extend(f"Đã ghi: {output}" for output in self.outputs)
+        return "\n".join(lines)
+
+
+def _format_prices(prices: Optional[Dict[str, Any]]) -> str:
+    if not prices:
+        return "-"
+    return ", ".join(f"{key} {value:,}" for key, value in prices.items())
+
+
+def _prices(node: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: node[key] for key in (MATERIAL_KEY, LABOR_KEY) if key in node}
+
+
+def _has_children(node: Dict[str, Any]) -> bool:
+    return any(isinstance(value, dict) for value in node.values())
+
+
+class CatalogImporter:
+    """Merges validated supplier rows into a nested price tree, recording the diff.
+
+    Args:
+        data: Price tree to merge into (modified in place)
+        report: Report receiving counts and samples
+        replace: Remove the variants of every category present in the file
+            that the file does not list
+    """
+
+    def __init__(self, data: Dict[str, Any], report: ImportReport, replace: bool = False):
+        self.data = data
+        self.report = report
+        self.replace = replace
+        self.columns: Optional[Dict[str, int]] = None
+        # id(variant node) of every row imported, for duplicates and --replace
+        self._seen: Set[int] = set()
+        self._categories: Dict[str, None] = {}
+        # id(variant node) -> its report sample, so a later duplicate row updates it
+        self._samples: Dict[int, Dict[str, Any]] = {}
+        # id(parent) -> {folded child name: child name}, built on the first exact miss
+        self._folded: Dict[int, Dict[str, str]] = {}
+        # Tên cấp trên và giá lặp lại rất nhiều giữa các dòng: chuẩn hóa mỗi giá trị một lần
+        self._names: Dict[Any, str] = {}
+        self._prices: Dict[Any, Optional[Price]] = {}
+
+    @staticmethod
+    def _cached(cache: Dict[Any, Any], parse: Any, value: Any) -> Any:
+        try:
+            return cache[value]
+        except KeyError:
+            pass
+        except TypeError:
+            return parse(value)
+        result = parse(value)
+        if len(cache) >= PARSE_CACHE_SIZE:
+            cache.clear()
+        cache[value] = result
+        return result
+
+    def _name(self, value: Any) -> str:
+        return self._cached(self._names, normalize_name, value)
+
+    def _price(self, value: Any, allow_zero: bool = False) -> Optional[Price]:
+        # Cache chung cho mọi cột giá: 0 được kiểm tra sau khi tra cache
+        price = self._cached(self._prices, _parse_price_or_zero, value)
+        if price == 0 and not allow_zero:
+            raise RowError(f"giá phải lớn hơn 0: {value!r}")
+        return price
+
+    def _child_name(self, parent: Dict[str, Any], name: str) -> str:
+        """
+        Spelling of ``name`` under ``parent``: the existing sibling's if it matches when folded.
+
+        Raises:
+            RowError: If the name collides with the price keys
+        """
+        if isinstance(parent.get(name), dict):
+            return name
+        folded = self._folded.get(id(parent))
+        if folded is None:
+            folded = self._folded[id(parent)] = {}
+            for key, value in parent.items():
+                if isinstance(value, dict):
+                    folded.setdefault(fold(key), key)
+        key = fold(name)
+        if key in _RESERVED_NAMES:
+            raise RowError(f"tên trùng khóa giá: {name}")
+        existing = folded.get(key)
+        if existing is not None:
+            self.report.renamed += 1
+            return existing
+        folded[key] = name
+        return name
+
+    def parse_row(self, cells: Sequence[Any]) -> Tuple[List[str], Optional[Price], Optional[Price]]:
+        """
+        Extract (path, material price, labor price) from one data row.
+
+        Raises:
+            RowError: If the row is invalid
+        """
+        columns = self.columns
+
+        def cell(role: str) -> Any:
+            index = columns.get(role)
+            return cells[index] if index is not None and index < len(cells) else None
+
+        if "path" in columns and cell("path") not in (None, ""):
+            values = str(cell("path")).split(">")
+        else:
+            values = [cell(role) for role in LEVEL_COLUMNS if role != "group" or cell(role) not in (None, "")]
+        # Tên biến thể gần như không lặp lại, không đưa vào cache
+        segments = [self._name(value) for value in values[:-1]] + [normalize_name(values[-1])]
+        if not MIN_DEPTH <= len(segments) <= MAX_DEPTH:
+            raise RowError(f"đường dẫn phải có {MIN_DEPTH}-{MAX_DEPTH} cấp: {' > '.join(segments)}")
+        material = self._price(cell("material"))
+        if material is None:
+            raise RowError("thiếu giá vật tư")
+        return segments, material, self._price(cell("labor"), allow_zero=True)
+
+    def add_row(self, line: int, cells: Sequence[Any]) -> None:
+        """Validate and merge one spreadsheet row (the header row is detected first)."""
+        if self.columns is None:
+            if line <= HEADER_SCAN_ROWS:
+                self.columns = detect_columns(cells)
+                return
+            raise ValueError(f"No header row with a 'Vật tư' price and path columns in the first {HEADER_SCAN_ROWS} rows")
+        if not any(value not in (None, "") for value in cells):
+            return
+
+        self.report.rows += 1
+        try:
+            segments, material, labor = self.parse_row(cells)
+            self._merge(segments, material, labor)
+        except RowError as e:
+            self.report.reject(line, str(e))
+
+    def _merge(self, segments: List[str], material: Price, labor: Optional[Price]) -> None:
+        node = self.data
+        path: List[str] = []
+        for depth, segment in enumerate(segments):
+            name = self._child_name(node, segment)
+            path.append(name)
+            child = node.get(name)
+            if child is None:
+                child = node[name] = {}
+            if depth < len(segments) - 1 and MATERIAL_KEY in child:
+                raise RowError(f"biến thể có giá không thể chứa cấp con: {' > '.join(path)}")
+            node = child
+        path_tuple = tuple(path)
+        if _has_children(node):
+            raise RowError(f"đường dẫn là nhóm, không phải biến thể: {' > '.join(path)}")
+
+        duplicate = id(node) in self._seen
+        self._seen.add(id(node))
+        self._categories.setdefault(path_tuple[0])
+
+        before = _prices(node) or None
+        node[MATERIAL_KEY] = material
+        if "labor" in self.columns:
+            # Có cột nhân công: ô trống nghĩa là không có giá nhân công
+            if labor is None:
+                node.pop(LABOR_KEY, None)
+            else:
+                node[LABOR_KEY] = labor
+        after = _prices(node)
+        self.report.imported += 1
+
+        if duplicate:
+            # Dòng sau cùng thắng; thay đổi so với bản gốc đã được đếm ở lần gặp đầu
+            self.report.duplicates += 1
+            if id(node) in self._samples:
+                self._samples[id(node)]["after"] = after
+        elif before is None or before != after:
+            sample = self.report.record("added" if before is None else "changed", path_tuple, before, after)
+            if sample is not None:
+                self._samples[id(node)] = sample
+        else:
+            self.report.unchanged += 1
+
+    def finish(self) -> None:
+        """Apply --replace removals, prune empty nodes and count the variants."""
+        if self.columns is None:
+            raise ValueError("The price list has no header row")
+        if self.replace:
+            for category in self._categories:
+                self._remove_unseen(self.data[category], (category,))
+        self._prune(self.data)
+        self.report.variants = sum(1 for _ in iter_variants(self.data))
+        # Giải phóng chỉ mục tạm trước khi ghi file (băm phiên bản và JSON cần thêm bộ nhớ)
+        for index in (self._seen, self._folded, self._names, self._prices, self._samples):
+            index.clear()
+
+    def _remove_unseen(self, node: Dict[str, Any], prefix: Tuple[str, ...]) -> None:
+        for key in [key for key, value in node.items() if isinstance(value, dict)]:
+            child = node[key]
+            path = prefix + (key,)
+            if MATERIAL_KEY in child and id(child) not in self._seen:
+                self.report.record("removed", path, _prices(child), None)
+                for price_key in (MATERIAL_KEY, LABOR_KEY):
+                    child.pop(price_key, None)
+            self._remove_unseen(child, path)
+
+    def _prune(self, node: Dict[str, Any]) -> bool:
+        """Drop subtrees without any variant; returns True when ``node`` itself is empty."""
+        for key in [key for key, value in node.items() if isinstance(value, dict)]:
+            if self._prune(node[key]):
+                del node[key]
+        return not node
+
+
+def iter_variants(data: Dict[str, Any], prefix: Tuple[str, ...] = ()) -> Iterator[Tuple[Tuple[str, ...], Dict[str, Any]]]:
+    """Yield (path, node) for every variant of a tree, depth first (PriceCatalog row order)."""
+    for key, value in data.items():
+        if isinstance(value, dict):
+            path = prefix + (key,)
+            if MATERIAL_KEY in value:
+                yield path, value
+            yield from iter_variants(value, path)
+
+
+# --- Output ---
+
+def _atomic_write(path: str, write: Any, mode: str) -> None:
+    """Write through a temporary file and rename it over ``path``."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(temporary, mode, **({"encoding": "utf-8"} if "b" not in mode else {})) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def write_json(data: Dict[str, Any], path: str) -> None:
+    """Write a price tree in the layout of DatabaseNoiThat.json, atomically."""
+    _atomic_write(path, lambda f: json.dump(data, f, ensure_ascii=False, indent=2), "w")
+
+
+def write_snapshot(data: Dict[str, Any], path: str, version: Optional[str] = None) -> None:
+    """
+    Write a compact binary snapshot of a price tree, atomically.
+
+    Layout: SNAPSHOT_MAGIC, a little-endian uint32 header length, a JSON header
+    (format, catalog version, row and segment counts), then a zlib stream of
+    the interned segment names (NUL-separated UTF-8), the depth of every row
+    (uint8), the segment ids of every row (uint32) and the 'Vật tư', 'Nhân
+    công' (float64) and has-labor (int8) columns, in PriceCatalog row order.
+    """
+    segments: Dict[str, int] = {}
+    depths, segment_ids = array("B"), array("I")
+    material_costs, labor_costs, has_labor = array("d"), array("d"), array("b")
+    for variant_path, node in iter_variants(data):
+        depths.append(len(variant_path))
+        for segment in variant_path:
+            segment_id = segments.get(segment)
+            if segment_id is None:
+                segment_id = segments[segment] = len(segments)
+            segment_ids.append(segment_id)
+        material_costs.append(float(node[MATERIAL_KEY]))
+        labor_costs.append(float(node.get(LABOR_KEY) or 0))
+        has_labor.append(1 if LABOR_KEY in node else 0)
+
+    header = json.dumps({
+        "format": SNAPSHOT_FORMAT,
+        "version": version or tree_version(data),
+        "rows": len(depths),
+        "segments": len(segments),
+    }).encode("utf-8")
+
+    def write(f: Any) -> None:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        compressor = zlib.compressobj(6)
+        for chunk in ("\0".join(segments).encode("utf-8"), depths.tobytes(), segment_ids.tobytes(),
+                      material_costs.tobytes(), labor_costs.tobytes(), has_labor.tobytes()):
+            f.write(compressor.compress(struct.pack("<Q", len(chunk))))
+            f.write(compressor.compress(chunk))
+        f.write(compressor.flush())
+
+    _atomic_write(path, write, "wb")
+
+
+def load_snapshot(path: str) -> PriceCatalog:
+    """
+    Rebuild a PriceCatalog from a file written by write_snapshot.
+
+    Raises:
+        ValueError: If the file is not a snapshot, or its content does not
+            hash to the version in its header
+    """
+    with open(path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a catalog snapshot")
+        (header_length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length))
+        if header.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format: {header.get('format')}")
+        payload = zlib.decompress(f.read())
+
+    chunks = []
+    offset = 0
+    while offset < len(payload):
+        (length,) = struct.unpack_from("<Q", payload, offset)
+        chunks.append(payload[offset + 8:offset + 8 + length])
+        offset += 8 + length
+    names, depth_bytes, id_bytes, material_bytes, labor_bytes, labor_flags = chunks
+    segments = names.decode("utf-8").split("\0") if names else []
+    depths, segment_ids = array("B", depth_bytes), array("I", id_bytes)
+    material_costs, labor_costs, has_labor = array("d", material_bytes), array("d", labor_bytes), array("b", labor_flags)
+
+    def number(value: float) -> Price:
+        return int(value) if value.is_integer() else value
+
+    data: Dict[str, Any] = {}
+    position = 0
+    for row, depth in enumerate(depths):
+        node = data
+        for segment_id in segment_ids[position:position + depth]:
+            node = node.setdefault(segments[segment_id], {})
+        position += depth
+        node[MATERIAL_KEY] = number(material_costs[row])
+        if has_labor[row]:
+            node[LABOR_KEY] = number(labor_costs[row])
+
+    catalog = PriceCatalog(data)
+    if catalog.version != header["version"]:
+        raise ValueError(f"Snapshot content ({catalog.version}) does not match its header ({header['version']})")
+    return catalog
+
+
+def default_snapshot_path(json_path: str) -> str:
+    """Snapshot file written next to a catalog JSON file."""
+    return os.path.splitext(json_path)[0] + ".snapshot"
+
+
+def import_price_list(
+    source: str,
+    base_path: str = DATABASE_PATH,
+    output_path: Optional[str] = None,
+    snapshot_path: Optional[str] = None,
+    replace: bool = False,
+    dry_run: bool = False,
+    sheet: Optional[str] = None,
+    encoding: str = "utf-8-sig"
+) -> ImportReport:
+    """
+    Merge a supplier price list into a catalog file.
+
+    Args:
+        source: CSV or XLSX price list
+        base_path: Catalog JSON the import starts from (the diff is against it)
+        output_path: Where to write the merged JSON (defaults to ``base_path``)
+        snapshot_path: Where to also write a binary snapshot (none by default)
+        replace: Remove the variants of every category in the file that the file does not list
+        dry_run: Only compute the report, write nothing
+        sheet: Worksheet name of an XLSX file (the active sheet by default)
+        encoding: Text encoding of a CSV file
+
+    Returns:
+        The import report
+    """
+    with open(base_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    report = ImportReport(source=source, base_version=tree_version(data))
+
+    importer = CatalogImporter(data, report, replace=replace)
+    for line, cells in iter_rows(source, sheet=sheet, encoding=encoding):
+        importer.add_row(line, cells)
+    importer.finish()
+    report.new_version = tree_version(data)
+
+    if not dry_run and report.new_version != report.base_version:
+        output_path = output_path or base_path
+        if snapshot_path:
+            # Snapshot trước: khi JSON đổi (watcher nạp lại), snapshot cùng phiên bản đã sẵn sàng
+            write_snapshot(data, snapshot_path, report.new_version)
+        write_json(data, output_path)
+        report.outputs = [output_path] + ([snapshot_path] if snapshot_path else [])
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import a supplier price list (CSV/XLSX) into the price catalog")
+    parser.add_argument("source", help="CSV or XLSX price list")
+    parser.add_argument("--base", default=DATABASE_PATH, help="Catalog JSON to merge into")
+    parser.add_argument("--output", default=None, help="Merged JSON path (defaults to --base)")
+    parser.add_argument("--snapshot", nargs="?", const="", default=None,
+                        help="Also write a binary snapshot (to the given path, or <output>.snapshot)")
+    parser.add_argument("--replace", action="store_true",
+                        help="Remove variants of the categories in the file that the file does not list")
+    parser.add_argument("--dry-run", action="store_true", help="Report the diff without writing anything")
+    parser.add_argument("--sheet", default=None, help="XLSX worksheet name")
+    parser.add_argument("--encoding", default="utf-8-sig", help="CSV text encoding")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    snapshot_path = args.snapshot
+    if snapshot_path == "":
+        snapshot_path = default_snapshot_path(args.output or args.base)
+    report = import_price_list(
+        args.source, base_path=args.base, output_path=args.output, snapshot_path=snapshot_path,
+        replace=args.replace, dry_run=args.dry_run, sheet=args.sheet, encoding=args.encoding,
+    )
+    if args.json:
+        print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+    else:
+        print(report.format())
+
+
+if __name__ == "__main__":
+    main()
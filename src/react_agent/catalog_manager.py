@@ -0,0 +1,187 @@
+"""Hot reload of the price catalog.
+
+CatalogManager watches data/DatabaseNoiThat.json by mtime and size from a
+background thread. The admin endpoint can also call ``reload()`` directly,
+or change a single price with ``update_price()``, which derives the new
+catalog copy-on-write (PriceCatalog.with_price) instead of rebuilding it.
+A changed file is parsed and compiled into a new PriceCatalog off the
+request path, and its path resolver and search index are built at the same
+time. Only then is it swapped in with one reference assignment. Snapshots
+are never modified after publication. Requests wrapped in
+catalog.pinned_catalog() finish on the snapshot they started with. Caches
+scoped by ``catalog.version`` (LLM responses, quotes) stop matching once
+the version changes.
+
+Environment variables:
+
+- CATALOG_WATCH: "0" disables the file watcher (default on)
+- CATALOG_WATCH_INTERVAL: seconds between mtime checks (default 2)
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from . import catalog as catalog_module
+from .catalog import DATABASE_PATH, PriceCatalog, set_catalog
+from .catalog_import import write_json
+from .path_resolver import build_resolver
+from .search_index import build_search_index
+
+DEFAULT_WATCH = os.getenv("CATALOG_WATCH", "1").lower() not in ("0", "false", "no")
+DEFAULT_WATCH_INTERVAL = float(os.getenv("CATALOG_WATCH_INTERVAL", "2"))
+
+
+class CatalogManager:
+    """Rebuilds and atomically swaps the shared catalog when its JSON file changes.
+
+    Args:
+        path: JSON file of the price tree
+        poll_interval: Seconds between mtime checks of the watcher thread
+    """
+
+    def __init__(self, path: str = DATABASE_PATH, poll_interval: float = DEFAULT_WATCH_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.reloads = 0
+        self.updates = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.loaded_at = time.time()
+        self.last_build_seconds: Optional[float] = None
+        # Một lần rebuild tại một thời điểm (watcher và admin endpoint)
+        self._lock = threading.Lock()
+        self._file_state = self._stat()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Rebuild the catalog from the file and swap it in if its content changed.
+
+        Args:
+            force: Re-read the file even when its mtime and size are unchanged
+
+        Returns:
+            True when a new catalog version went live
+        """
+        with self._lock:
+            file_state = self._stat()
+            if not force and file_state == self._file_state:
+                return False
+            # Lỗi cũng ghi nhận trạng thái file: chỉ thử lại khi file thay đổi tiếp (ghi xong)
+            self._file_state = file_state
+            start = time.perf_counter()
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                catalog = PriceCatalog(data)
+            except (OSError, ValueError) as e:
+                # File đang được ghi dở hoặc lỗi cú pháp: giữ bản cũ
+                self.failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"--- WARNING: Catalog reload failed, keeping version {catalog_module.CATALOG.version}: {self.last_error} ---")
+                return False
+
+            self.last_error = None
+            previous = catalog_module.CATALOG.version
+            if catalog.version == previous:
+                return False
+
+            # Build the indexes before publishing so no request pays for them
+            build_resolver(catalog)
+            build_search_index(catalog)
+            set_catalog(catalog)
+
+            self.reloads += 1
+            self.loaded_at = time.time()
+            self.last_build_seconds = time.perf_counter() - start
+            print(f"--- INFO: Catalog reloaded {previous} -> {catalog.version} "
+                  f"({len(catalog)} variants, built in {self.last_build_seconds:.2f}s) ---")
+            return True
+
+    def update_price(
+        self,
+        path: Sequence[str],
+        material_cost: Optional[float] = None,
+        labor_cost: Optional[float] = None,
+        remove_labor: bool = False
+    ) -> PriceCatalog:
+        """
+        Change the price of one variant, publish the updated catalog and save it to the file.
+
+        Args:
+            path: Exact variant path
+            material_cost: New 'Vật tư' price (unchanged when None)
+            labor_cost: New 'Nhân công' price (unchanged when None)
+            remove_labor: Drop the 'Nhân công' price of the variant
+
+        Returns:
+            The published catalog
+
+        Raises:
+            KeyError: If ``path`` is not a variant of the current catalog
+            OSError: If the file cannot be written (nothing is published)
+        """
+        with self._lock:
+            previous = catalog_module.CATALOG
+            catalog = previous.with_price(path, material_cost, labor_cost, remove_labor)
+            build_resolver(catalog)
+            build_search_index(catalog)
+            write_json(catalog.data, self.path)
+            # File vừa ghi là của chính catalog này: watcher không cần nạp lại
+            self._file_state = self._stat()
+            set_catalog(catalog)
+
+            self.updates += 1
+            self.loaded_at = time.time()
+            print(f"--- INFO: Catalog price updated {previous.version} -> {catalog.version} "
+                  f"({' > '.join(path)}) ---")
+            return catalog
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            if self._stat() != self._file_state:
+                self.reload()
+
+    def start(self) -> None:
+        """Start the mtime watcher thread (idempotent)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="catalog-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the watcher thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        catalog = catalog_module.CATALOG
+        return {
+            "version": catalog.version,
+            "variants": len(catalog),
+            "path": self.path,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "updates": self.updates,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_build_seconds": self.last_build_seconds,
+            "watching": self._thread is not None and self._thread.is_alive(),
+        }
+
+
+catalog_manager = CatalogManager()
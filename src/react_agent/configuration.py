@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import os
 from dataclasses import dataclass, field, fields
 from typing import Annotated, Optional, List, Dict, Any, Union
 
@@ -20,8 +21,17 @@ class Configuration:
     model: str = "qwen3:30b"
     """The main, powerful model for complex tasks like planning and responding."""
     
-    fast_model: str = "qwen3:30b"
-    """A faster, smaller model for simpler tasks like tool selection."""
+    fast_model: Optional[str] = None
+    """A faster, smaller model for simpler tasks like summarizing, planning and tool selection (see model_policy).
+
+    Unless configured here or through the FAST_MODEL environment variable it
+    is the same as ``model``, so no node moves to a model the deployment may
+    not have pulled. In that default the per-node policy and its escalation
+    are inactive: set FAST_MODEL (e.g. ``qwen3:8b``) to enable them.
+    """
+
+    speculative_planning: bool = True
+    """Start the planner alongside the history summarizer, using the previous turn's summary."""
 
     checkpoint_saver: Optional[BaseCheckpointSaver] = field(default=None)
     """An optional checkpoint saver for persisting agent state."""
@@ -33,6 +43,10 @@ class Configuration:
 
     _context: Optional[Any] = field(default=None, repr=False)
 
+    def __post_init__(self) -> None:
+        if not self.fast_model:
+            self.fast_model = os.getenv("FAST_MODEL") or self.model
+
     @classmethod
     def from_context(cls) -> Configuration:
         """Create a Configuration instance from a RunnableConfig object."""
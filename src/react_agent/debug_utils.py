@@ -1,9 +1,165 @@
-"""Debug utilities for logging API calls and prompts."""
+"""Debug utilities for logging API calls and prompts.
 
-import os
+Records are handed to a background sink over a bounded queue and written as
+batched JSON lines to ``debug_logs/debug.jsonl``, so logging never blocks the
+request path: when the queue is full the record is dropped and counted.
+The file is rotated by size (optionally gzip-compressed), and the volume is
+controlled with environment variables:
+
+- DEBUG_LOG_LEVEL: "off", "basic" (no prompt/response bodies, only lengths)
+  or "full" (default)
+- DEBUG_LOG_SAMPLE_RATE: fraction of API calls to log (default 1.0)
+- DEBUG_LOG_MAX_BYTES / DEBUG_LOG_BACKUPS / DEBUG_LOG_GZIP: rotation settings
+"""
+
+import atexit
+import glob
+import gzip
 import json
+import os
+import queue
+import random
+import shutil
+import threading
+import time
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
+
+LOG_LEVELS = ("off", "basic", "full")
+
+DEFAULT_LOG_DIR = os.getenv("DEBUG_LOG_DIR", "debug_logs")
+DEFAULT_LOG_LEVEL = os.getenv("DEBUG_LOG_LEVEL", "full").lower()
+DEFAULT_SAMPLE_RATE = float(os.getenv("DEBUG_LOG_SAMPLE_RATE", "1.0"))
+DEFAULT_MAX_BYTES = int(os.getenv("DEBUG_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+DEFAULT_BACKUPS = int(os.getenv("DEBUG_LOG_BACKUPS", "5"))
+DEFAULT_GZIP = os.getenv("DEBUG_LOG_GZIP", "1").lower() not in ("0", "false", "no")
+
+
+class DebugLogSink:
+    """Background JSONL writer fed through a bounded queue.
+
+    Args:
+        directory: Directory of the log files
+        filename: Name of the active log file
+        max_bytes: Rotate the active file once it grows beyond this size
+        backups: Number of rotated files to keep
+        compress: Gzip rotated files
+        queue_size: Records buffered before new ones are dropped
+        batch_size: Maximum records written per flush
+        flush_interval: Seconds the writer waits to fill a batch
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_LOG_DIR,
+        filename: str = "debug.jsonl",
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backups: int = DEFAULT_BACKUPS,
+        compress: bool = DEFAULT_GZIP,
+        queue_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 0.5
+    ):
+        self.directory = directory
+        self.path = os.path.join(directory, filename)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.compress = compress
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="debug-log-sink", daemon=True)
+                    self._thread.start()
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """Queue a record without blocking; returns False if it was dropped."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Block until every queued record has been written (or the timeout expires)."""
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Dict[str, Any]] = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Lỗi ghi log không bao giờ được làm hỏng request
+                print(f"Debug log write failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in batch)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+        self.written += len(batch)
+        if os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        base, ext = os.path.splitext(self.path)
+        rotated = f"{base}-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{ext}"
+        os.replace(self.path, rotated)
+        if self.compress:
+            with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+
+        old_files = sorted(glob.glob(f"{base}-*{ext}*"))
+        for path in old_files[:max(len(old_files) - self.backups, 0)]:
+            os.remove(path)
+
+
+# Shared sink; the writer thread starts on the first record
+debug_sink = DebugLogSink()
+atexit.register(debug_sink.flush)
+
+_log_level = DEFAULT_LOG_LEVEL if DEFAULT_LOG_LEVEL in LOG_LEVELS else "full"
+_sample_rate = DEFAULT_SAMPLE_RATE
+
+
+def set_debug_logging(level: Optional[str] = None, sample_rate: Optional[float] = None) -> None:
+    """Change the log level ("off", "basic", "full") and/or API call sample rate at runtime."""
+    global _log_level, _sample_rate
+    if level is not None:
+        if level not in LOG_LEVELS:
+            raise ValueError(f"Unknown debug log level: {level}")
+        _log_level = level
+    if sample_rate is not None:
+        _sample_rate = min(max(sample_rate, 0.0), 1.0)
+
 
 def log_api_call(
     node_name: str,
@@ -12,46 +168,59 @@ def log_api_call(
     additional_info: Optional[Dict[str, Any]] = None
 ) -> str:
     """
-    Log API call details to a debug file.
-    
+    Queue API call details for the debug log.
+
     Args:
         node_name: Name of the node making the API call
         prompt: The prompt sent to the API
         response: The response received from the API
         additional_info: Additional information to log
-    
+
     Returns:
-        Path to the debug file
+        Path to the debug log file, or "" if the call was not logged
     """
-    debug_dir = "debug_logs"
-    os.makedirs(debug_dir, exist_ok=True)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]  # Include milliseconds
-    filename = f"{debug_dir}/api_call_{timestamp}_{node_name}.txt"
-    
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("=== API CALL DEBUG LOG ===\n")
-        f.write(f"Timestamp: {datetime.now()}\n")
-        f.write(f"Node: {node_name}\n")
-        f.write(f"File: {filename}\n\n")
-        
-        f.write("=== PROMPT SENT TO API ===\n")
-        f.write(prompt)
-        f.write("\n\n")
-        
-        f.write("=== RESPONSE FROM API ===\n")
-        f.write(response)
-        f.write("\n\n")
-        
-        if additional_info:
-            f.write("=== ADDITIONAL INFO ===\n")
-            f.write(json.dumps(additional_info, ensure_ascii=False, indent=2))
-            f.write("\n\n")
-        
-        f.write("=== END DEBUG LOG ===\n")
-    
-    print(f"API call logged to: {filename}")
-    return filename
+    if _log_level == "off" or (_sample_rate < 1.0 and random.random() >= _sample_rate):
+        return ""
+
+    record = {
+        "kind": "api_call",
+        "timestamp": datetime.now().isoformat(timespec="milliseconds"),
+        "node": node_name,
+        "prompt_chars": len(prompt),
+        "response_chars": len(response),
+    }
+    if _log_level == "full":
+        record["prompt"] = prompt
+        record["response"] = response
+    if additional_info:
+        # Snapshot now: callers may reuse or mutate the dict after this call
+        record["additional_info"] = json.loads(json.dumps(additional_info, ensure_ascii=False, default=str))
+
+    return debug_sink.path if debug_sink.submit(record) else ""
+
+
+def _filter_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop message bodies and long strings from a state snapshot."""
+    filtered_state = {}
+    for key, value in state.items():
+        if key == 'messages':
+            # Only log message types and lengths
+            if isinstance(value, list):
+                filtered_state[key] = [
+                    {
+                        'type': getattr(msg, 'type', 'unknown'),
+                        'content_length': len(getattr(msg, 'content', ''))
+                    }
+                    for msg in value
+                ]
+            else:
+                filtered_state[key] = str(type(value))
+        elif isinstance(value, str) and len(value) > 1000:
+            filtered_state[key] = f"[String with {len(value)} characters]"
+        else:
+            filtered_state[key] = value
+    return filtered_state
+
 
 def log_state_transition(
     from_node: str,
@@ -60,60 +229,29 @@ def log_state_transition(
     transition_reason: Optional[str] = None
 ) -> str:
     """
-    Log state transition between nodes.
-    
+    Queue a state transition between nodes for the debug log.
+
     Args:
         from_node: Name of the source node
         to_node: Name of the destination node
         state: Current state
         transition_reason: Reason for the transition
-    
+
     Returns:
-        Path to the debug file
+        Path to the debug log file, or "" if the transition was not logged
     """
-    debug_dir = "debug_logs"
-    os.makedirs(debug_dir, exist_ok=True)
-    
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-    filename = f"{debug_dir}/state_transition_{timestamp}_{from_node}_to_{to_node}.txt"
-    
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("=== STATE TRANSITION DEBUG LOG ===\n")
-        f.write(f"Timestamp: {datetime.now()}\n")
-        f.write(f"From: {from_node}\n")
-        f.write(f"To: {to_node}\n")
-        f.write(f"File: {filename}\n\n")
-        
-        if transition_reason:
-            f.write("=== TRANSITION REASON ===\n")
-            f.write(transition_reason)
-            f.write("\n\n")
-        
-        f.write("=== STATE CONTENT ===\n")
-        # Filter out sensitive or too large data
-        filtered_state = {}
-        for key, value in state.items():
-            if key == 'messages':
-                # Only log message types and lengths
-                if isinstance(value, list):
-                    filtered_state[key] = [
-                        {
-                            'type': getattr(msg, 'type', 'unknown'),
-                            'content_length': len(getattr(msg, 'content', ''))
-                        }
-                        for msg in value
-                    ]
-                else:
-                    filtered_state[key] = str(type(value))
-            elif isinstance(value, str) and len(value) > 1000:
-                filtered_state[key] = f"[String with {len(value)} characters]"
-            else:
-                filtered_state[key] = value
-        
-        f.write(json.dumps(filtered_state, ensure_ascii=False, indent=2))
-        f.write("\n\n")
-        
-        f.write("=== END DEBUG LOG ===\n")
-    
-    print(f"State transition logged to: {filename}")
-    return filename 
\ No newline at end of file
+    if _log_level == "off":
+        return ""
+
+    record = {
+        "kind": "state_transition",
+        "timestamp": datetime.now().isoformat(timespec="milliseconds"),
+        "from": from_node,
+        "to": to_node,
+        "reason": transition_reason,
+    }
+    if _log_level == "full":
+        # Snapshot now: the graph keeps mutating the state after this call
+        record["state"] = json.loads(json.dumps(_filter_state(state), ensure_ascii=False, default=str))
+
+    return debug_sink.path if debug_sink.submit(record) else ""
@@ -1,6 +1,13 @@
 """Exhaustive search utilities for budget-based material selection."""
 
-from typing import Dict, List, Tuple, Any
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple, Any
+
+import numpy as np
+
+from .catalog import get_catalog
+from .pricing import closest_to_budget, surface_costs, unit_price_matrix
 
 
 def get_all_variant_paths(data: Dict, current_path: List[str] = None) -> List[List[str]]:
@@ -10,27 +17,13 @@ def get_all_variant_paths(data: Dict, current_path: List[str] = None) -> List[Li
     
     Args:
         data: Database dictionary
-        current_path: Current path being traversed
+        current_path: Path of ``data`` inside the full tree, prepended to each result
     
     Returns:
         List of paths to variant nodes
     """
-    if current_path is None:
-        current_path = []
-    
-    paths = []
-    
-    # If this is a variant node (has 'Vật tư' price)
-    if isinstance(data, dict) and 'Vật tư' in data:
-        paths.append(current_path)
-    
-    # Recursively traverse children
-    if isinstance(data, dict):
-        for key, value in data.items():
-            if isinstance(value, (dict, list)):
-                paths.extend(get_all_variant_paths(value, current_path + [key]))
-    
-    return paths
+    prefix = list(current_path or [])
+    return [prefix + list(path) for path in get_catalog(data).paths]
 
 
 def get_variant_info(data: Dict, path: List[str]) -> Dict:
@@ -44,21 +37,16 @@ def get_variant_info(data: Dict, path: List[str]) -> Dict:
     Returns:
         Dictionary with variant info or None if not found
     """
-    node = data
-    for part in path:
-        if isinstance(node, dict) and part in node:
-            node = node[part]
-        else:
-            return None
-    
-    if isinstance(node, dict) and 'Vật tư' in node:
-        return {
-            'path': path,
-            'unit_vattu': node['Vật tư'],
-            'unit_nhancong': node.get('Nhân công', 0)
-        }
+    catalog = get_catalog(data)
+    index = catalog.index_of(path)
+    if index is None:
+        return None
     
-    return None
+    return {
+        'path': path,
+        'unit_vattu': catalog.material_costs[index],
+        'unit_nhancong': catalog.labor_costs[index]
+    }
 
 
 def calculate_total_cost_for_variant(
@@ -77,7 +65,6 @@ def calculate_total_cost_for_variant(
     Returns:
         Tuple of (total_cost, surface_details)
     """
-    total_cost = 0
     surface_details = {}
     
     # Get variant info
@@ -88,12 +75,14 @@ def calculate_total_cost_for_variant(
     unit_vt = variant_info['unit_vattu']
     unit_nc = variant_info['unit_nhancong']
     
-    # Calculate cost for each surface
-    for position, surface in area_map.get('surfaces', {}).items():
-        area = float(surface.get('area', 0))
-        surface_cost = (unit_vt + unit_nc) * area
-        total_cost += surface_cost
-        
+    # Same variant everywhere: one unit price times each surface's area
+    unit_price = unit_vt + unit_nc
+    surfaces = area_map.get('surfaces', {})
+    areas = [float(surface.get('area', 0)) for surface in surfaces.values()]
+    costs = [unit_price * area for area in areas]
+    total_cost = sum(costs)
+    
+    for position, area, surface_cost in zip(surfaces, areas, costs):
         surface_details[position] = {
             'path': ' > '.join(variant_path),
             'area': area,
@@ -106,100 +95,176 @@ def calculate_total_cost_for_variant(
     return total_cost, surface_details
 
 
+# Wall-clock limit (seconds) for the branch-and-bound solver before it returns
+# its best-so-far combination instead of a proven optimum.
+DEFAULT_TIME_BUDGET = 1.0
+
+
+class _SearchTimeout(Exception):
+    """Raised inside the branch-and-bound search when the time budget runs out."""
+
+
+def _solve_branch_and_bound(
+    cost_lists: List[List[float]],
+    budget: float,
+    time_budget: Optional[float] = DEFAULT_TIME_BUDGET
+) -> Tuple[List[int], float, bool]:
+    """
+    Pick one cost per surface so that the total is as close to the budget as
+    possible without exceeding it (multiple-choice subset sum).
+
+    Each cost list must be sorted in descending order. Adjacent surfaces with
+    identical cost lists are interchangeable, so their choices are kept in
+    non-increasing cost order to skip permutations of the same multiset.
+    If no combination fits, the cheapest combination is returned.
+
+    Returns:
+        Tuple of (chosen index per surface, total cost, proven optimal)
+    """
+    n = len(cost_lists)
+    min_rem = [0.0] * (n + 1)
+    max_rem = [0.0] * (n + 1)
+    for i in reversed(range(n)):
+        min_rem[i] = min_rem[i + 1] + cost_lists[i][-1]
+        max_rem[i] = max_rem[i + 1] + cost_lists[i][0]
+
+    if min_rem[0] > budget:
+        return [len(costs) - 1 for costs in cost_lists], min_rem[0], True
+
+    same_as_prev = [i > 0 and cost_lists[i] == cost_lists[i - 1] for i in range(n)]
+    negated = [[-c for c in costs] for costs in cost_lists]
+    deadline = time.perf_counter() + time_budget if time_budget is not None else None
+
+    choice = [0] * n
+    best = {"total": -1.0, "choice": None}
+    nodes = 0
+
+    def search(i: int, partial: float) -> bool:
+        """Explore surfaces i..n-1; return True once the budget is hit exactly."""
+        nonlocal nodes
+        nodes += 1
+        if deadline is not None and nodes % 1024 == 0 and time.perf_counter() > deadline:
+            raise _SearchTimeout()
+
+        # Upper bound: even the most expensive completion cannot beat the incumbent
+        if partial + max_rem[i] <= best["total"]:
+            return False
+
+        # If the most expensive completion fits, it is the best in this subtree
+        if partial + max_rem[i] <= budget:
+            total = partial
+            for j in range(i, n):
+                choice[j] = choice[j - 1] if same_as_prev[j] else 0
+                total += cost_lists[j][choice[j]]
+            if total > best["total"]:
+                best["total"] = total
+                best["choice"] = list(choice)
+            return total == budget
+
+        # Skip candidates that leave no room for the cheapest completion
+        limit = budget - partial - min_rem[i + 1]
+        lo = choice[i - 1] if same_as_prev[i] else 0
+        start = max(lo, bisect_left(negated[i], -limit))
+        for j in range(start, len(cost_lists[i])):
+            cost = cost_lists[i][j]
+            if partial + cost + max_rem[i + 1] <= best["total"]:
+                break
+            choice[i] = j
+            if search(i + 1, partial + cost):
+                return True
+        return False
+
+    try:
+        search(0, 0.0)
+        optimal = True
+    except _SearchTimeout:
+        optimal = False
+
+    return best["choice"], best["total"], optimal
+
+
 def find_best_variant_for_budget(
     data: Dict, 
     area_map: Dict, 
-    budget: float
+    budget: float,
+    solver: str = "branch_and_bound",
+    time_budget: Optional[float] = DEFAULT_TIME_BUDGET
 ) -> Tuple[Dict, str]:
     """
     Find the best combination of variants for all surfaces, respecting each surface's path prefix.
     For each surface, only consider variants that match the provided path (category, material_type, subtype, variant).
-    """
-    from itertools import product
 
+    The best combination is the one closest to the budget without exceeding it; if nothing
+    fits, the cheapest combination is returned instead.
+
+    Args:
+        data: Database dictionary
+        area_map: Area map with surface paths and areas
+        budget: Total budget in VND
+        solver: "branch_and_bound" (pruned search, default) or "exhaustive" (full Cartesian product)
+        time_budget: Seconds the branch-and-bound solver may run before returning its
+            best-so-far answer; None for no limit
+
+    Returns:
+        Tuple of (result, status message). ``result["summary"]["optimal"]`` is False when the
+        solver stopped on its time budget.
+    """
     surfaces = area_map.get('surfaces', {})
     if not surfaces:
         return None, "Không có hạng mục nào để báo giá."
 
-    # For each surface, get all matching variant paths
+    # For each surface, get all matching variant rows
+    catalog = get_catalog(data)
     surface_variants = {}
     for position, surface in surfaces.items():
         path_prefix = surface.get('path', [])
-        # Nếu user cung cấp đến variant (tức là path trỏ đến node có 'Vật tư'), chỉ lấy đúng path đó
-        node = data
-        is_variant = False
-        for part in path_prefix:
-            if isinstance(node, dict) and part in node:
-                node = node[part]
-            else:
-                node = None
-                break
-        if node and isinstance(node, dict) and 'Vật tư' in node:
-            # Đã đến variant cụ thể
-            surface_variants[position] = [path_prefix]
-            continue
-        # Nếu chưa đến variant, vét cạn các variant path bắt đầu bằng path_prefix
-        all_variants = get_all_variant_paths(data)
-        matching_variants = [p for p in all_variants if p[:len(path_prefix)] == path_prefix]
-        if not matching_variants:
+        # Nếu user cung cấp đến variant thì chỉ lấy đúng path đó,
+        # nếu chưa đến variant thì lấy các variant path bắt đầu bằng path_prefix
+        span = catalog.span(path_prefix)
+        if span is None or span[0] == span[1]:
             return None, f"Không tìm thấy vật liệu phù hợp cho hạng mục '{position}' với path {path_prefix}"
-        surface_variants[position] = matching_variants
+        surface_variants[position] = range(*span)
 
-    # Sinh tất cả tổ hợp variant cho các surfaces
-    all_positions = list(surface_variants.keys())
-    all_variant_lists = [surface_variants[pos] for pos in all_positions]
-    best_combo = None
-    best_cost = float('inf')
-    best_details = {}
-    best_diff = float('inf')
-
-    for combo in product(*all_variant_lists):
-        total_cost = 0
-        details = {}
-        for idx, variant_path in enumerate(combo):
-            position = all_positions[idx]
-            surface = surfaces[position]
-            area = float(surface.get('area', 0))
-            variant_info = get_variant_info(data, variant_path)
-            if not variant_info:
-                total_cost = float('inf')
-                break
-            unit_vt = variant_info['unit_vattu']
-            unit_nc = variant_info['unit_nhancong']
-            surface_cost = (unit_vt + unit_nc) * area
-            total_cost += surface_cost
-            details[position] = {
-                'path': ' > '.join(variant_path),
-                'area': area,
-                'unit_vattu': unit_vt,
-                'unit_nhancong': unit_nc,
-                'total_cost': surface_cost,
-                'type': 'specific'
-            }
-        if total_cost == float('inf'):
-            continue
-        diff = abs(total_cost - budget)
-        if total_cost <= budget and diff < best_diff:
-            best_combo = combo
-            best_cost = total_cost
-            best_details = details
-            best_diff = diff
-        elif total_cost > budget and best_combo is None:
-            if diff < best_diff:
-                best_combo = combo
-                best_cost = total_cost
-                best_details = details
-                best_diff = diff
-
-    if not best_details:
+    # Price every candidate of every surface in one batch
+    positions = list(surface_variants)
+    areas = [float(surfaces[position].get('area', 0)) for position in positions]
+    unit_prices, rows = unit_price_matrix(catalog, [surface_variants[position] for position in positions])
+    costs = surface_costs(unit_prices, areas)
+
+    if solver == "exhaustive":
+        chosen, _ = closest_to_budget(costs, budget)
+        optimal = True
+    elif solver == "branch_and_bound":
+        chosen, optimal = _search_branch_and_bound(costs, budget, time_budget)
+    else:
+        raise ValueError(f"Unknown budget solver: {solver}")
+
+    if chosen is None:
         return None, "Không tìm được phương án phù hợp với ngân sách."
 
+    best_cost = 0
+    best_details = {}
+    for i, position in enumerate(positions):
+        row = int(rows[i, chosen[i]])
+        surface_cost = float(costs[i, chosen[i]])
+        best_cost += surface_cost
+        best_details[position] = {
+            'path': ' > '.join(catalog.paths[row]),
+            'area': areas[i],
+            'unit_vattu': catalog.material_costs[row],
+            'unit_nhancong': catalog.labor_costs[row],
+            'total_cost': surface_cost,
+            'type': 'specific'
+        }
+
     result = {
         "results": best_details,
         "summary": {
             "total_budget": budget,
             "total_cost_min": best_cost,
-            "total_cost_max": best_cost
+            "total_cost_max": best_cost,
+            "optimal": optimal,
+            "catalog_version": catalog.version
         }
     }
     if best_cost <= budget:
@@ -207,3 +272,36 @@ def find_best_variant_for_budget(
     else:
         result["summary"]["status"] = "Tổng chi phí VƯỢT ngân sách."
     return result, "Thành công"
+
+
+def _search_branch_and_bound(
+    costs: np.ndarray,
+    budget: float,
+    time_budget: Optional[float]
+) -> Tuple[Optional[List[int]], bool]:
+    """Run the branch-and-bound solver over a (surfaces, variants) cost matrix.
+
+    Returns:
+        Tuple of (chosen column per surface, proven optimal)
+    """
+    # Per surface: distinct costs, most expensive first, each with its first column
+    candidates = []
+    for surface_costs_row in costs:
+        values, first_columns = np.unique(surface_costs_row[~np.isnan(surface_costs_row)], return_index=True)
+        candidates.append((values[::-1].tolist(), first_columns[::-1].tolist()))
+
+    # Put interchangeable surfaces next to each other, widest price spread first
+    order = sorted(
+        range(len(candidates)),
+        key=lambda i: (-(candidates[i][0][0] - candidates[i][0][-1]), candidates[i][0])
+    )
+    cost_lists = [candidates[i][0] for i in order]
+
+    chosen, _, optimal = _solve_branch_and_bound(cost_lists, budget, time_budget)
+    if chosen is None:
+        return None, optimal
+
+    columns = [0] * len(candidates)
+    for i, idx in zip(order, chosen):
+        columns[i] = candidates[i][1][idx]
+    return columns, optimal
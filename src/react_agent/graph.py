@@ -10,7 +10,8 @@ from langgraph.prebuilt import ToolNode
 from langchain_core.prompts import ChatPromptTemplate
 
 from .state import State
-from .agents.planner import history_summarizer_node, planner_node
+from .agents.planner import history_summarizer_node, planner_node, speculative_planner_node
+from .configuration import Configuration
 from .agents.executor import executor_node
 from .agents.responder import responder_node
 from .new_tools import execute_tool
@@ -40,21 +41,34 @@ def should_execute_tools(state: State) -> Literal["executor", "responder"]:
     )
     return "responder"
 
-def create_graph():
-    """Creates the LangGraph instance with all the nodes and edges."""
+def create_graph(speculative: bool = None):
+    """Creates the LangGraph instance with all the nodes and edges.
+
+    Args:
+        speculative: Run the summarizer and planner concurrently in one node
+            (defaults to Configuration.speculative_planning)
+    """
+    if speculative is None:
+        speculative = Configuration.from_context().speculative_planning
     
     builder = StateGraph(State)
     
-    builder.add_node("history_summarizer", history_summarizer_node)
-    builder.add_node("planner", planner_node)
+    if speculative:
+        planning_node = "speculative_planner"
+        builder.add_node(planning_node, speculative_planner_node)
+        builder.set_entry_point(planning_node)
+    else:
+        planning_node = "planner"
+        builder.add_node("history_summarizer", history_summarizer_node)
+        builder.add_node(planning_node, planner_node)
+        builder.set_entry_point("history_summarizer")
+        builder.add_edge("history_summarizer", planning_node)
+    
     builder.add_node("executor", executor_node)
     builder.add_node("responder", responder_node)
     
-    builder.set_entry_point("history_summarizer")
-    builder.add_edge("history_summarizer", "planner")
-    
     builder.add_conditional_edges(
-        "planner",
+        planning_node,
         should_execute_tools,
         {
             "executor": "executor",
@@ -0,0 +1,154 @@
+"""Image pre-processing before the vision model.
+
+Phone photos (12+ MP, several MB) are normalized before they are sent:
+EXIF orientation is applied, the long edge is capped, and the image is
+re-encoded as JPEG or WebP without any metadata. This shrinks the upload
+to the model, its token cost and latency, and gives the vision cache a
+canonical image to hash.
+"""
+
+import io
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Union
+
+from PIL import Image, ImageOps
+
+ImageInput = Union[str, bytes, bytearray, memoryview, Image.Image]
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+@dataclass
+class PreprocessConfig:
+    """Settings of the pre-processing stage."""
+
+    enabled: bool = True
+    """Set to False to send images exactly as uploaded."""
+
+    max_long_edge: int = 1568
+    """Longest side in pixels after downscaling (smaller images are never upscaled)."""
+
+    format: str = "JPEG"
+    """Re-encode format: "JPEG" or "WEBP"."""
+
+    quality: int = 85
+    """Encoder quality (1-100)."""
+
+    @classmethod
+    def from_env(cls) -> "PreprocessConfig":
+        """Build the configuration from VISION_PREPROCESS_* environment variables."""
+        return cls(
+            enabled=os.getenv("VISION_PREPROCESS", "1").lower() not in ("0", "false", "no"),
+            max_long_edge=int(os.getenv("VISION_PREPROCESS_MAX_EDGE", "1568")),
+            format=os.getenv("VISION_PREPROCESS_FORMAT", "JPEG").upper(),
+            quality=int(os.getenv("VISION_PREPROCESS_QUALITY", "85")),
+        )
+
+    def signature(self) -> str:
+        """Short description of the settings, part of the vision cache key."""
+        if not self.enabled:
+            return "raw"
+        return f"{self.format}-{self.max_long_edge}-q{self.quality}"
+
+
+@dataclass
+class PreparedImage:
+    """An image ready for the vision model, with its pre-processing stats."""
+
+    image: Image.Image
+    data: Optional[bytes] = None
+    mime_type: Optional[str] = None
+    stats: Dict[str, Any] = field(default_factory=dict)
+
+    def as_content(self) -> Any:
+        """The image part of a vision request: an inline blob, or the PIL image when not re-encoded."""
+        if self.data is None:
+            return self.image
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+# Running totals over every image processed in this process
+PREPROCESS_TOTALS = {"images": 0, "original_bytes": 0, "processed_bytes": 0, "total_ms": 0.0}
+_totals_lock = threading.Lock()
+
+
+def _read_input(image_input: ImageInput) -> tuple:
+    """Return (opened image, original byte count)."""
+    if isinstance(image_input, Image.Image):
+        return image_input, 0
+    if isinstance(image_input, str):
+        with open(image_input, "rb") as f:
+            raw = f.read()
+    else:
+        raw = bytes(image_input)
+    return Image.open(io.BytesIO(raw)), len(raw)
+
+
+def preprocess_image(image_input: ImageInput, config: PreprocessConfig) -> PreparedImage:
+    """
+    Decode, orient, downscale and re-encode one image.
+
+    Args:
+        image_input: A file path, raw image bytes or a PIL image
+        config: Pre-processing settings
+
+    Returns:
+        The prepared image, with byte counts, pixel sizes and timings in ``stats``
+    """
+    start = time.perf_counter()
+    image, original_bytes = _read_input(image_input)
+    image.load()
+    decoded = time.perf_counter()
+    original_size = image.size
+
+    if not config.enabled:
+        return PreparedImage(image=image, stats={
+            "original_bytes": original_bytes,
+            "processed_bytes": original_bytes,
+            "original_size": original_size,
+            "processed_size": original_size,
+            "decode_ms": (decoded - start) * 1000,
+            "process_ms": 0.0,
+        })
+
+    # Xoay ảnh theo EXIF rồi mới thu nhỏ, để cạnh dài được tính đúng
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    if max(image.size) > config.max_long_edge:
+        image.thumbnail((config.max_long_edge, config.max_long_edge), Image.LANCZOS)
+
+    # Re-encoding from raw pixels drops EXIF, GPS and every other metadata block
+    buffer = io.BytesIO()
+    image.save(buffer, format=config.format, quality=config.quality, optimize=True)
+    data = buffer.getvalue()
+    finished = time.perf_counter()
+
+    stats = {
+        "original_bytes": original_bytes,
+        "processed_bytes": len(data),
+        "original_size": original_size,
+        "processed_size": image.size,
+        "decode_ms": (decoded - start) * 1000,
+        "process_ms": (finished - decoded) * 1000,
+    }
+    with _totals_lock:
+        PREPROCESS_TOTALS["images"] += 1
+        PREPROCESS_TOTALS["original_bytes"] += original_bytes
+        PREPROCESS_TOTALS["processed_bytes"] += len(data)
+        PREPROCESS_TOTALS["total_ms"] += (finished - start) * 1000
+
+    logging.info(
+        f"Preprocessed image {original_size[0]}x{original_size[1]} ({original_bytes:,} bytes) -> "
+        f"{image.size[0]}x{image.size[1]} ({len(data):,} bytes) "
+        f"in {stats['decode_ms']:.0f} + {stats['process_ms']:.0f} ms"
+    )
+    return PreparedImage(image=image, data=data, mime_type=_MIME_TYPES.get(config.format, "image/jpeg"), stats=stats)
+
+
+# Settings used by the vision pipeline
+PREPROCESS_CONFIG = PreprocessConfig.from_env()
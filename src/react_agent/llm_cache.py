@@ -0,0 +1,360 @@
+"""Response cache for the chat models used by the graph nodes.
+
+Entries are keyed on the graph node, the model name, a hash of the
+whitespace-normalized prompt and the price catalog version, so a catalog
+edit invalidates every cached answer that may quote its prices. Lookups go
+through an in-memory LRU tier first and a SQLite tier second, both with a
+TTL. The SQLite file is opened on first use.
+
+An optional semantic tier returns the answer of a near-identical request
+(cosine similarity over a pluggable embedding function) when the exact
+lookup misses. It only compares the variable part of a prompt (user input,
+history, tool results) that the caller passes as ``semantic_text``, never
+the fixed node template, which would otherwise dominate the embedding and
+make unrelated questions look alike. It matches within one node and model.
+Numbers (areas, budgets) are left out of the embedding and must match
+exactly, so "sàn 20m2" never reuses the answer given for "sàn 25m2".
+
+SQLite access and the semantic scan are blocking, so CachedChatModel runs
+them in a worker thread instead of on the event loop.
+"""
+
+import asyncio
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage
+
+from .catalog import get_catalog
+
+Embedder = Callable[[str], Sequence[float]]
+
+_current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Defaults, overridable through the environment
+DEFAULT_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", os.path.join(_current_dir, '..', '..', 'llm_cache', 'llm_cache.db')
+)
+DEFAULT_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", str(24 * 3600)))
+DEFAULT_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+
+# Entries compared per semantic lookup (most recent first)
+SEMANTIC_SCAN_LIMIT = 2000
+
+
+def normalize_prompt(prompt: Any) -> str:
+    """Render a prompt (string, message list or prompt value) as whitespace-normalized text."""
+    if isinstance(prompt, str):
+        text = prompt
+    elif isinstance(prompt, (list, tuple)):
+        text = "\n".join(
+            f"{getattr(message, 'type', 'text')}: {getattr(message, 'content', message)}" for message in prompt
+        )
+    elif hasattr(prompt, "to_string"):
+        text = prompt.to_string()
+    else:
+        text = str(prompt)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def semantic_text(*parts: Any) -> str:
+    """Join the variable parts of a prompt (skipping empty ones) for semantic matching."""
+    return "\n".join(str(part) for part in parts if part not in (None, "", [], {}))
+
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+
+def split_numbers(text: str) -> Tuple[str, str]:
+    """Split text into (text without numbers, its numbers in order) for semantic matching."""
+    return _NUMBER.sub(" ", text), " ".join(_NUMBER.findall(text))
+
+
+def hashed_ngram_embedding(text: str, dimensions: int = 256) -> List[float]:
+    """Cheap local embedding: character trigram counts hashed into a fixed-size unit vector."""
+    vector = [0.0] * dimensions
+    text = text.casefold()
+    for i in range(max(len(text) - 2, 0)):
+        bucket = int.from_bytes(hashlib.blake2b(text[i:i + 3].encode("utf-8"), digest_size=4).digest(), "little")
+        vector[bucket % dimensions] += 1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return struct.pack(f"<{len(vector)}f", *vector)
+
+
+def _unpack(blob: bytes) -> Tuple[float, ...]:
+    return struct.unpack(f"<{len(blob) // 4}f", blob)
+
+
+class LLMCache:
+    """Two-tier (memory + SQLite) exact-match cache with optional semantic lookup.
+
+    Args:
+        path: SQLite database file; None keeps the cache in memory only
+        ttl_seconds: Age after which entries are ignored and purged
+        memory_entries: Size of the in-memory LRU tier
+        embedder: Embedding function enabling semantic lookup (None disables it)
+        similarity_threshold: Minimum cosine similarity for a semantic hit
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = DEFAULT_CACHE_PATH,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        embedder: Optional[Embedder] = None,
+        similarity_threshold: float = 0.97
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0}
+
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """SQLite connection, opened (and the directory created) on first use; call with the lock held."""
+        if self._connection is None and self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            with self._connection:
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    "key TEXT PRIMARY KEY, "
+                    "scope TEXT NOT NULL, "
+                    "response TEXT NOT NULL, "
+                    "embedding BLOB, "
+                    "numbers TEXT, "
+                    "created_at REAL NOT NULL)"
+                )
+                columns = {row[1] for row in self._connection.execute("PRAGMA table_info(responses)")}
+                if "numbers" not in columns:
+                    # Cache tạo bởi phiên bản cũ: các dòng cũ không bao giờ khớp theo ngữ nghĩa
+                    self._connection.execute("ALTER TABLE responses ADD COLUMN numbers TEXT")
+                self._connection.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_responses_scope ON responses (scope, created_at)"
+                )
+        return self._connection
+
+    @staticmethod
+    def scope(model_name: str, catalog_version: str, node_name: Optional[str] = None) -> str:
+        """Entries can only match within one (node, model, catalog version) scope."""
+        return f"{node_name or '-'}:{model_name}@{catalog_version}"
+
+    @staticmethod
+    def key(scope: str, normalized_prompt: str) -> str:
+        prompt_hash = hashlib.sha256(normalized_prompt.encode("utf-8")).hexdigest()
+        return hashlib.sha256(f"{scope}:{prompt_hash}".encode("utf-8")).hexdigest()
+
+    def _fresh(self, created_at: float) -> bool:
+        return time.time() - created_at <= self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, response: str) -> None:
+        self._memory[key] = (created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(
+        self,
+        model_name: str,
+        catalog_version: str,
+        prompt: Any,
+        node_name: Optional[str] = None,
+        semantic_text: Optional[str] = None
+    ) -> Optional[str]:
+        """
+        Return a cached response for the prompt, or None.
+
+        Args:
+            model_name: Model the response must come from
+            catalog_version: Price catalog version the response must be based on
+            prompt: Full prompt (exact lookup)
+            node_name: Graph node issuing the call
+            semantic_text: Variable part of the prompt; the semantic tier is
+                only consulted when it is given
+        """
+        scope = self.scope(model_name, catalog_version, node_name)
+        normalized = normalize_prompt(prompt)
+        key = self.key(scope, normalized)
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and self._fresh(entry[0]):
+                self._memory.move_to_end(key)
+                self.metrics["memory_hits"] += 1
+                return entry[1]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and self._fresh(row[1]):
+                    self._remember(key, row[1], row[0])
+                    self.metrics["disk_hits"] += 1
+                    return row[0]
+
+            if self.embedder is not None and semantic_text and self._db is not None:
+                response = self._semantic_lookup(scope, *split_numbers(normalize_prompt(semantic_text)))
+                if response is not None:
+                    self.metrics["semantic_hits"] += 1
+                    return response
+
+            self.metrics["misses"] += 1
+            return None
+
+    def _semantic_lookup(self, scope: str, text: str, numbers: str) -> Optional[str]:
+        query = self.embedder(text)
+        rows = self._db.execute(
+            "SELECT response, embedding FROM responses "
+            "WHERE scope = ? AND numbers = ? AND embedding IS NOT NULL AND created_at >= ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (scope, numbers, time.time() - self.ttl_seconds, SEMANTIC_SCAN_LIMIT)
+        ).fetchall()
+        best_score, best_response = 0.0, None
+        for response, blob in rows:
+            score = _cosine(query, _unpack(blob))
+            if score > best_score:
+                best_score, best_response = score, response
+        return best_response if best_score >= self.similarity_threshold else None
+
+    def put(
+        self,
+        model_name: str,
+        catalog_version: str,
+        prompt: Any,
+        response: str,
+        node_name: Optional[str] = None,
+        semantic_text: Optional[str] = None
+    ) -> None:
+        """Store a response (empty responses are never cached); arguments as in ``get``."""
+        if not response:
+            return
+        scope = self.scope(model_name, catalog_version, node_name)
+        normalized = normalize_prompt(prompt)
+        key = self.key(scope, normalized)
+        created_at = time.time()
+        embedding = numbers = None
+        if self.embedder is not None and semantic_text:
+            text, numbers = split_numbers(normalize_prompt(semantic_text))
+            embedding = _pack(self.embedder(text))
+
+        with self._lock:
+            self._remember(key, created_at, response)
+            if self._db is not None:
+                with self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses (key, scope, response, embedding, numbers, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, scope, response, embedding, numbers, created_at)
+                    )
+            self.metrics["stores"] += 1
+
+    def purge_expired(self) -> int:
+        """Delete expired entries from both tiers; returns the number of disk rows removed."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            for key in [k for k, (created_at, _) in self._memory.items() if created_at < cutoff]:
+                del self._memory[key]
+            if self._db is None:
+                return 0
+            with self._db:
+                return self._db.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and hit rate."""
+        with self._lock:
+            stats = dict(self.metrics)
+        hits = stats["memory_hits"] + stats["disk_hits"] + stats["semantic_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
+
+
+class CachedChatModel:
+    """Wraps a chat model so ``ainvoke(prompt)`` is answered from an LLMCache when possible.
+
+    Cache hits return an AIMessage without calling the model; everything else
+    (streaming, tools, attributes) is delegated to the wrapped model. The
+    ``cache_node`` and ``semantic_text`` keyword arguments of ``ainvoke`` scope
+    the entry to a graph node and enable the semantic tier (see LLMCache.get).
+    Lookups and stores run in a worker thread so they never block the event loop.
+    """
+
+    def __init__(self, model: Any, cache: "LLMCache", model_name: Optional[str] = None):
+        self.model = model
+        self.cache = cache
+        self.model_name = model_name or getattr(model, "model", None) or type(model).__name__
+
+    async def ainvoke(
+        self,
+        prompt: Any,
+        *args,
+        cache_node: Optional[str] = None,
+        semantic_text: Optional[str] = None,
+        **kwargs
+    ) -> Any:
+        catalog_version = get_catalog().version
+        cached = await asyncio.to_thread(
+            self.cache.get, self.model_name, catalog_version, prompt, cache_node, semantic_text
+        )
+        if cached is not None:
+            print(f"LLM cache hit ({self.model_name})")
+            return AIMessage(content=cached)
+
+        response = await self.model.ainvoke(prompt, *args, **kwargs)
+        content = getattr(response, "content", None)
+        if isinstance(content, str):
+            await asyncio.to_thread(
+                self.cache.put, self.model_name, catalog_version, prompt, content, cache_node, semantic_text
+            )
+        return response
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
+
+
+def _create_default_cache() -> Optional[LLMCache]:
+    if os.getenv("LLM_CACHE", "1").lower() in ("0", "false", "no"):
+        return None
+    threshold = os.getenv("LLM_CACHE_SEMANTIC_THRESHOLD")
+    return LLMCache(
+        embedder=hashed_ngram_embedding if threshold else None,
+        similarity_threshold=float(threshold) if threshold else 0.97
+    )
+
+
+# Shared cache instance (None when LLM_CACHE=0)
+llm_cache = _create_default_cache()
+
+
+def with_cache(model: Any, model_name: Optional[str] = None) -> Any:
+    """Wrap a chat model with the shared cache, or return it unchanged when caching is off."""
+    if llm_cache is None:
+        return model
+    return CachedChatModel(model, llm_cache, model_name)
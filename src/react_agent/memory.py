@@ -1,10 +1,13 @@
 """
 Memory manager for the simplified agent.
 """
+import hashlib
 import json
 import os
 from typing import Dict, Any, List, Optional, Union
 
+from .session_store import is_valid_session_id
+
 class MemoryManager:
     """
     Simple memory manager to store and retrieve user-specific memories.
@@ -12,10 +15,16 @@ class MemoryManager:
     def __init__(self, storage_dir: str = "user_memories"):
         self.storage_dir = storage_dir
         os.makedirs(storage_dir, exist_ok=True)
+
+    def _file_path(self, session_id: str) -> str:
+        """Memory file of a session; the id must not be able to leave storage_dir."""
+        if not is_valid_session_id(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        return os.path.join(self.storage_dir, f"{session_id}.json")
         
     def save_memory(self, session_id: str, key: str, value: Dict[str, Any]) -> None:
         """Save a memory value for a specific session and key."""
-        file_path = os.path.join(self.storage_dir, f"{session_id}.json")
+        file_path = self._file_path(session_id)
         
         try:
             # Load existing memories or create new dict
@@ -36,7 +45,7 @@ class MemoryManager:
     
     def get_memory(self, session_id: str, key: str) -> Optional[Dict[str, Any]]:
         """Retrieve a memory value for a specific session and key."""
-        file_path = os.path.join(self.storage_dir, f"{session_id}.json")
+        file_path = self._file_path(session_id)
         
         try:
             if os.path.exists(file_path):
@@ -50,7 +59,7 @@ class MemoryManager:
 
     def get_all_memories(self, session_id: str) -> Dict[str, Any]:
         """Get all memories for a session."""
-        file_path = os.path.join(self.storage_dir, f"{session_id}.json")
+        file_path = self._file_path(session_id)
         
         try:
             if os.path.exists(file_path):
@@ -167,6 +176,53 @@ class QuoteMemory:
         import time
         return int(time.time())
 
+class SummaryMemory:
+    """
+    Stores the rolling history summary of a session so that each turn only
+    summarizes the messages added since the previous one.
+    """
+    def __init__(self, memory_manager: MemoryManager):
+        self.memory_manager = memory_manager
+        self.memory_key = "history_summary"
+    
+    @staticmethod
+    def message_digest(message_type: str, content: Any) -> str:
+        """Short, stable digest of one message, used as the summarization watermark."""
+        text = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(f"{message_type}:{text}".encode("utf-8")).hexdigest()[:16]
+    
+    def get_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Retrieve the stored summary state.
+        
+        Args:
+            session_id: User session identifier
+            
+        Returns:
+            Dictionary with history_summary, area_map, budget, events_summary and
+            message_digests (the messages already summarized), or None
+        """
+        return self.memory_manager.get_memory(session_id, self.memory_key)
+    
+    def save_summary(self, session_id: str, summary: Dict[str, Any], message_digests: List[str]) -> None:
+        """
+        Save the summary state together with its message watermark.
+        
+        Args:
+            session_id: User session identifier
+            summary: Structured summary (history_summary, area_map, budget, events_summary)
+            message_digests: Digests of every message covered by the summary
+        """
+        record = {
+            "history_summary": summary.get("history_summary"),
+            "area_map": summary.get("area_map") or {},
+            "budget": summary.get("budget"),
+            "events_summary": summary.get("events_summary") or [],
+            "message_digests": message_digests,
+        }
+        self.memory_manager.save_memory(session_id, self.memory_key, record)
+
 # Create singleton instances
 memory_manager = MemoryManager()
-quote_memory = QuoteMemory(memory_manager) 
\ No newline at end of file
+quote_memory = QuoteMemory(memory_manager)
+summary_memory = SummaryMemory(memory_manager) 
\ No newline at end of file
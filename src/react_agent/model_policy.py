@@ -0,0 +1,142 @@
+"""Per-node model selection with escalation and latency accounting.
+
+Each graph node is mapped to a tier, which is the name of a Configuration
+field: ``fast_model`` for the cheap calls (history summary, subtask to tool
+call conversion, planning) and ``model`` for the user-facing answer. When a
+node's output must parse (a plan or a tool call), a failed parse or error
+from the fast model escalates the call once to the main model.
+
+``fast_model`` defaults to ``model``: until FAST_MODEL (or the ``fast_model``
+configurable) names a smaller model, every node runs on the main model and
+escalation never triggers.
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .configuration import Configuration
+from .llm_cache import CachedChatModel
+from .model_registry import get_chat_model
+from .tracing import record_token_usage, span
+
+# Node -> Configuration field holding the model to use
+NODE_MODEL_POLICY = {
+    "history_summarizer": "fast_model",
+    "planner": "fast_model",
+    "subtask_converter": "fast_model",
+    "responder": "model",
+}
+
+# Tier used when a fast-model answer cannot be used
+ESCALATION_TIER = "model"
+
+_stats_lock = threading.Lock()
+_node_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def model_name_for_node(node_name: str, config: Optional[Configuration] = None, tier: Optional[str] = None) -> str:
+    """Model name a node should use under the current run's configuration."""
+    config = config or Configuration.from_context()
+    return getattr(config, tier or NODE_MODEL_POLICY.get(node_name, "model"))
+
+
+def _record(node_name: str, model_name: str, elapsed_ms: float, escalated: bool = False, failed: bool = False) -> None:
+    with _stats_lock:
+        stats = _node_stats.setdefault(node_name, {
+            "calls": 0, "total_ms": 0.0, "max_ms": 0.0, "escalations": 0, "failures": 0, "models": {}
+        })
+        stats["calls"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        stats["escalations"] += int(escalated)
+        stats["failures"] += int(failed)
+        stats["models"][model_name] = stats["models"].get(model_name, 0) + 1
+
+
+def node_latency_stats() -> Dict[str, Dict[str, Any]]:
+    """Per-node call counts, latencies (ms), escalations and model usage."""
+    with _stats_lock:
+        result = {}
+        for node_name, stats in _node_stats.items():
+            result[node_name] = dict(stats, models=dict(stats["models"]))
+            result[node_name]["avg_ms"] = stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0
+        return result
+
+
+def reset_node_latency_stats() -> None:
+    with _stats_lock:
+        _node_stats.clear()
+
+
+async def _timed_invoke(
+    node_name: str,
+    model_name: str,
+    prompt: Any,
+    escalated: bool,
+    semantic_text: Optional[str] = None
+) -> Any:
+    model = get_chat_model(model_name)
+    # Chỉ lớp cache hiểu các tham số này; model gốc (LLM_CACHE=0) nhận prompt như cũ
+    kwargs = {"cache_node": node_name, "semantic_text": semantic_text} if isinstance(model, CachedChatModel) else {}
+    start = time.perf_counter()
+    with span(f"llm.{node_name}", model=model_name, escalated=escalated) as attributes:
+        try:
+            response = await model.ainvoke(prompt, **kwargs)
+        except Exception:
+            _record(node_name, model_name, (time.perf_counter() - start) * 1000, escalated, failed=True)
+            raise
+        _record(node_name, model_name, (time.perf_counter() - start) * 1000, escalated)
+        record_token_usage(attributes, response)
+    return response
+
+
+async def invoke_for_node(
+    node_name: str,
+    prompt: Any,
+    parse: Optional[Callable[[str], Any]] = None,
+    semantic_text: Optional[str] = None
+) -> Tuple[Any, Any]:
+    """
+    Call the node's model, escalating to the main model when the answer is unusable.
+
+    Args:
+        node_name: Key of NODE_MODEL_POLICY
+        prompt: Prompt passed to ``ainvoke``
+        parse: Optional parser of the response text; returning None or raising
+            means the answer is unusable and triggers escalation
+        semantic_text: Variable part of the prompt (user input, history, tool
+            results) for the cache's semantic tier; see llm_cache.semantic_text
+
+    Returns:
+        Tuple of (model response, parsed value or None when no parser is given)
+    """
+    config = Configuration.from_context()
+    model_name = model_name_for_node(node_name, config)
+    escalation_model = model_name_for_node(node_name, config, ESCALATION_TIER)
+    can_escalate = parse is not None and model_name != escalation_model
+
+    try:
+        response = await _timed_invoke(node_name, model_name, prompt, escalated=False, semantic_text=semantic_text)
+    except Exception as e:
+        if model_name == escalation_model:
+            raise
+        print(f"{node_name}: {model_name} failed ({e}), escalating to {escalation_model}")
+        response = await _timed_invoke(node_name, escalation_model, prompt, escalated=True, semantic_text=semantic_text)
+        return response, _try_parse(parse, response)
+
+    parsed = _try_parse(parse, response)
+    if can_escalate and parsed is None:
+        print(f"{node_name}: unusable output from {model_name}, escalating to {escalation_model}")
+        response = await _timed_invoke(node_name, escalation_model, prompt, escalated=True, semantic_text=semantic_text)
+        parsed = _try_parse(parse, response)
+    return response, parsed
+
+
+def _try_parse(parse: Optional[Callable[[str], Any]], response: Any) -> Any:
+    if parse is None:
+        return None
+    try:
+        return parse(response.content)
+    except Exception:
+        return None
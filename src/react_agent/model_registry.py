@@ -0,0 +1,132 @@
+"""Shared chat-model clients for the graph nodes.
+
+Every node asks the registry for a model by name instead of building its own
+``ChatOllama``. Clients for the same model name are created once and reused,
+and all their HTTP traffic goes through one connection pool per model (an
+httpx transport with keep-alive). The pool size doubles as the per-model
+concurrency limit: requests beyond it wait for a free connection instead of
+piling more parallel generations onto the Ollama server.
+"""
+
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+from langchain_ollama import ChatOllama
+
+from .llm_cache import with_cache
+
+# Defaults, overridable through the environment
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL") or None
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "4"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "300"))
+# How long Ollama keeps the model loaded after a request (e.g. "30m"); None uses the server default
+OLLAMA_MODEL_KEEP_ALIVE = os.getenv("OLLAMA_MODEL_KEEP_ALIVE") or None
+
+
+class ModelRegistry:
+    """Hands out one shared, pooled chat-model client per model name.
+
+    Args:
+        base_url: Ollama server URL (None uses OLLAMA_HOST or the local default)
+        max_concurrency: Connections (and so concurrent requests) per model
+        keepalive_expiry: Seconds an idle pooled connection is kept open
+        model_keep_alive: Ollama ``keep_alive`` sent with each request
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = OLLAMA_BASE_URL,
+        max_concurrency: int = OLLAMA_MAX_CONCURRENCY,
+        keepalive_expiry: float = OLLAMA_KEEPALIVE_EXPIRY,
+        model_keep_alive: Optional[str] = OLLAMA_MODEL_KEEP_ALIVE
+    ):
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.keepalive_expiry = keepalive_expiry
+        self.model_keep_alive = model_keep_alive
+        self._lock = threading.Lock()
+        self._models: Dict[str, Any] = {}
+        self._cached_models: Dict[str, Any] = {}
+        self._transports: Dict[str, tuple] = {}
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency,
+            keepalive_expiry=self.keepalive_expiry
+        )
+
+    def _create(self, model_name: str) -> ChatOllama:
+        # Một transport (connection pool) cho mỗi model, dùng chung cho mọi node
+        sync_transport = httpx.HTTPTransport(limits=self._limits())
+        async_transport = httpx.AsyncHTTPTransport(limits=self._limits())
+        self._transports[model_name] = (sync_transport, async_transport)
+        kwargs: Dict[str, Any] = {
+            "model": model_name,
+            "sync_client_kwargs": {"transport": sync_transport},
+            "async_client_kwargs": {"transport": async_transport},
+        }
+        if self.base_url:
+            kwargs["base_url"] = self.base_url
+        if self.model_keep_alive:
+            kwargs["keep_alive"] = self.model_keep_alive
+        return ChatOllama(**kwargs)
+
+    def get(self, model_name: str, cached: bool = True) -> Any:
+        """
+        Return the shared client for a model.
+
+        Args:
+            model_name: Ollama model name, e.g. "qwen3:30b"
+            cached: Wrap the client with the shared LLM response cache (see llm_cache)
+
+        Returns:
+            The chat model (the same object on every call with the same arguments)
+        """
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = self._models[model_name] = self._create(model_name)
+            if not cached:
+                return model
+            wrapped = self._cached_models.get(model_name)
+            if wrapped is None:
+                wrapped = self._cached_models[model_name] = with_cache(model)
+            return wrapped
+
+    def register(self, model_name: str, model: Any) -> None:
+        """Serve ``model`` for ``model_name`` instead of a ChatOllama client (e.g. a local stub)."""
+        with self._lock:
+            self._models[model_name] = model
+            self._cached_models.pop(model_name, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Models currently loaded and the pool settings."""
+        with self._lock:
+            return {
+                "models": sorted(self._models),
+                "max_concurrency": self.max_concurrency,
+                "keepalive_expiry": self.keepalive_expiry,
+            }
+
+    async def aclose(self) -> None:
+        """Close every pooled connection and forget the clients (e.g. at server shutdown)."""
+        with self._lock:
+            transports = list(self._transports.values())
+            self._transports.clear()
+            self._models.clear()
+            self._cached_models.clear()
+        for sync_transport, async_transport in transports:
+            sync_transport.close()
+            await async_transport.aclose()
+
+
+# Shared registry instance
+model_registry = ModelRegistry()
+
+
+def get_chat_model(model_name: str, cached: bool = True) -> Any:
+    """Shortcut for ``model_registry.get``."""
+    return model_registry.get(model_name, cached=cached)
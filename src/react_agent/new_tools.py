@@ -8,24 +8,18 @@ from typing import Any, Dict, List, Optional, Tuple
 from langchain_core.tools import tool
 from langchain_community.tools.tavily_search import TavilySearchResults
 
+from .catalog import get_catalog
 from .database_utils import (
     get_all_categories,
     get_material_types,
     get_material_subtypes,
     get_material_variants,
     get_material_price,
-    search_materials,
+    search_materials_page,
     get_price_range
 )
 from .tools_quotes import calculate_from_area_map, parse_area
-
-# Load the database once at module level
-_current_dir = os.path.dirname(os.path.abspath(__file__))
-_data_dir = os.path.join(_current_dir, '..', '..', 'data')
-_database_path = os.path.join(_data_dir, 'DatabaseNoiThat.json')
-
-with open(_database_path, 'r', encoding='utf-8') as f:
-    DATABASE = json.load(f)
+from .pricing import surface_costs
 
 # --- Path setup for data files ---
 _current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -36,7 +30,7 @@ QUOTES_DIR = "saved_quotes"
 os.makedirs(QUOTES_DIR, exist_ok=True)
 
 @tool
-def get_internal_price_new(category: str, material_type: str, subtype: str, variant: Optional[str] = None, cost_type: str = "combined") -> str:
+def get_internal_price_new(category: str, material_type: str, subtype: Optional[str] = None, variant: Optional[str] = None, cost_type: str = "combined") -> str:
     """
     (Giá nội bộ) Tra cứu giá của một vật liệu cụ thể từ cơ sở dữ liệu mới của công ty.
     Sử dụng khi người dùng hỏi giá trực tiếp cho một sản phẩm.
@@ -44,11 +38,11 @@ def get_internal_price_new(category: str, material_type: str, subtype: str, vari
     Args:
         category: Danh mục (ví dụ: 'Sàn', 'Tường và vách')
         material_type: Loại vật liệu (ví dụ: 'Sàn gạch', 'Giấy dán tường')
-        subtype: Phân loại (ví dụ: 'Gạch cao cấp', 'Giấy dán tường Đạt Minh')
+        subtype: Phân loại (ví dụ: 'Gạch cao cấp', 'Giấy dán tường Đạt Minh'). Nếu không có, trả về khoảng giá của cả loại vật liệu.
         variant: Biến thể cụ thể (ví dụ: 'Gạch 600x1200mm'). Nếu không có, trả về khoảng giá.
         cost_type: Loại chi phí - 'material' (vật tư), 'labor' (nhân công), hoặc 'combined' (tổng hợp)
     """
-    if variant:
+    if variant and subtype:
         # Get specific variant price
         price = get_material_price(category, material_type, subtype, variant, cost_type)
         if price is not None:
@@ -62,8 +56,12 @@ def get_internal_price_new(category: str, material_type: str, subtype: str, vari
         else:
             return f"Không tìm thấy giá cho {variant} ({subtype}, {material_type}, {category})."
     else:
-        # Get price range for subtype
-        min_price, max_price = get_price_range(category, material_type, subtype, cost_type)
+        # Get price range for subtype (or the whole material type)
+        price_range = get_price_range(category, material_type, subtype)
+        prefix = {"material": "material", "labor": "labor"}.get(cost_type, "combined")
+        min_price = price_range[f"{prefix}_min"]
+        max_price = price_range[f"{prefix}_max"]
+        name = f"{subtype} ({material_type}, {category})" if subtype else f"{material_type} ({category})"
         if min_price is not None and max_price is not None:
             cost_type_vn = {
                 "material": "vật tư",
@@ -71,9 +69,9 @@ def get_internal_price_new(category: str, material_type: str, subtype: str, vari
                 "combined": "tổng hợp"
             }.get(cost_type, "tổng hợp")
             
-            return f"Giá {cost_type_vn} cho {subtype} ({material_type}, {category}) dao động từ {min_price:,.0f} VND/m² đến {max_price:,.0f} VND/m²."
+            return f"Giá {cost_type_vn} cho {name} dao động từ {min_price:,.0f} VND/m² đến {max_price:,.0f} VND/m²."
         else:
-            return f"Không tìm thấy dữ liệu giá cho {subtype} ({material_type}, {category})."
+            return f"Không tìm thấy dữ liệu giá cho {name}."
 
 @tool
 def search_materials_new(query: str) -> str:
@@ -84,14 +82,14 @@ def search_materials_new(query: str) -> str:
     Args:
         query: Từ khóa tìm kiếm
     """
-    results = search_materials(query)
+    results, total = search_materials_page(query, limit=10)
     
     if not results:
         return f"Không tìm thấy vật liệu nào phù hợp với '{query}'."
     
-    # Format results
+    # Format the 10 best-ranked results
     formatted_results = []
-    for item in results[:10]:  # Limit to 10 results
+    for item in results:
         material_cost_str = f"{item['material_cost']:,.0f}" if item['material_cost'] is not None else "N/A"
         labor_cost_str = f"{item['labor_cost']:,.0f}" if item['labor_cost'] is not None else "N/A"
         combined_cost_str = f"{item['combined_cost']:,.0f}" if item['combined_cost'] is not None else "N/A"
@@ -103,7 +101,7 @@ def search_materials_new(query: str) -> str:
             f"  + Tổng: {combined_cost_str} VND/m²"
         )
     
-    return f"Tìm thấy {len(results)} kết quả cho '{query}':\n\n" + "\n\n".join(formatted_results)
+    return f"Tìm thấy {total} kết quả cho '{query}':\n\n" + "\n\n".join(formatted_results)
 
 @tool
 def get_categories_new() -> str:
@@ -217,7 +215,7 @@ def generate_quote_from_image(image_report: str, area_map: dict = None) -> str:
             area_map = _parse_image_report_to_area_map(image_report)
         
         # Calculate costs using the area map with fallback for partial paths
-        result = _calculate_from_area_map_with_fallback(DATABASE, area_map)
+        result = _calculate_from_area_map_with_fallback(get_catalog().data, area_map)
         
         # Format the result as a markdown table
         formatted_result = _format_quote_result(result)
@@ -297,6 +295,19 @@ def _parse_image_report_to_area_map(image_report: str) -> dict:
 
     return {"surfaces": surfaces}
 
+def _resolve_partial_path(data, path):
+    """
+    Resolve the longest prefix of ``path`` (at least category and material type)
+    that matches the catalog with enough confidence.
+    """
+    from .path_resolver import DEFAULT_MIN_CONFIDENCE, resolve_catalog_path
+
+    for length in range(len(path), 1, -1):
+        match = resolve_catalog_path(path[:length], data)
+        if match is not None and len(match.path) >= 2 and match.confidence >= DEFAULT_MIN_CONFIDENCE:
+            return match
+    return None
+
 def _calculate_from_area_map_with_fallback(data, area_map):
     """
     Calculate costs from area map with fallback to price ranges for partial paths.
@@ -309,6 +320,8 @@ def _calculate_from_area_map_with_fallback(data, area_map):
     
     # First try the standard calculation
     result = calculate_from_area_map(data, area_map)
+    # (position, [combined min, combined max], area) of surfaces priced from a range below
+    fallback_ranges = []
     
     # Check for errors and try to fix them with fallback logic
     for position, res in result["results"].items():
@@ -316,9 +329,11 @@ def _calculate_from_area_map_with_fallback(data, area_map):
             # Try to get price range for partial path
             path = res.get("path", "").split(" > ")
             if len(path) >= 2:  # At least category and material_type
-                category = path[0]
-                material_type = path[1]
-                subtype = path[2] if len(path) > 2 else None
+                # Khớp gần đúng (thiếu dấu, sai chính tả, bỏ cấp) trước khi lấy khoảng giá
+                match = _resolve_partial_path(data, path)
+                if match is None:
+                    continue
+                category, material_type, subtype = (list(match.path[:3]) + [None])[:3]
                 
                 # Try to get price range for the partial path
                 price_ranges = get_price_range(category, material_type, subtype)
@@ -328,6 +343,8 @@ def _calculate_from_area_map_with_fallback(data, area_map):
                     if res.get("area") is None:
                         result["results"][position] = {
                             "path": res["path"],
+                            "resolved_path": " > ".join(match.path[:3]),
+                            "match_confidence": round(match.confidence, 3),
                             "area": None,
                             "budget": res.get("budget"),
                             "type": "range",
@@ -342,8 +359,11 @@ def _calculate_from_area_map_with_fallback(data, area_map):
                         # For area-based quotes, multiply by area
                         parsed_area = parse_area(res.get("area", "10"))
                         if parsed_area is not None:
+                            fallback_ranges.append((position, [price_ranges["combined_min"], price_ranges["combined_max"]], parsed_area))
                             result["results"][position] = {
                                 "path": res["path"],
+                                "resolved_path": " > ".join(match.path[:3]),
+                                "match_confidence": round(match.confidence, 3),
                                 "area": res["area"],
                                 "budget": res.get("budget"),
                                 "type": "range",
@@ -352,13 +372,27 @@ def _calculate_from_area_map_with_fallback(data, area_map):
                                 "labor_min": price_ranges["labor_min"],
                                 "labor_max": price_ranges["labor_max"],
                                 "combined_min": price_ranges["combined_min"],
-                                "combined_max": price_ranges["combined_max"],
-                                "total_cost_range": f"{price_ranges['combined_min'] * parsed_area:,.0f} - {price_ranges['combined_max'] * parsed_area:,.0f} VND"
+                                "combined_max": price_ranges["combined_max"]
                             }
     
+    # Khoảng tổng chi phí của mọi bề mặt dùng khoảng giá, tính trong một lần
+    if fallback_ranges:
+        costs = surface_costs([unit for _, unit, _ in fallback_ranges], [area for _, _, area in fallback_ranges])
+        for (position, _, _), (min_cost, max_cost) in zip(fallback_ranges, costs.tolist()):
+            result["results"][position]["total_cost_range"] = f"{min_cost:,.0f} - {max_cost:,.0f} VND"
+    
     return result
 
 def _format_quote_result(result: dict) -> str:
+    """
+    Format the quote result as a markdown table, stamped with the catalog version it was priced from.
+    """
+    return _format_quote_table(result) + _catalog_version_note(result["summary"].get("catalog_version"))
+
+def _catalog_version_note(version: Optional[str]) -> str:
+    return f"\n*Bảng giá phiên bản {version}*\n" if version else ""
+
+def _format_quote_table(result: dict) -> str:
     """
     Format the quote result as a markdown table based on the quote type.
     """
@@ -467,8 +501,8 @@ def _format_quote_result(result: dict) -> str:
                     range_text_clean = range_text.replace(",", "")
                     if " - " in range_text_clean:
                         min_val, max_val = range_text_clean.split(" - ")
-                        total_min += int(min_val.split()[0])
-                        total_max += int(max_val.split()[0])
+                        total_min += float(min_val.split()[0])
+                        total_max += float(max_val.split()[0])
                 except:
                     pass
         
@@ -528,8 +562,8 @@ def _format_quote_result(result: dict) -> str:
                     range_text_clean = range_text.replace(",", "")
                     if " - " in range_text_clean:
                         min_val, max_val = range_text_clean.split(" - ")
-                        total_min += int(min_val.split()[0])
-                        total_max += int(max_val.split()[0])
+                        total_min += float(min_val.split()[0])
+                        total_max += float(max_val.split()[0])
                 except:
                     pass
         
@@ -552,6 +586,8 @@ def get_material_price_ranges(room_size: str = None, area: str = None, surfaces:
     from .tools_quotes import parse_area
     import logging
     
+    # Stamped on the output (serve pins one catalog snapshot per request)
+    catalog_version = get_catalog().version
     try:
         # Standardize input
         area_map = {"surfaces": {}}
@@ -600,11 +636,27 @@ def get_material_price_ranges(room_size: str = None, area: str = None, surfaces:
         else:
             return "Lỗi: Cần cung cấp thông tin diện tích (area), kích thước phòng (room_size), hoặc danh sách hạng mục (surfaces)"
 
+        # Look up unit price ranges first, then price every surface with an area in one batch
+        price_ranges = {
+            position: get_price_range(info.get("category"), info.get("material_type"), info.get("subtype"))
+            for position, info in area_map["surfaces"].items()
+            if "error" not in info
+        }
+        priced_positions = [
+            position for position, price_range in price_ranges.items()
+            if (price_range["combined_min"] or 0) > 0 and (price_range["combined_max"] or 0) > 0
+            and (area_map["surfaces"][position].get("area") or 0) > 0
+        ]
+        costs = surface_costs(
+            [[price_ranges[p]["combined_min"], price_ranges[p]["combined_max"]] for p in priced_positions],
+            [area_map["surfaces"][p]["area"] for p in priced_positions]
+        ).reshape(-1, 2)
+        surface_totals = dict(zip(priced_positions, costs.tolist()))
+        total_min, total_max = costs.sum(axis=0).tolist()
+        has_area_info = bool(priced_positions)
+
         # Calculate price ranges for each surface
         result = {"surfaces": {}, "total_range": {"min": 0, "max": 0}}
-        total_min = 0
-        total_max = 0
-        has_area_info = False
         
         for position, info in area_map["surfaces"].items():
             if "error" in info:
@@ -617,7 +669,7 @@ def get_material_price_ranges(room_size: str = None, area: str = None, surfaces:
             area_val = info.get("area")
             
             # Get price range
-            price_range = get_price_range(category, material_type, subtype)
+            price_range = price_ranges[position]
             min_price = price_range.get("combined_min")
             max_price = price_range.get("combined_max")
             
@@ -625,14 +677,13 @@ def get_material_price_ranges(room_size: str = None, area: str = None, surfaces:
             logging.info(f"[get_material_price_ranges] {position}: {category} - {material_type} - {subtype} | area={area_val} | min={min_price}, max={max_price}")
             
             if min_price is not None and max_price is not None and min_price > 0 and max_price > 0:
-                material_name = f"{material_type}"
+                material_name = f"{material_type or category}"
                 if subtype:
                     material_name += f" ({subtype})"
                 
-                if area_val is not None and area_val > 0:
-                    # Calculate total cost with area
-                    min_total = min_price * area_val
-                    max_total = max_price * area_val
+                if position in surface_totals:
+                    # Total cost with area, computed in the batch above
+                    min_total, max_total = surface_totals[position]
                     result["surfaces"][position] = {
                         "category": category,
                         "material_type": material_type,
@@ -641,9 +692,6 @@ def get_material_price_ranges(room_size: str = None, area: str = None, surfaces:
                         "unit_price_range": f"{min_price:,.0f} - {max_price:,.0f} VND/m²",
                         "total_cost_range": f"{min_total:,.0f} - {max_total:,.0f} VND"
                     }
-                    total_min += min_total
-                    total_max += max_total
-                    has_area_info = True
                 else:
                     # Only show unit price when no area
                     result["surfaces"][position] = {
@@ -686,7 +734,7 @@ def get_material_price_ranges(room_size: str = None, area: str = None, surfaces:
                 else:
                     output += f"| {position} | - | {info['error']} |\n"
             else:
-                material_name = f"{info['material_type']}"
+                material_name = f"{info['material_type'] or info['category']}"
                 if info.get('subtype'):
                     material_name += f" ({info['subtype']})"
                 
@@ -700,7 +748,7 @@ def get_material_price_ranges(room_size: str = None, area: str = None, surfaces:
         elif not has_area_info:
             output += f"\n**Lưu ý: Chỉ hiển thị đơn giá. Cần cung cấp diện tích để tính tổng chi phí.**\n"
         
-        return output
+        return output + _catalog_version_note(catalog_version)
     except Exception as e:
         error_msg = f"Lỗi khi thực thi công cụ 'get_material_price_ranges': {str(e)}"
         print(error_msg)
@@ -785,16 +833,20 @@ def propose_options_for_budget(budget: float, room_size: str = None, area: str =
         else:
             return "Lỗi: Cần cung cấp thông tin diện tích (area), kích thước phòng (room_size), hoặc danh sách hạng mục (surfaces)"
         
-        # Use exhaustive search to find best variant for budget
+        # Branch-and-bound search for the combination closest to the budget
         from .exhaustive_search import find_best_variant_for_budget
-        result, status = find_best_variant_for_budget(DATABASE, area_map, budget)
+        result, status = find_best_variant_for_budget(get_catalog().data, area_map, budget)
         
         if result is None:
             return f"Lỗi: {status}"
         
         # Format result
         formatted_result = _format_quote_result(result)
-        
+
+        # The solver hit its time budget and returned its best-so-far combination
+        if not result["summary"].get("optimal", True):
+            formatted_result += "\n*Ghi chú: Đây là phương án tốt nhất tìm được trong thời gian cho phép, có thể chưa phải tối ưu.*\n"
+
         return formatted_result
     except Exception as e:
         error_msg = f"Lỗi khi thực thi công cụ 'propose_options_for_budget': {str(e)}"
@@ -0,0 +1,268 @@
+"""Fuzzy resolution of catalog paths.
+
+Paths coming from the vision model, the planner or the user rarely match the
+catalog exactly: diacritics are dropped ("san go"), case differs, words are
+abbreviated or misspelled, or a level is skipped (["Sàn", "Gỗ tự nhiên"]).
+PathResolver indexes a PriceCatalog once — a trie of diacritic-folded path
+segments plus a token index over every node — and resolves a path by a
+beam search down the trie, scoring each segment by folded equality,
+containment, token overlap and edit distance. The result carries a
+confidence in [0, 1] so callers can decide whether to trust it.
+"""
+
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from .catalog import PriceCatalog, get_catalog
+
+# Segments scoring below this never enter the beam
+MIN_SEGMENT_SCORE = 0.5
+# Score multiplier for each catalog level skipped by a segment
+SKIP_PENALTY = 0.85
+BEAM_WIDTH = 8
+# Beam entries scoring below this fraction of the best one are dropped
+BEAM_RATIO = 0.8
+# Deeper levels are searched only when no direct child scores at least this,
+# or when the query is longer than the best child's name
+SKIP_SEARCH_BELOW = 0.8
+# Confidence below which resolve_path-style callers should treat the path as unknown
+DEFAULT_MIN_CONFIDENCE = 0.6
+
+_WORDS = re.compile(r"[^\W_]+")
+_VIETNAMESE_MARKS = re.compile("[%s]" % "".join(
+    chr(code) for code in range(0x300, 0x370) if unicodedata.combining(chr(code))))
+
+
+def fold(text: str) -> str:
+    """Lowercase, strip Vietnamese diacritics (đ -> d) and collapse non-alphanumerics to spaces."""
+    text = str(text).replace("đ", "d").replace("Đ", "D")
+    if not text.isascii():
+        # Dấu tiếng Việt nằm trong khối U+0300-U+036F: xóa bằng regex, chỉ duyệt từng ký tự khi còn ký tự khác
+        text = _VIETNAMESE_MARKS.sub("", unicodedata.normalize("NFD", text))
+        if not text.isascii():
+            text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    # \w là chữ/số theo str.isalnum() cộng dấu gạch dưới
+    return " ".join(_WORDS.findall(text.casefold()))
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance within a band of width ``limit``; returns limit + 1 once it exceeds it."""
+    if len(a) < len(b):
+        a, b = b, a
+    n = len(b)
+    if len(a) - n > limit:
+        return limit + 1
+    beyond = limit + 1
+    previous = [j if j <= limit else beyond for j in range(n + 1)]
+    for i in range(1, len(a) + 1):
+        ca = a[i - 1]
+        current = [beyond] * (n + 1)
+        left = current[0] = i if i <= limit else beyond
+        best = left
+        for j in range(max(1, i - limit), min(n, i + limit) + 1):
+            value = previous[j - 1] if ca == b[j - 1] else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if left + 1 < value:
+                value = left + 1
+            current[j] = left = value
+            if value < best:
+                best = value
+        if best > limit:
+            return beyond
+        previous = current
+    return min(previous[-1], beyond)
+
+
+def segment_similarity(query: str, name: str) -> float:
+    """Similarity in [0, 1] of two folded segments."""
+    if query == name:
+        return 1.0
+    if not query or not name:
+        return 0.0
+    shorter, longer = sorted((query, name), key=len)
+    score = 0.0
+    if shorter in longer:
+        score = 0.7 + 0.25 * len(shorter) / len(longer)
+    query_tokens, name_tokens = set(query.split()), set(name.split())
+    overlap = len(query_tokens & name_tokens)
+    if overlap:
+        score = max(score, 0.6 + 0.35 * overlap / len(query_tokens | name_tokens))
+    # Edit distance only matters when it could beat the score so far
+    limit = max(1, len(longer) // 4)
+    if 1.0 - (len(longer) - len(shorter)) / len(longer) > score:
+        distance = edit_distance(query, name, limit)
+        if distance <= limit:
+            score = max(score, 1.0 - distance / len(longer))
+    return score
+
+
+@dataclass
+class ResolvedPath:
+    """Best catalog match for a query path."""
+
+    path: Tuple[str, ...]
+    confidence: float
+    exact: bool
+    is_variant: bool
+
+
+class PathResolver:
+    """Trie + token index over the nodes of a PriceCatalog."""
+
+    def __init__(self, catalog: PriceCatalog):
+        self.catalog = catalog
+        # prefix -> [(folded child name, child name)]
+        self._children: Dict[Tuple[str, ...], List[Tuple[str, str]]] = {}
+        # prefix -> {folded child name: child name}, for exact folded hits
+        self._exact: Dict[Tuple[str, ...], Dict[str, str]] = {}
+        # node -> (folded last segment, its token set)
+        self._folded: Dict[Tuple[str, ...], Tuple[str, FrozenSet[str]]] = {}
+        # folded token -> internal nodes whose last segment contains it
+        self._token_nodes: Dict[str, List[Tuple[str, ...]]] = {}
+        # prefix -> folded token -> grandchildren of prefix whose last segment contains it
+        self._grandchild_tokens: Dict[Tuple[str, ...], Dict[str, List[Tuple[str, ...]]]] = {}
+        self._build()
+
+    def _build(self) -> None:
+        for path in self.catalog.paths:
+            for depth in range(1, len(path) + 1):
+                node = tuple(path[:depth])
+                if node in self._folded:
+                    continue
+                folded = fold(node[-1])
+                tokens = frozenset(folded.split())
+                self._folded[node] = (folded, tokens)
+                self._children.setdefault(node[:-1], []).append((folded, node[-1]))
+                self._exact.setdefault(node[:-1], {}).setdefault(folded, node[-1])
+                if depth < len(path):
+                    for token in tokens:
+                        self._token_nodes.setdefault(token, []).append(node)
+                if depth >= 2:
+                    grandchildren = self._grandchild_tokens.setdefault(node[:-2], {})
+                    for token in tokens:
+                        grandchildren.setdefault(token, []).append(node)
+
+    def _skip_candidates(self, prefix: Tuple[str, ...], query: str) -> Iterable[Tuple[str, ...]]:
+        """Nodes a segment may jump to when it matches no direct child of ``prefix``."""
+        tokens = set(query.split())
+        if prefix:
+            # Bỏ qua đúng một cấp: các cháu của prefix có chung ít nhất một token
+            index = self._grandchild_tokens.get(prefix, {})
+            return list(dict.fromkeys(node for token in tokens for node in index.get(token, [])))
+        # Từ gốc: tra chỉ mục token (chỉ nút trung gian), duyệt danh sách của token hiếm nhất
+        postings = [self._token_nodes.get(token, []) for token in tokens]
+        if not postings:
+            return []
+        return [node for node in min(postings, key=len) if len(node) > 1 and tokens <= self._folded[node][1]]
+
+    def _expand(
+        self,
+        prefix: Tuple[str, ...],
+        query: str,
+        memo: Dict[Tuple[str, str], float]
+    ) -> List[Tuple[Tuple[str, ...], float]]:
+        """Candidate nodes for the next query segment below ``prefix``."""
+        exact = self._exact.get(prefix, {}).get(query)
+        if exact is not None:
+            return [(prefix + (exact,), 1.0)]
+        expansions: Dict[Tuple[str, ...], float] = {}
+        best_score, best_folded = 0.0, ""
+        for folded, name in self._children.get(prefix, []):
+            # Tên con lặp lại giữa các nhánh của beam, chỉ chấm điểm một lần
+            score = memo.get((query, folded))
+            if score is None:
+                score = memo[(query, folded)] = segment_similarity(query, folded)
+            if score >= MIN_SEGMENT_SCORE:
+                expansions[prefix + (name,)] = score
+                if score > best_score:
+                    best_score, best_folded = score, folded
+        # Cho phép bỏ qua cấp trung gian (vd. ["Sàn", "Gỗ tự nhiên"]). Truy vấn dài hơn
+        # tên khớp nhất (["Sàn gỗ"] chứa "Sàn") có thể là tên của một nút sâu hơn
+        if best_score < SKIP_SEARCH_BELOW or len(query) > len(best_folded):
+            for node in self._skip_candidates(prefix, query):
+                folded = self._folded[node][0]
+                score = memo.get((query, folded))
+                if score is None:
+                    score = memo[(query, folded)] = segment_similarity(query, folded)
+                score *= SKIP_PENALTY ** (len(node) - len(prefix) - 1)
+                if score >= MIN_SEGMENT_SCORE and score > expansions.get(node, 0.0):
+                    expansions[node] = score
+        return sorted(expansions.items(), key=lambda item: -item[1])[:BEAM_WIDTH]
+
+    def resolve(self, path: Sequence[str]) -> Optional[ResolvedPath]:
+        """
+        Find the catalog node that best matches ``path``.
+
+        Args:
+            path: Query segments, e.g. ["san", "San go", "go tu nhien"]
+
+        Returns:
+            The best match with its confidence (geometric mean of segment scores,
+            skipped levels included), or None when some segment matches nothing
+        """
+        segments = [segment for segment in path if str(segment).strip()]
+        if not segments:
+            return None
+        if self.catalog.contains(segments):
+            node = tuple(segments)
+            return ResolvedPath(node, 1.0, True, self.catalog.index_of(node) is not None)
+
+        # Beam entries: (node, product of segment scores)
+        beam: List[Tuple[Tuple[str, ...], float]] = [((), 1.0)]
+        memo: Dict[Tuple[str, str], float] = {}
+        for segment in segments:
+            query = fold(segment)
+            next_beam: Dict[Tuple[str, ...], float] = {}
+            for prefix, score in beam:
+                for node, segment_score in self._expand(prefix, query, memo):
+                    total = score * segment_score
+                    if total > next_beam.get(node, 0.0):
+                        next_beam[node] = total
+            if not next_beam:
+                return None
+            beam = sorted(next_beam.items(), key=lambda item: -item[1])[:BEAM_WIDTH]
+            # Nhánh kém xa nhánh tốt nhất không thể vượt lên ở các cấp sau
+            beam = [entry for entry in beam if entry[1] >= beam[0][1] * BEAM_RATIO]
+
+        node, score = beam[0]
+        confidence = score ** (1 / len(segments))
+        return ResolvedPath(node, confidence, False, self.catalog.index_of(node) is not None)
+
+
+_resolvers: Dict[int, Tuple[PriceCatalog, PathResolver]] = {}
+# Request threads and the catalog watcher read and fill _resolvers concurrently
+_resolvers_lock = threading.Lock()
+
+
+def get_resolver(data: Optional[dict] = None) -> PathResolver:
+    """Resolver for the shared catalog (or for a given tree), built once per tree."""
+    tree = get_catalog().data if data is None else data
+    with _resolvers_lock:
+        cached = _resolvers.get(id(tree))
+    if cached is not None and cached[0].data is tree:
+        return cached[1]
+    return build_resolver(get_catalog(tree))
+
+
+def build_resolver(catalog: PriceCatalog) -> PathResolver:
+    """Build and cache the resolver of ``catalog`` (e.g. before a reloaded catalog goes live)."""
+    resolver = PathResolver(catalog)
+    with _resolvers_lock:
+        # Another thread may have built the same tree meanwhile: keep the first one
+        cached = _resolvers.get(id(catalog.data))
+        if cached is not None and cached[0].data is catalog.data:
+            return cached[1]
+        _resolvers.pop(id(catalog.data), None)
+        if len(_resolvers) >= 4:
+            _resolvers.pop(next(iter(_resolvers)))
+        _resolvers[id(catalog.data)] = (catalog, resolver)
+    return resolver
+
+
+def resolve_catalog_path(path: Sequence[str], data: Optional[dict] = None) -> Optional[ResolvedPath]:
+    """Shortcut for ``get_resolver(data).resolve(path)``."""
+    return get_resolver(data).resolve(path)
@@ -0,0 +1,131 @@
+"""Vectorized pricing kernel shared by the quoting and budget tools.
+
+Prices are laid out as a surfaces x variants matrix of unit prices (VND/m²),
+padded with NaN where a surface has fewer candidates than the widest one, and
+multiplied by a per-surface area vector in one NumPy operation.
+"""
+
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .catalog import PriceCatalog
+
+# Combinations evaluated per batch by closest_to_budget
+DEFAULT_BATCH_SIZE = 65536
+
+
+def unit_price_matrix(
+    catalog: PriceCatalog,
+    row_lists: Sequence[Sequence[int]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Gather combined unit prices (Vật tư + Nhân công) for each surface's candidate rows.
+
+    Args:
+        catalog: Compiled price catalog
+        row_lists: Candidate catalog row indices, one sequence per surface
+
+    Returns:
+        Tuple of (unit prices, row indices), both shaped (surfaces, max candidates)
+        and padded with NaN / -1 respectively
+    """
+    width = max((len(rows) for rows in row_lists), default=0)
+    rows = np.full((len(row_lists), width), -1, dtype=np.int64)
+    for i, surface_rows in enumerate(row_lists):
+        rows[i, :len(surface_rows)] = np.fromiter(surface_rows, dtype=np.int64, count=len(surface_rows))
+
+    if len(catalog) == 0:
+        return np.full(rows.shape, np.nan), rows
+
+    # Zero-copy views over the catalog's columnar arrays
+    material = np.frombuffer(catalog.material_costs, dtype=np.float64)
+    labor = np.frombuffer(catalog.labor_costs, dtype=np.float64)
+    valid = rows >= 0
+    safe_rows = np.where(valid, rows, 0)
+    prices = np.where(valid, material[safe_rows] + labor[safe_rows], np.nan)
+    return prices, rows
+
+
+def surface_costs(unit_prices: Any, areas: Any) -> np.ndarray:
+    """Multiply a (surfaces, variants) unit-price matrix by a per-surface area vector."""
+    unit_prices = np.asarray(unit_prices, dtype=np.float64)
+    areas = np.asarray(areas, dtype=np.float64)
+    return unit_prices * areas[:, np.newaxis]
+
+
+def summarize_costs(costs: np.ndarray) -> Dict[str, Any]:
+    """
+    Per-surface and total min/max aggregates of a (surfaces, variants) cost matrix.
+
+    NaN padding is ignored. Surfaces without any candidate get NaN aggregates and
+    index -1, and are left out of the totals.
+    """
+    if costs.shape[1] == 0:
+        costs = np.full((len(costs), 1), np.nan)
+    missing = np.isnan(costs)
+    has_candidates = ~missing.all(axis=1)
+    low = np.where(missing, np.inf, costs)
+    high = np.where(missing, -np.inf, costs)
+
+    min_index = np.where(has_candidates, low.argmin(axis=1), -1)
+    max_index = np.where(has_candidates, high.argmax(axis=1), -1)
+    surface_min = np.where(has_candidates, low.min(axis=1), np.nan)
+    surface_max = np.where(has_candidates, high.max(axis=1), np.nan)
+
+    return {
+        "surface_min": surface_min,
+        "surface_max": surface_max,
+        "min_index": min_index,
+        "max_index": max_index,
+        "total_min": float(np.nansum(surface_min)),
+        "total_max": float(np.nansum(surface_max)),
+    }
+
+
+def closest_to_budget(
+    costs: np.ndarray,
+    budget: float,
+    batch_size: int = DEFAULT_BATCH_SIZE
+) -> Tuple[Optional[np.ndarray], float]:
+    """
+    Evaluate every combination of one candidate per surface, in batches, and pick
+    the one with the highest total within budget, or the lowest total if none fits.
+
+    Candidates must be left-aligned in each row (NaN padding at the end). Combinations
+    are visited in the same order as itertools.product, and the first one wins ties.
+
+    Returns:
+        Tuple of (chosen column per surface, total), or (None, inf) when a surface
+        has no candidates
+    """
+    counts = (~np.isnan(costs)).sum(axis=1)
+    if len(counts) == 0 or (counts == 0).any():
+        return None, float('inf')
+
+    total_combinations = int(np.prod(counts.astype(object)))
+    if total_combinations > np.iinfo(np.int64).max:
+        raise ValueError(f"Too many combinations to enumerate: {total_combinations}")
+
+    surfaces = np.arange(len(counts))[:, np.newaxis]
+    best_under: Tuple[float, Optional[np.ndarray]] = (-np.inf, None)
+    best_over: Tuple[float, Optional[np.ndarray]] = (np.inf, None)
+
+    for start in range(0, total_combinations, batch_size):
+        indices = np.arange(start, min(start + batch_size, total_combinations), dtype=np.int64)
+        choices = np.stack(np.unravel_index(indices, counts))
+        totals = costs[surfaces, choices].sum(axis=0)
+
+        under = totals <= budget
+        if under.any():
+            i = int(np.where(under, totals, -np.inf).argmax())
+            if totals[i] > best_under[0]:
+                best_under = (float(totals[i]), choices[:, i])
+        elif best_under[1] is None:
+            i = int(totals.argmin())
+            if totals[i] < best_over[0]:
+                best_over = (float(totals[i]), choices[:, i])
+
+    if best_under[1] is not None:
+        return best_under[1], best_under[0]
+    return best_over[1], best_over[0]
@@ -474,6 +474,18 @@ Read the conversation history and return ONLY a JSON containing:
 </system>"""
 )
 
+# Fills SUMMARIZER_PROMPT's {chat_history} when only the messages since the last summary are sent
+INCREMENTAL_HISTORY_TEMPLATE = """### PREVIOUS SUMMARY (already covers all earlier messages)
+{previous_summary}
+
+### NEW MESSAGES SINCE THE PREVIOUS SUMMARY
+{new_messages}
+
+### UPDATE INSTRUCTIONS
+- Return the COMPLETE updated JSON, not only the changes
+- Keep earlier events_summary items, budget and area_map entries unless the new messages change them
+- Append new events in chronological order"""
+
 FINAL_RESPONDER_PROMPT_TOOL_RESULTS = ChatPromptTemplate.from_template(
     """<system>
 You are a senior interior design consultant at DBplus. Your task is to interpret internal tool outputs and clearly communicate them to the client in **Vietnamese**.
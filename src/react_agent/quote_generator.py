@@ -7,17 +7,19 @@ import logging
 from datetime import datetime
 import re
 from typing import Optional, List, Dict, Any, Tuple
+import heapq
 import itertools
-from .database_utils import DATABASE
+
+import numpy as np
+
+from .catalog import get_catalog
+from .pricing import summarize_costs, surface_costs, unit_price_matrix
 
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Constants ---
-# Load the database once
-data = DATABASE
-
 # Map material types to database paths (new approach)
 VIETNAMESE_MATERIAL_MAP = {
     'gỗ': 'Nội thất',
@@ -84,8 +86,8 @@ def _load_material_data(material_type: str) -> Optional[Dict]:
     material_path = VIETNAMESE_MATERIAL_MAP.get(material_type.lower())
     if not material_path: return None
     
-    # Navigate to the material path in the database
-    node = data
+    # Navigate to the material path in the current catalog
+    node = get_catalog().data
     path_parts = material_path.split(' > ')
     for part in path_parts:
         if isinstance(node, dict) and part in node:
@@ -251,8 +253,6 @@ def generate_area_quote(components: List[Dict[str, Any]]) -> str:
     import logging
     import re
     from typing import List, Dict, Any
-    from .quote_parser import parse_area
-    from .database_utils import DATABASE
 
     # Configure logging
     logging.basicConfig(level=logging.INFO)
@@ -272,8 +272,8 @@ def generate_area_quote(components: List[Dict[str, Any]]) -> str:
         'tủ': 'Nội thất'
     }
 
-    # Load the database once
-    data = DATABASE
+    # One catalog snapshot for the whole quote
+    catalog = get_catalog()
 
     if not components:
         return "Không có hạng mục nào để báo giá."
@@ -291,8 +291,8 @@ def generate_area_quote(components: List[Dict[str, Any]]) -> str:
     data_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'data_new')
     
     results = []
-    total_min_cost = 0
-    total_max_cost = 0
+    # (result entry, candidate catalog rows) of every component with prices
+    priced_items = []
     
     # Xử lý từng hạng mục
     for component in components:
@@ -346,33 +346,15 @@ def generate_area_quote(components: List[Dict[str, Any]]) -> str:
             })
             continue
             
-        # Lấy dữ liệu từ cơ sở dữ liệu thay vì file riêng lẻ
-        material_data = _load_material_data(material_type)
-        if not material_data:
-            logging.warning(f"Material data not found in database for: {material_type}")
-            results.append({
-                "material": material_type,
-                "type": specific_type,
-                "position": position,
-                "area": area_str,
-                "price_range": "Không tìm thấy dữ liệu giá",
-                "estimated_cost": None
-            })
-            continue
-            
         try:
-            # Sử dụng dữ liệu từ cơ sở dữ liệu
-            data = material_data
-                
-            # Lọc theo loại cụ thể hoặc lấy tất cả
-            price_data = {}
-            if specific_type and specific_type.lower() != "null" and specific_type in data:
-                price_data = {specific_type: data[specific_type]}
-            else:
-                price_data = data
-                
-            # Trích xuất giá cho loại vật liệu
-            if not price_data:
+            # Các biến thể nằm dưới nhánh vật liệu (và loại cụ thể nếu có) của catalog
+            material_path = tuple(VIETNAMESE_MATERIAL_MAP[material_key].split(' > '))
+            if specific_type and specific_type.lower() != "null" and catalog.contains(material_path + (specific_type,)):
+                material_path += (specific_type,)
+            span = catalog.span(material_path)
+            rows = range(*span) if span else range(0)
+            
+            if not rows:
                 logging.warning(f"No price data found for {material_type}/{specific_type}")
                 results.append({
                     "material": material_type,
@@ -383,76 +365,16 @@ def generate_area_quote(components: List[Dict[str, Any]]) -> str:
                     "estimated_cost": None
                 })
                 continue
-                
-            # Tính toán min/max/avg price
-            all_prices = []
-            for type_name, type_data in price_data.items():
-                # Handle both direct price strings and nested structures
-                if isinstance(type_data, str):
-                    # Direct price string
-                    price_match = re.search(r'([\d,\.]+)', type_data)
-                    if price_match:
-                        numeric_str = price_match.group(1)
-                        price_val = float(numeric_str.replace(',', ''))
-                        all_prices.append((type_name, type_name, price_val, type_data))
-                elif isinstance(type_data, dict):
-                    # Nested structure with vat_tu and nhan_cong
-                    for variant, price_str in type_data.items():
-                        # Parse giá từ chuỗi, giữ lại phần số và dấu phẩy
-                        price_match = re.search(r'([\d,\.]+)', price_str)
-                        if price_match:
-                            numeric_str = price_match.group(1)
-                            # Chuyển đổi string thành số float (loại bỏ dấu phẩy hàng nghìn)
-                            price_val = float(numeric_str.replace(',', ''))
-                            all_prices.append((type_name, variant, price_val, price_str))
-            
-            if not all_prices:
-                logging.warning(f"Could not parse any prices for {material_type}/{specific_type}")
-                results.append({
-                    "material": material_type,
-                    "type": specific_type,
-                    "position": position,
-                    "area": area_str,
-                    "price_range": "Lỗi định dạng giá",
-                    "estimated_cost": None
-                })
-                continue
-                
-            # Tính giá min, max và trung bình
-            min_price = min(all_prices, key=lambda x: x[2])
-            max_price = max(all_prices, key=lambda x: x[2])
-            avg_price = sum(p[2] for p in all_prices) / len(all_prices)
-            
-            # Tính chi phí dựa trên diện tích
-            min_cost = min_price[2] * area_value
-            max_cost = max_price[2] * area_value
-            avg_cost = avg_price * area_value
-            
-            # Thêm vào kết quả
-            price_range_str = f"{min_price[3]} - {max_price[3]}"
-            cost_range_str = f"{min_cost:,.0f} - {max_cost:,.0f} VND"
             
+            # Chi phí được tính chung cho mọi hạng mục sau vòng lặp
             results.append({
                 "material": material_type,
                 "type": specific_type if specific_type and specific_type.lower() != "null" else "Tất cả các loại",
                 "position": position,
                 "area": area_str,
                 "area_value": area_value,
-                "price_range": price_range_str,
-                "min_price": min_price[2],
-                "max_price": max_price[2],
-                "min_price_display": min_price[3],
-                "max_price_display": max_price[3],
-                "avg_price": avg_price,
-                "min_cost": min_cost,
-                "max_cost": max_cost,
-                "avg_cost": avg_cost,
-                "cost_range": cost_range_str
             })
-            
-            # Cộng vào tổng chi phí (dùng giá trung bình)
-            total_min_cost += min_cost
-            total_max_cost += max_cost
+            priced_items.append((results[-1], rows))
             
         except Exception as e:
             logging.error(f"Error processing {material_type}/{specific_type}: {str(e)}")
@@ -468,6 +390,37 @@ def generate_area_quote(components: List[Dict[str, Any]]) -> str:
                 "estimated_cost": None
             })
     
+    # Giá min/max/trung bình và chi phí của mọi hạng mục trong một phép tính NumPy
+    unit_prices, rows = unit_price_matrix(catalog, [item_rows for _, item_rows in priced_items])
+    costs = surface_costs(unit_prices, [item["area_value"] for item, _ in priced_items])
+    summary = summarize_costs(costs)
+    if priced_items:
+        avg_prices = np.nanmean(unit_prices, axis=1)
+        avg_costs = np.nanmean(costs, axis=1)
+
+    for i, (item, _) in enumerate(priced_items):
+        min_index, max_index = summary["min_index"][i], summary["max_index"][i]
+        min_price = float(unit_prices[i, min_index])
+        max_price = float(unit_prices[i, max_index])
+        min_cost = float(summary["surface_min"][i])
+        max_cost = float(summary["surface_max"][i])
+        min_display = f"{min_price:,.0f} VND/m² ({catalog.paths[rows[i, min_index]][-1]})"
+        max_display = f"{max_price:,.0f} VND/m² ({catalog.paths[rows[i, max_index]][-1]})"
+        item.update({
+            "price_range": f"{min_display} - {max_display}",
+            "min_price": min_price,
+            "max_price": max_price,
+            "min_price_display": min_display,
+            "max_price_display": max_display,
+            "avg_price": float(avg_prices[i]),
+            "min_cost": min_cost,
+            "max_cost": max_cost,
+            "avg_cost": float(avg_costs[i]),
+            "cost_range": f"{min_cost:,.0f} - {max_cost:,.0f} VND"
+        })
+    total_min_cost = summary["total_min"]
+    total_max_cost = summary["total_max"]
+    
     # Tạo báo cáo
     report = []
     report.append("# Báo Giá Chi Tiết Theo Diện Tích")
@@ -516,7 +469,7 @@ def generate_area_quote(components: List[Dict[str, Any]]) -> str:
     report.append(f"## Tổng Chi Phí Ước Tính: {total_min_cost:,.0f} - {total_max_cost:,.0f} VND")
     report.append("")
     report.append("*Ghi chú: Chi phí được tính dựa trên khoảng giá thấp nhất và cao nhất của các loại vật liệu.*")
-    report.append("*Báo giá chỉ tính chi phí vật liệu, chưa bao gồm nhân công và các chi phí phát sinh khác.*")
+    report.append("*Chi phí gồm vật tư và nhân công, chưa bao gồm các chi phí phát sinh khác.*")
     
     return "\n".join(report)
 
@@ -600,10 +553,69 @@ def _get_all_variants_for_component(component: Dict[str, Any]) -> List[Dict[str,
                 continue
     return variants
 
-def calculate_optimal_combinations(components: List[Dict[str, Any]], total_budget: float) -> str:
+def _top_k_combinations(
+    cost_lists: List[List[float]],
+    same_as_prev: List[bool],
+    total_budget: float,
+    top_k: int
+) -> Tuple[List[Tuple[float, int, Tuple[int, ...]]], int]:
+    """
+    Streams over combinations (one index per cost list) and keeps only the top_k
+    with the highest total cost within budget in a bounded min-heap.
+
+    Each cost list must be sorted in descending order. When same_as_prev[i] is True,
+    slot i is interchangeable with slot i-1 and only picks indices >= slot i-1's, so
+    a group of identical slots is enumerated as multisets instead of ordered tuples.
+    Subtrees that cannot fit the budget or beat the current k-th best are pruned.
+
+    Returns:
+        Tuple of (heap entries sorted best first as (total, tie_breaker, choice), combinations visited)
+    """
+    n = len(cost_lists)
+    min_rem = [0.0] * (n + 1)
+    max_rem = [0.0] * (n + 1)
+    for i in reversed(range(n)):
+        min_rem[i] = min_rem[i + 1] + cost_lists[i][-1]
+        max_rem[i] = max_rem[i + 1] + cost_lists[i][0]
+
+    heap: List[Tuple[float, int, Tuple[int, ...]]] = []
+    sequence = itertools.count()
+    choice = [0] * n
+    visited = 0
+
+    def search(i: int, partial: float) -> None:
+        nonlocal visited
+        if i == n:
+            visited += 1
+            if visited % 10000 == 0:
+                logger.info(f"Processed {visited} combinations...")
+            # Earlier combinations win ties, as with a stable sort
+            entry = (partial, -next(sequence), tuple(choice))
+            if len(heap) < top_k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+            return
+
+        start = choice[i - 1] if same_as_prev[i] else 0
+        for j in range(start, len(cost_lists[i])):
+            cost = cost_lists[i][j]
+            if partial + cost + min_rem[i + 1] > total_budget:
+                continue
+            if len(heap) == top_k and partial + cost + max_rem[i + 1] <= heap[0][0]:
+                break
+            choice[i] = j
+            search(i + 1, partial + cost)
+
+    if top_k > 0 and min_rem[0] <= total_budget:
+        search(0, 0.0)
+    return sorted(heap, reverse=True), visited
+
+def calculate_optimal_combinations(components: List[Dict[str, Any]], total_budget: float, top_k: int = 2) -> str:
     """
-    Finds the top 2 optimal combinations of materials for multiple components that fit within a total budget.
-    This function performs a combinatorial search to find the best overall solutions.
+    Finds the top_k optimal combinations of materials for multiple components that fit within a total budget.
+    Components sharing the same candidate variants and area (e.g. the four walls of a room) are
+    searched as one group, and only the best top_k combinations are kept in memory.
     """
     logger.info(f"Starting optimal combination search for {len(components)} components with budget {total_budget:,.0f} VND.")
 
@@ -616,30 +628,34 @@ def calculate_optimal_combinations(components: List[Dict[str, Any]], total_budge
         logger.warning(f"No variants found for components: {empty_components}. Cannot find a combination.")
         return f"Lỗi: Không tìm thấy bất kỳ lựa chọn vật liệu nào cho các hạng mục: {', '.join(empty_components)}. Không thể tạo tổ hợp báo giá."
 
-    # 2. Generate all possible combinations (Cartesian product).
-    # This can be memory-intensive. For a real-world app, consider sampling or optimization heuristics.
-    logger.info("Generating all possible combinations...")
-    all_combinations = itertools.product(*variants_per_component)
+    # 2. Sort each component's choices by cost (most expensive first) and put components
+    # with the same candidate set and area next to each other so they form one group.
+    sorted_variants = [sorted(v, key=lambda x: -x['price'] * x['area']) for v in variants_per_component]
 
-    # 3. Calculate the total cost for each combination and filter those within budget.
-    valid_combinations = []
-    cheapest_combination = None
-    min_cost_so_far = float('inf')
+    def group_key(idx: int):
+        return tuple((v['material_type'], v['parent_type'], v['variant'], v['price'], v['area']) for v in sorted_variants[idx])
 
-    for i, combo in enumerate(all_combinations):
-        total_cost = sum(variant['price'] * variant['area'] for variant in combo)
-        
-        # Track the cheapest combination overall, regardless of budget
-        if total_cost < min_cost_so_far:
-            min_cost_so_far = total_cost
-            cheapest_combination = {'combo': combo, 'total_cost': total_cost}
-            
-        if total_cost <= total_budget:
-            valid_combinations.append({'combo': combo, 'total_cost': total_cost})
-        if (i + 1) % 10000 == 0:
-            logger.info(f"Processed {i+1} combinations...")
-    
-    logger.info(f"Found {len(valid_combinations)} valid combinations within budget. Cheapest possible option costs {min_cost_so_far:,.0f} VND.")
+    order = sorted(range(len(components)), key=lambda idx: (group_key(idx), idx))
+    cost_lists = [[v['price'] * v['area'] for v in sorted_variants[idx]] for idx in order]
+    same_as_prev = [k > 0 and group_key(order[k]) == group_key(order[k - 1]) for k in range(len(order))]
+
+    def to_combo(choice: Tuple[int, ...]) -> Tuple[Dict[str, Any], ...]:
+        # Map the grouped search order back to the caller's component order
+        picked = {idx: sorted_variants[idx][j] for idx, j in zip(order, choice)}
+        return tuple(picked[idx] for idx in range(len(components)))
+
+    # 3. Stream through the combinations, keeping only the best top_k within budget.
+    logger.info("Searching combinations...")
+    top_entries, visited = _top_k_combinations(cost_lists, same_as_prev, total_budget, top_k)
+
+    # The cheapest combination takes the cheapest choice for every component.
+    cheapest_combo = tuple(min(v, key=lambda x: x['price'] * x['area']) for v in variants_per_component)
+    min_cost_so_far = sum(v['price'] * v['area'] for v in cheapest_combo)
+    cheapest_combination = {'combo': cheapest_combo, 'total_cost': min_cost_so_far}
+
+    valid_combinations = [{'combo': to_combo(choice), 'total_cost': total} for total, _, choice in top_entries]
+
+    logger.info(f"Kept {len(valid_combinations)} best combinations within budget after visiting {visited}. Cheapest possible option costs {min_cost_so_far:,.0f} VND.")
 
     if not valid_combinations:
         if cheapest_combination:
@@ -668,11 +684,9 @@ def calculate_optimal_combinations(components: List[Dict[str, Any]], total_budge
             return (f"Rất tiếc, không tìm thấy tổ hợp vật liệu nào. "
                     "Vui lòng kiểm tra lại yêu cầu vật liệu.")
 
-    # 4. Sort the valid combinations by total cost in descending order to find the ones closest to the budget.
-    valid_combinations.sort(key=lambda x: x['total_cost'], reverse=True)
-
-    # 5. Get the top 2 options.
-    top_options = valid_combinations[:2]
+    # 4. The kept combinations are already ordered by total cost, closest to the budget first.
+    # 5. Get the top options.
+    top_options = valid_combinations
 
     # 6. Format the final response string.
     response_parts = [f"# Đề xuất các phương án tối ưu cho ngân sách {total_budget:,.0f} VND\n"]
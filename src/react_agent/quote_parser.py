@@ -10,6 +10,10 @@ from typing import List, Dict, Any
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Version of parse_image_report's output; bump it whenever the parsed materials
+# change shape or content so cached parsed reports (vision_cache) are not reused
+REPORT_FORMAT_VERSION = 1
+
 def parse_image_report(image_report: str) -> List[Dict[str, Any]]:
     """
     Parses an image analysis report and returns a list of material components.
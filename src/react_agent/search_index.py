@@ -0,0 +1,209 @@
+"""Full-text material search over a PriceCatalog.
+
+MaterialSearchIndex is built once per catalog. It is an inverted index of
+diacritic-folded word tokens taken from the category, material type,
+subtype and variant names of every variant. Subtype and variant names
+weigh more than the broader levels. Query words are folded the same way, so
+"san go", "sàn gỗ" and "go san" hit the same items. A word that is not in
+the vocabulary expands to vocabulary tokens it prefixes ("600x600" ->
+"600x600mm"), or failing that to tokens within a small edit distance,
+found through a character-trigram index. Every query word must match.
+Hits are ranked by BM25.
+"""
+
+import bisect
+import heapq
+import math
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from .catalog import PriceCatalog, get_catalog
+from .path_resolver import edit_distance, fold
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Term weight of each path level: category, material type, subtype, variant
+FIELD_WEIGHTS = (0.5, 1.0, 2.0, 2.0)
+# Score multipliers of expanded query words
+PREFIX_WEIGHT = 0.8
+TYPO_WEIGHT = 0.6
+# At most this many vocabulary tokens per expanded query word
+MAX_EXPANSIONS = 30
+
+
+@dataclass
+class SearchHit:
+    """One ranked search result (a catalog row)."""
+
+    index: int
+    score: float
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f"^{token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class MaterialSearchIndex:
+    """BM25 inverted index over the variants of a PriceCatalog."""
+
+    def __init__(self, catalog: PriceCatalog):
+        self.catalog = catalog
+        # token -> {row index: BM25 impact}; impacts are precomputed at build time
+        self._postings: Dict[str, Dict[int, float]] = {}
+        # token -> [(impact, row index)], best first; sorted on first use (top-k of one-token queries)
+        self._ranked: Dict[str, List[Tuple[float, int]]] = {}
+        self._trigram_tokens: Dict[str, List[str]] = {}
+        self._build()
+
+    def _build(self) -> None:
+        folded_segments: Dict[str, List[str]] = {}
+        frequencies: Dict[str, Dict[int, float]] = {}
+        lengths: List[float] = []
+        for index, path in enumerate(self.catalog.paths):
+            # Cấp sâu hơn 4 (nhóm trung gian) được tính như tên biến thể
+            weights: Dict[str, float] = {}
+            for depth, segment in enumerate(path):
+                tokens = folded_segments.get(segment)
+                if tokens is None:
+                    tokens = folded_segments[segment] = fold(segment).split()
+                weight = FIELD_WEIGHTS[min(depth, len(FIELD_WEIGHTS) - 1)]
+                for token in tokens:
+                    weights[token] = weights.get(token, 0.0) + weight
+            for token, weight in weights.items():
+                frequencies.setdefault(token, {})[index] = weight
+            lengths.append(sum(weights.values()))
+
+        count = len(lengths)
+        average = (sum(lengths) / count) if count else 1.0
+        for token, rows in frequencies.items():
+            idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+            impacts = {
+                index: idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * lengths[index] / average))
+                for index, tf in rows.items()
+            }
+            self._postings[token] = impacts
+
+        self._vocabulary = sorted(self._postings)
+        for token in self._vocabulary:
+            for trigram in _trigrams(token):
+                self._trigram_tokens.setdefault(trigram, []).append(token)
+
+    def expand(self, word: str) -> Dict[str, float]:
+        """Vocabulary tokens a folded query word stands for, with their weights."""
+        if word in self._postings:
+            return {word: 1.0}
+        expansions: Dict[str, float] = {}
+        start = bisect.bisect_left(self._vocabulary, word)
+        for token in self._vocabulary[start:start + MAX_EXPANSIONS]:
+            if not token.startswith(word):
+                break
+            expansions[token] = PREFIX_WEIGHT
+        if expansions:
+            return expansions
+
+        # Sai chính tả: ứng viên chung trigram, lọc bằng khoảng cách chỉnh sửa
+        limit = 1 if len(word) <= 5 else 2
+        shared: Dict[str, int] = {}
+        for trigram in _trigrams(word):
+            for token in self._trigram_tokens.get(trigram, []):
+                shared[token] = shared.get(token, 0) + 1
+        for token, _ in heapq.nlargest(MAX_EXPANSIONS, shared.items(), key=lambda item: item[1]):
+            distance = edit_distance(word, token, limit)
+            if distance <= limit:
+                expansions[token] = TYPO_WEIGHT * (1 - distance / (limit + 1))
+        return expansions
+
+    def _word_score(self, expansions: Dict[str, float], index: int) -> float:
+        """Best weighted impact of a row over the tokens of one query word (0 if none)."""
+        best = 0.0
+        for token, weight in expansions.items():
+            impact = self._postings[token].get(index)
+            if impact is not None and impact * weight > best:
+                best = impact * weight
+        return best
+
+    def search(self, query: str, limit: Optional[int] = None) -> Tuple[List[SearchHit], int]:
+        """
+        Rank the catalog rows matching every word of ``query``.
+
+        Args:
+            query: Free text, with or without Vietnamese diacritics
+            limit: Return only the best ``limit`` hits (all when None)
+
+        Returns:
+            The hits, best first, and the total number of matching rows
+        """
+        words = list(dict.fromkeys(fold(query).split()))
+        if not words:
+            return [], 0
+        expanded = [self.expand(word) for word in words]
+        if not all(expanded):
+            return [], 0
+
+        if len(expanded) == 1 and len(expanded[0]) == 1:
+            # Một token: danh sách đã xếp sẵn theo điểm, lấy thẳng top-k
+            (token, weight), = expanded[0].items()
+            ranked = self._ranked.get(token)
+            if ranked is None:
+                ranked = self._ranked[token] = sorted(
+                    ((impact, index) for index, impact in self._postings[token].items()),
+                    key=lambda item: (-item[0], item[1]))
+            best = ranked if limit is None else ranked[:limit]
+            return [SearchHit(index, impact * weight) for impact, index in best], len(ranked)
+
+        # Giao tập dòng của các từ (trong C), bắt đầu từ từ hiếm nhất; chỉ chấm điểm phần giao
+        expanded.sort(key=lambda tokens: sum(len(self._postings[token]) for token in tokens))
+        common: Set[int] = set()
+        for token in expanded[0]:
+            common.update(self._postings[token])
+        for tokens in expanded[1:]:
+            if not common:
+                break
+            if len(tokens) == 1:
+                common.intersection_update(self._postings[next(iter(tokens))])
+            else:
+                common &= set().union(*(self._postings[token] for token in tokens))
+        totals = {index: sum(self._word_score(tokens, index) for tokens in expanded) for index in common}
+
+        # Hòa điểm thì giữ thứ tự catalog
+        ranked_rows = ((-score, index) for index, score in totals.items())
+        best_rows = heapq.nsmallest(limit, ranked_rows) if limit is not None else sorted(ranked_rows)
+        return [SearchHit(index, -score) for score, index in best_rows], len(totals)
+
+
+_indexes: Dict[int, Tuple[PriceCatalog, MaterialSearchIndex]] = {}
+# Request threads and the catalog watcher read and fill _indexes concurrently
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(data: Optional[dict] = None) -> MaterialSearchIndex:
+    """Search index for the shared catalog (or for a given tree), built once per tree."""
+    tree = get_catalog().data if data is None else data
+    with _indexes_lock:
+        cached = _indexes.get(id(tree))
+    if cached is not None and cached[0].data is tree:
+        return cached[1]
+    return build_search_index(get_catalog(tree))
+
+
+def build_search_index(catalog: PriceCatalog) -> MaterialSearchIndex:
+    """Build and cache the search index of ``catalog`` (e.g. before a reloaded catalog goes live)."""
+    index = MaterialSearchIndex(catalog)
+    with _indexes_lock:
+        # Another thread may have built the same tree meanwhile: keep the first one
+        cached = _indexes.get(id(catalog.data))
+        if cached is not None and cached[0].data is catalog.data:
+            return cached[1]
+        _indexes.pop(id(catalog.data), None)
+        if len(_indexes) >= 4:
+            _indexes.pop(next(iter(_indexes)))
+        _indexes[id(catalog.data)] = (catalog, index)
+    return index
+
+
+def search_rows(query: str, limit: Optional[int] = None, data: Optional[dict] = None) -> Tuple[List[SearchHit], int]:
+    """Shortcut for ``get_search_index(data).search(query, limit)``."""
+    return get_search_index(data).search(query, limit)
@@ -0,0 +1,248 @@
+"""Pluggable storage for chat session histories.
+
+Each turn appends only its new messages instead of rewriting the whole
+history: the default backend keeps one append-only JSONL log per session,
+the SQLite backend keeps every session in one WAL-mode database. Both
+serialize writers per session and keep recently used sessions in an
+in-process LRU cache.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+Message = Dict[str, Any]
+
+# Number of sessions kept in memory by default
+DEFAULT_CACHE_SIZE = 256
+
+_SAFE_SESSION_ID = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+
+class SessionStore(ABC):
+    """Base class: per-session locking and LRU caching around a storage backend.
+
+    Subclasses implement ``_read`` (full history from storage) and ``_write``
+    (append messages to storage).
+    """
+
+    def __init__(self, cache_size: int = DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, List[Message]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # session_id -> [lock, number of threads holding or waiting for it]
+        self._locks: Dict[str, List[Any]] = {}
+        self._locks_guard = threading.Lock()
+
+    # --- Backend hooks ---
+
+    @abstractmethod
+    def _read(self, session_id: str) -> List[Message]:
+        """Return the full history of a session from storage (empty if unknown)."""
+
+    @abstractmethod
+    def _write(self, session_id: str, messages: List[Message]) -> None:
+        """Append messages to a session in storage."""
+
+    # --- Public API ---
+
+    @contextmanager
+    def lock(self, session_id: str) -> Iterator[None]:
+        """Hold the lock that serializes writers of one session.
+
+        A session's lock only exists while some thread holds or waits for it,
+        so the lock table stays as small as the number of concurrent sessions.
+        """
+        with self._locks_guard:
+            entry = self._locks.get(session_id)
+            if entry is None:
+                entry = self._locks[session_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_guard:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[session_id]
+
+    def load(self, session_id: str) -> List[Message]:
+        """Return a copy of the session's message history (empty if unknown)."""
+        _check_session_id(session_id)
+        cached = self._cache_get(session_id)
+        if cached is not None:
+            return list(cached)
+
+        with self.lock(session_id):
+            cached = self._cache_get(session_id)
+            if cached is None:
+                cached = self._read(session_id)
+                self._cache_put(session_id, cached)
+            return list(cached)
+
+    def append(self, session_id: str, messages: Iterable[Message]) -> None:
+        """Append new messages to the session; cost is proportional to the new messages only."""
+        _check_session_id(session_id)
+        messages = list(messages)
+        if not messages:
+            return
+
+        with self.lock(session_id):
+            self._write(session_id, messages)
+            with self._cache_lock:
+                cached = self._cache.get(session_id)
+                if cached is not None:
+                    cached.extend(messages)
+
+    # --- LRU cache ---
+
+    def _cache_get(self, session_id: str) -> Optional[List[Message]]:
+        with self._cache_lock:
+            cached = self._cache.get(session_id)
+            if cached is not None:
+                self._cache.move_to_end(session_id)
+            return cached
+
+    def _cache_put(self, session_id: str, messages: List[Message]) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            self._cache[session_id] = messages
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+class JsonlSessionStore(SessionStore):
+    """One append-only ``<session_id>.jsonl`` file per session.
+
+    Histories written by the previous ``<session_id>.json`` format are read
+    transparently and migrated to JSONL on first load.
+    """
+
+    def __init__(self, directory: str = "sessions", cache_size: int = DEFAULT_CACHE_SIZE):
+        super().__init__(cache_size)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id: str, extension: str = ".jsonl") -> str:
+        return os.path.join(self.directory, f"{session_id}{extension}")
+
+    def _read(self, session_id: str) -> List[Message]:
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return self._migrate_legacy(session_id)
+
+        messages = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    messages.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Dòng cuối bị ghi dở (ví dụ tiến trình bị dừng giữa chừng) thì bỏ qua
+                    print(f"Skipping corrupt line in session log {path}")
+        return messages
+
+    def _write(self, session_id: str, messages: List[Message]) -> None:
+        lines = "".join(json.dumps(message, ensure_ascii=False) + "\n" for message in messages)
+        with open(self._path(session_id), 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+    def _migrate_legacy(self, session_id: str) -> List[Message]:
+        legacy_path = self._path(session_id, ".json")
+        if not os.path.exists(legacy_path):
+            return []
+        with open(legacy_path, 'r', encoding='utf-8') as f:
+            messages = json.load(f)
+        if messages:
+            self._write(session_id, messages)
+        os.remove(legacy_path)
+        return messages
+
+
+class SqliteSessionStore(SessionStore):
+    """All sessions in one SQLite database in WAL mode, one row per message."""
+
+    def __init__(self, path: str = os.path.join("sessions", "sessions.db"), cache_size: int = DEFAULT_CACHE_SIZE):
+        super().__init__(cache_size)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "session_id TEXT NOT NULL, "
+                "message TEXT NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id, id)"
+            )
+
+    def _read(self, session_id: str) -> List[Message]:
+        with self._db_lock:
+            rows = self._connection.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def _write(self, session_id: str, messages: List[Message]) -> None:
+        with self._db_lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+                [(session_id, json.dumps(message, ensure_ascii=False)) for message in messages]
+            )
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._connection.close()
+
+
+def is_valid_session_id(session_id: Any) -> bool:
+    """Check that a client-supplied session id is safe to use as a storage key."""
+    return isinstance(session_id, str) and bool(_SAFE_SESSION_ID.match(session_id)) and session_id not in (".", "..")
+
+
+def _check_session_id(session_id: str) -> None:
+    # session_id đến từ header của client nên không được chứa ký tự đường dẫn
+    if not is_valid_session_id(session_id):
+        raise ValueError(f"Invalid session id: {session_id!r}")
+
+
+def create_session_store(
+    backend: Optional[str] = None,
+    directory: str = "sessions",
+    cache_size: int = DEFAULT_CACHE_SIZE
+) -> SessionStore:
+    """
+    Create a session store.
+
+    Args:
+        backend: "jsonl" (default) or "sqlite"; falls back to the SESSION_STORE env var
+        directory: Directory holding the JSONL logs or the SQLite database
+        cache_size: Number of hot sessions kept in memory
+
+    Returns:
+        The configured SessionStore
+    """
+    backend = (backend or os.getenv("SESSION_STORE") or "jsonl").lower()
+    if backend == "jsonl":
+        return JsonlSessionStore(directory, cache_size)
+    if backend == "sqlite":
+        return SqliteSessionStore(os.path.join(directory, "sessions.db"), cache_size)
+    raise ValueError(f"Unknown session store backend: {backend}")
@@ -42,6 +42,9 @@ class InputState:
 class State(TypedDict):
     messages: Annotated[list, add_messages]
     
+    # Client session, used to keep the incremental history summary between turns
+    session_id: Optional[str]
+    
     # A concise summary of the conversation history
     history_summary: Optional[str]
     
@@ -1,6 +1,13 @@
 import json
+import math
 import re
 
+import numpy as np
+
+from .catalog import catalog_version, get_catalog
+from .path_resolver import DEFAULT_MIN_CONFIDENCE, resolve_catalog_path
+from .pricing import summarize_costs, surface_costs
+
 # === PARSE AREA ===
 def parse_area(area_input):
     try:
@@ -22,6 +29,14 @@ def parse_area(area_input):
 
 # === FIND PRICE RANGE WITH VẬT TƯ + NHÂN CÔNG ===
 def find_price_range(node):
+    # Nodes of the shared catalog are answered from its precomputed aggregates
+    catalog = get_catalog()
+    path = catalog.path_of(node)
+    if path is not None:
+        price_range = catalog.price_range(path)
+        if price_range is not None:
+            return _legacy_ranges(price_range)
+
     vt_prices = []
     nc_prices = []
 
@@ -48,11 +63,34 @@ def find_price_range(node):
         )
     return (None, None), (None, None)
 
+def _legacy_ranges(price_range):
+    """Convert a catalog price range to find_price_range's ((vt_min, vt_max), (nc_min, nc_max))."""
+    # A variant without 'Nhân công' counts as 0 labor, as in collect_prices
+    nc_min = price_range["labor_min"] if price_range["labor_count"] == price_range["count"] else 0
+    nc_max = price_range["labor_max"] if price_range["labor_max"] is not None else 0
+    return (
+        (price_range["material_min"], price_range["material_max"]),
+        (nc_min, nc_max)
+    )
+
+def price_range_for_path(data, path, node):
+    """
+    Same result as find_price_range(node), read from the compiled catalog's
+    precomputed aggregates when ``path`` addresses ``node`` exactly (O(1)).
+    Fuzzy-resolved nodes fall back to find_price_range.
+    """
+    price_range = get_catalog(data).price_range(path)
+    if price_range is None:
+        return find_price_range(node)
+    return _legacy_ranges(price_range)
+
 # === WALK JSON PATH ===
 def resolve_path(data, path):
     """
     Walk a JSON path and return the node if found.
-    Supports flexible path matching by searching within the database structure.
+    Supports flexible path matching (missing diacritics, typos, skipped levels)
+    through the prebuilt PathResolver; a fuzzy match must land on a priced
+    variant with enough confidence.
     """
     # First try the exact path
     node = data
@@ -66,47 +104,27 @@ def resolve_path(data, path):
     if node is not None:
         return node
     
-    # If exact path doesn't work, search for the best match
-    # We'll do a recursive search through the database structure
-    def search_node(current_node, remaining_path):
-        if not remaining_path:
-            # If we've consumed all path elements, check if this node has pricing info
-            if isinstance(current_node, dict) and "Vật tư" in current_node:
-                return current_node
-            return None
-        
-        current_key = remaining_path[0]
-        rest_path = remaining_path[1:]
-        
-        if isinstance(current_node, dict):
-            # Try exact match first
-            if current_key in current_node:
-                result = search_node(current_node[current_key], rest_path)
-                if result is not None:
-                    return result
-            
-            # If exact match fails, try fuzzy matching
-            # Look for nodes that contain the current key as a substring
-            for key, value in current_node.items():
-                if isinstance(value, dict):
-                    # Check if the key matches or contains the target
-                    if current_key.lower() in key.lower() or key.lower() in current_key.lower():
-                        result = search_node(value, rest_path)
-                        if result is not None:
-                            return result
-                    
-                    # If that fails, recursively search deeper
-                    result = search_node(value, remaining_path)
-                    if result is not None:
-                        return result
-        
+    match = resolve_catalog_path(path, data)
+    if match is None or not match.is_variant or match.confidence < DEFAULT_MIN_CONFIDENCE:
         return None
-    
-    # Start the search from the root
-    return search_node(data, path)
+    node = data
+    for key in match.path:
+        node = node[key]
+    return node
 
 # === CALCULATE FOR ONE SURFACE ===
 def calculate_cost(data, path, area, budget=None, cost_type="all"):
+    results, _ = _calculate_surfaces(data, [(path, area, budget, cost_type)])
+    return results[0]
+
+def _price_surface(data, path, area, budget, cost_type):
+    """
+    Resolve one surface's unit prices; the area totals are filled in by _calculate_surfaces.
+
+    Returns:
+        Tuple of (result, [min, max, vật tư, nhân công] unit prices or None when
+        there is nothing to multiply by an area, parsed area)
+    """
     # Handle unit price quotes (when area is None)
     if area is None:
         node = resolve_path(data, path)
@@ -116,7 +134,7 @@ def calculate_cost(data, path, area, budget=None, cost_type="all"):
                 "path": " > ".join(path),
                 "area": area,
                 "budget": budget
-            }
+            }, None, None
 
         result = {
             "path": " > ".join(path),
@@ -149,7 +167,7 @@ def calculate_cost(data, path, area, budget=None, cost_type="all"):
         else:
             result["error"] = "Không tìm thấy đơn giá trong node đã chọn"
         
-        return result
+        return result, None, None
     
     # Handle regular quotes (when area is provided)
     parsed_area = parse_area(area)
@@ -159,7 +177,7 @@ def calculate_cost(data, path, area, budget=None, cost_type="all"):
             "path": " > ".join(path),
             "area": area,
             "budget": budget
-        }
+        }, None, None
 
     node = resolve_path(data, path)
     if node is None:
@@ -168,47 +186,49 @@ def calculate_cost(data, path, area, budget=None, cost_type="all"):
             "path": " > ".join(path),
             "area": parsed_area,
             "budget": budget
-        }
+        }, None, None
 
     result = {
         "path": " > ".join(path),
         "area": parsed_area,
         "budget": budget
     }
+    unit = None
 
+    # Các ô total_* được điền sau, khi mọi bề mặt đã được nhân với diện tích cùng lúc
     if isinstance(node, dict) and "Vật tư" in node:
         vt = node["Vật tư"]
         nc = node.get("Nhân công", 0)
         
         # Special handling for "Sàn gạch" - if labor cost is missing, only show material cost
         if len(path) >= 2 and path[0] == "Sàn" and path[1] == "Sàn gạch" and "Nhân công" not in node:
-            total = vt * parsed_area
             result.update({
                 "type": "specific",
                 "unit_vattu": vt,
                 "unit_nhancong": None,
-                "total_vattu": vt * parsed_area,
+                "total_vattu": None,
                 "total_nhancong": None,
-                "total_cost": total,
+                "total_cost": None,
                 "note": "Chưa có giá nhân công cho loại vật liệu này"
             })
+            unit = [vt, vt, vt, np.nan]
         else:
             if cost_type == "vat_tu":
                 nc = 0
             elif cost_type == "nhan_cong":
                 vt = 0
-            total = (vt + nc) * parsed_area
             result.update({
                 "type": "specific",
                 "unit_vattu": vt,
                 "unit_nhancong": nc,
-                "total_vattu": vt * parsed_area,
-                "total_nhancong": nc * parsed_area,
-                "total_cost": total
+                "total_vattu": None,
+                "total_nhancong": None,
+                "total_cost": None
             })
+            unit = [vt + nc, vt + nc, vt, nc]
     elif len(path) == 0:
         result["type"] = "summary"
-        (vt_min, vt_max), (nc_min, nc_max) = find_price_range(node)
+        (vt_min, vt_max), (nc_min, nc_max) = price_range_for_path(data, path, node)
         if vt_min is not None:
             if cost_type == "vat_tu":
                 min_total = vt_min
@@ -221,10 +241,11 @@ def calculate_cost(data, path, area, budget=None, cost_type="all"):
                 max_total = vt_max + nc_max
             result.update({
                 "unit_price_range": f"{min_total:,} - {max_total:,} VND",
-                "total_cost_range": f"{min_total * parsed_area:,} - {max_total * parsed_area:,} VND"
+                "total_cost_range": None
             })
+            unit = [min_total, max_total, np.nan, np.nan]
     else:
-        (vt_min, vt_max), (nc_min, nc_max) = find_price_range(node)
+        (vt_min, vt_max), (nc_min, nc_max) = price_range_for_path(data, path, node)
         if vt_min is not None:
             if cost_type == "vat_tu":
                 min_total = vt_min
@@ -238,8 +259,9 @@ def calculate_cost(data, path, area, budget=None, cost_type="all"):
             result.update({
                 "type": "range",
                 "unit_price_range": f"{min_total:,} - {max_total:,} VND",
-                "total_cost_range": f"{min_total * parsed_area:,} - {max_total * parsed_area:,} VND"
+                "total_cost_range": None
             })
+            unit = [min_total, max_total, np.nan, np.nan]
             if budget is not None:
                 max_allowable = budget / parsed_area
                 if max_total < max_allowable:
@@ -251,55 +273,63 @@ def calculate_cost(data, path, area, budget=None, cost_type="all"):
         else:
             result["error"] = "Không tìm thấy đơn giá trong node đã chọn"
 
-    return result
+    return result, unit, parsed_area
+
+def _calculate_surfaces(data, surfaces):
+    """
+    Price several surfaces, multiplying every unit price by its area in one pricing-kernel call.
+
+    Args:
+        data: Catalog tree
+        surfaces: (path, area, budget, cost_type) of each surface
+
+    Returns:
+        Tuple of (result per surface, summarize_costs aggregates of the [min, max]
+        totals of the surfaces that have an area and a price)
+    """
+    results = []
+    priced_results, units, areas = [], [], []
+    for path, area, budget, cost_type in surfaces:
+        result, unit, parsed_area = _price_surface(data, path, area, budget, cost_type)
+        results.append(result)
+        if unit is not None:
+            priced_results.append(result)
+            units.append(unit)
+            areas.append(parsed_area)
+
+    costs = surface_costs(np.array(units, dtype=np.float64).reshape(-1, 4), areas)
+    for result, (total_min, total_max, total_vt, total_nc) in zip(priced_results, costs.tolist()):
+        if result["type"] == "specific":
+            result.update({
+                "total_vattu": total_vt,
+                "total_nhancong": None if math.isnan(total_nc) else total_nc,
+                "total_cost": total_min
+            })
+        else:
+            result["total_cost_range"] = f"{total_min:,} - {total_max:,} VND"
+    return results, summarize_costs(costs[:, :2])
 
 # === CALCULATE ALL SURFACES (cho phép cost_type riêng từng surface) ===
 def calculate_from_area_map(data, area_map, default_cost_type="all"):
     surfaces = area_map.get("surfaces", {})
     total_budget = area_map.get("total_budget", None)
+
+    surface_results, totals = _calculate_surfaces(data, [
+        (surface.get("path"), surface.get("area"), surface.get("budget", None), surface.get("cost_type", default_cost_type))
+        for surface in surfaces.values()
+    ])
     results = {}
-    total_min = 0
-    total_max = 0
-
-    for position, surface in surfaces.items():
-        path = surface.get("path")
-        area = surface.get("area")
-        budget = surface.get("budget", None)
-        cost_type = surface.get("cost_type", default_cost_type)
-        result = calculate_cost(data, path, area, budget, cost_type=cost_type)
+    for position, result in zip(surfaces, surface_results):
         result["position"] = position
         results[position] = result
 
-        if "error" in result:
-            continue
-        if result.get("type") == "specific":
-            # For unit price quotes, total_cost might not be present
-            if "total_cost" in result:
-                total_min += result["total_cost"]
-                total_max += result["total_cost"]
-        elif result.get("type") in ["range", "summary"]:
-            try:
-                # Extract numeric values from range text like "1,100,000.0 - 257,500,000.0 VND"
-                range_text = result.get("total_cost_range", "0 - 0")
-                range_parts = range_text.split(" - ")
-                if len(range_parts) == 2:
-                    # Extract min value (before " - ")
-                    min_text = range_parts[0].replace(",", "")
-                    # Extract max value (after " - " but before " VND")
-                    max_text = range_parts[1].split(" ")[0].replace(",", "")
-                    
-                    # Convert to float first, then to int
-                    total_min += int(float(min_text))
-                    total_max += int(float(max_text))
-            except Exception as e:
-                # Log error for debugging but don't crash
-                print(f"Warning: Could not parse range text '{range_text}': {e}")
-                pass
-
+    total_min = totals["total_min"]
+    total_max = totals["total_max"]
     group_summary = {
         "total_budget": total_budget,
         "total_cost_min": total_min,
-        "total_cost_max": total_max
+        "total_cost_max": total_max,
+        "catalog_version": catalog_version(data)
     }
 
     if total_budget is not None:
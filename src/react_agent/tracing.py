@@ -0,0 +1,175 @@
+"""Per-request tracing and latency percentiles.
+
+Each chat turn runs inside ``trace_request``, which gives it a trace id and
+collects the spans recorded while it runs (vision call, every LLM call, each
+tool execution). The current trace travels in a context variable, so graph
+nodes and helpers record spans without any extra arguments. Finished traces
+are written as JSON lines through a background sink (see debug_utils) and
+span durations are kept in memory for the p50/p95/p99 of ``/api/metrics``.
+"""
+
+import contextvars
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from .debug_utils import DebugLogSink
+
+# Durations kept per span name for the percentiles
+TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", "2000"))
+TRACE_LOG_ENABLED = os.getenv("TRACE_LOG", "1").lower() not in ("0", "false", "no")
+
+
+class Trace:
+    """Spans recorded during one request."""
+
+    def __init__(self, kind: str, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span: Dict[str, Any]) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "kind": self.kind,
+            "started_at": self.started_at,
+            "duration_ms": (time.perf_counter() - self.start) * 1000,
+            "attributes": self.attributes,
+            "spans": spans,
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("current_trace", default=None)
+
+_durations_lock = threading.Lock()
+_durations: Dict[str, Deque[float]] = {}
+_counts: Dict[str, int] = {}
+
+trace_sink = DebugLogSink(filename="traces.jsonl")
+
+
+def current_trace() -> Optional[Trace]:
+    """The trace of the request being handled, if any."""
+    return _current_trace.get()
+
+
+def _observe(name: str, duration_ms: float) -> None:
+    with _durations_lock:
+        window = _durations.get(name)
+        if window is None:
+            window = _durations[name] = deque(maxlen=TRACE_WINDOW)
+        window.append(duration_ms)
+        _counts[name] = _counts.get(name, 0) + 1
+
+
+@contextmanager
+def trace_request(kind: str, **attributes: Any) -> Iterator[Trace]:
+    """
+    Trace one request (an /api/chat call or a websocket turn).
+
+    Args:
+        kind: Request type, e.g. "chat" or "ws"
+        **attributes: Extra fields stored with the trace (session id, ...)
+
+    Yields:
+        The new Trace; its ``trace_id`` can be returned to the client
+    """
+    trace = Trace(kind, attributes)
+    token = _current_trace.set(trace)
+    status = "ok"
+    try:
+        yield trace
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current_trace.reset(token)
+        record = trace.to_dict()
+        record["status"] = status
+        _observe(f"request.{kind}", record["duration_ms"])
+        if TRACE_LOG_ENABLED:
+            trace_sink.submit(record)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Time a block as a span of the current trace.
+
+    The yielded dict holds the span's attributes; add to it inside the block
+    (e.g. token counts). Durations are recorded for the metrics even when no
+    trace is active.
+    """
+    trace = _current_trace.get()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attributes
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        _observe(name, duration_ms)
+        if trace is not None:
+            trace.add_span({
+                "name": name,
+                "offset_ms": (start - trace.start) * 1000,
+                "duration_ms": duration_ms,
+                "status": status,
+                **attributes,
+            })
+
+
+def record_token_usage(attributes: Dict[str, Any], response: Any) -> None:
+    """Copy prompt/response token counts from a chat model response into span attributes."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage:
+        attributes["prompt_tokens"] = usage.get("input_tokens")
+        attributes["response_tokens"] = usage.get("output_tokens")
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    # Nearest-rank percentile
+    index = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
+
+
+def latency_metrics() -> Dict[str, Dict[str, float]]:
+    """Count, mean and p50/p95/p99 (ms) per span name over the recent window."""
+    with _durations_lock:
+        snapshot = {name: (list(window), _counts[name]) for name, window in _durations.items()}
+    metrics = {}
+    for name, (values, count) in sorted(snapshot.items()):
+        values.sort()
+        metrics[name] = {
+            "count": count,
+            "window": len(values),
+            "mean_ms": sum(values) / len(values),
+            "p50_ms": _percentile(values, 0.50),
+            "p95_ms": _percentile(values, 0.95),
+            "p99_ms": _percentile(values, 0.99),
+            "max_ms": values[-1],
+        }
+    return metrics
+
+
+def reset_metrics() -> None:
+    with _durations_lock:
+        _durations.clear()
+        _counts.clear()
@@ -1,6 +1,6 @@
 """Utility & helper functions."""
 
-from langchain_ollama import ChatOllama
+from .model_registry import get_chat_model
 import re
 
 
@@ -43,11 +43,9 @@ def load_chat_model(model_name: str):
         model_name: The name of the Ollama model to load (e.g., "qwen2:7b").
 
     Returns:
-        An instance of ChatOllama.
+        The shared, pooled ChatOllama instance for that model (see model_registry).
     """
-    # This is a simple wrapper for loading Ollama models.
-    # This can be extended later to include other configurations like base_url.
-    return ChatOllama(model=model_name)
+    return get_chat_model(model_name, cached=False)
 
 def _format_history(messages: list) -> str:
     """Helper to format the history for the prompt."""
@@ -1,10 +1,15 @@
 import os
+import asyncio
 import google.generativeai as genai
-from PIL import Image
-import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple, Union
 from dotenv import load_dotenv
 import logging
 from .prompts import VISION_PROMPT
+from .quote_parser import parse_image_report
+from .vision_cache import cache_key, raw_cache_key, vision_cache
+from .tracing import span
+from .image_preprocess import ImageInput, PREPROCESS_CONFIG, PreparedImage, PreprocessConfig, preprocess_image
 
 # Set up basic logging to see the output in the console
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -12,25 +17,124 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure the Gemini API key
-api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
-    raise ValueError("GOOGLE_API_KEY not found in .env file. Please add it.")
+# Gemini model used for room photo analysis
+VISION_MODEL_NAME = os.getenv("VISION_MODEL", "gemini-2.5-flash")
 
-genai.configure(api_key=api_key)
-
-# Initialize the Gemini Pro Vision model
-vision_model = genai.GenerativeModel('gemini-2.5-flash')
+# Maximum number of vision calls in flight at once (per process)
+VISION_MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "4"))
 
 # Mặc định prompt cho phân tích hình ảnh
 # DEFAULT_VISION_PROMPT is now imported as VISION_PROMPT from prompts.py
 
+class VisionClient:
+    """Async client for a Gemini-style vision model.
+
+    The event loop is never blocked: image decoding and pre-processing
+    (see image_preprocess) always run in the thread pool, and the model call uses the model's native ``generate_content_async``
+    when available (and ``use_native_async`` is set), otherwise its synchronous
+    ``generate_content`` is offloaded to the same pool. A semaphore bounds the
+    number of concurrent model calls.
+
+    Any object with ``generate_content(content)`` (and optionally
+    ``generate_content_async(content)``) returning something with a ``.text``
+    attribute can be used as the model, e.g. a local stub in tests.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        max_concurrency: int = VISION_MAX_CONCURRENCY,
+        executor: Optional[ThreadPoolExecutor] = None,
+        use_native_async: bool = True,
+        preprocess_config: Optional[PreprocessConfig] = None
+    ):
+        self.model = model
+        self.preprocess_config = preprocess_config or PREPROCESS_CONFIG
+        self.max_concurrency = max_concurrency
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="vision"
+        )
+        self.use_native_async = use_native_async
+        self.model_name = getattr(model, "model_name", type(model).__name__)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_in_pool(self, func, *args):
+        """Run a blocking function in the client's thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def _generate(self, content: list) -> Any:
+        generate_async = getattr(self.model, "generate_content_async", None)
+        if self.use_native_async and generate_async is not None:
+            return await generate_async(content)
+        return await self.run_in_pool(self.model.generate_content, content)
+
+    async def prepare(self, image_path_or_bytes: Union[ImageInput, PreparedImage]) -> PreparedImage:
+        """Decode and pre-process an image in the thread pool (no-op if already prepared)."""
+        if isinstance(image_path_or_bytes, PreparedImage):
+            return image_path_or_bytes
+        return await self.run_in_pool(preprocess_image, image_path_or_bytes, self.preprocess_config)
+
+    async def report(self, image_path_or_bytes: Union[ImageInput, PreparedImage], prompt: Optional[str] = None) -> str:
+        """
+        Analyze one image and return the model's textual report.
+
+        Args:
+            image_path_or_bytes: A file path, raw image bytes, a PIL image or a PreparedImage
+            prompt: The text prompt to guide the analysis. If None, uses the default prompt.
+
+        Returns:
+            The report text generated by the vision model
+        """
+        prepared = await self.prepare(image_path_or_bytes)
+
+        # Use default prompt if none provided
+        if prompt is None:
+            prompt = VISION_PROMPT
+            logging.info("Using default vision prompt")
+
+        # Prepare the content for the API call
+        content = [prompt, prepared.as_content()]
+
+        async with self._semaphore:
+            logging.info(f"Sending prompt to vision model: '{prompt[:150]}...'")
+            response = await self._generate(content)
+
+        # Log the raw response for debugging
+        logging.info("Received a successful response from the vision model.")
+        logging.debug(f"Full vision response: {response.text}")
+        return response.text
+
+
+_default_client: Optional[VisionClient] = None
+
+
+def get_vision_client() -> VisionClient:
+    """Return the shared Gemini vision client, configuring the API on first use."""
+    global _default_client
+    if _default_client is None:
+        # Configure the Gemini API key
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise ValueError("GOOGLE_API_KEY not found in .env file. Please add it.")
+        genai.configure(api_key=api_key)
+        _default_client = VisionClient(genai.GenerativeModel(VISION_MODEL_NAME))
+    return _default_client
+
+
+def set_vision_client(client: Optional[VisionClient]) -> None:
+    """Replace the shared client (e.g. with one wrapping a local stub model); None resets it."""
+    global _default_client
+    _default_client = client
+
+
 async def get_gemini_vision_report(image_path_or_bytes, prompt=None):
     """
     Analyzes an image using the Gemini Pro Vision model and returns a textual report.
 
-    This function takes an image (as a file path or bytes) and a text prompt, 
+    This function takes an image (as a file path or bytes) and a text prompt,
     sends them to the Gemini API, and returns the generated text description.
+    The call does not block the event loop.
 
     Args:
         image_path_or_bytes: Either a path to an image file or the image data as bytes
@@ -38,48 +142,81 @@ async def get_gemini_vision_report(image_path_or_bytes, prompt=None):
 
     Returns:
         A string containing the report generated by the vision model.
-        
+
     Raises:
         Exception: If the API call to Gemini fails.
     """
     try:
         logging.info("Preparing to call Gemini Vision API.")
-        
-        # Determine if input is a file path or bytes
-        if isinstance(image_path_or_bytes, str):
-            # It's a file path
-            logging.info(f"Loading image from path: {image_path_or_bytes}")
-            image = Image.open(image_path_or_bytes)
-        else:
-            # It's bytes data
-            logging.info("Loading image from bytes data")
-            image = Image.open(io.BytesIO(image_path_or_bytes))
-        
-        # Use default prompt if none provided
-        if prompt is None:
-            prompt = VISION_PROMPT
-            logging.info("Using default vision prompt")
-        
-        # Prepare the content for the API call
-        content = [prompt, image]
-        
-        logging.info(f"Sending prompt to Gemini: '{prompt[:150]}...'")
-        
-        # Call the Gemini API
-        response = vision_model.generate_content(content)
-        
-        # Log the raw response for debugging
-        logging.info("Received a successful response from Gemini.")
-        logging.debug(f"Full Gemini response: {response.text}")
-        
-        # Return the generated text
-        return response.text
+        return await get_vision_client().report(image_path_or_bytes, prompt)
     except Exception as e:
         # Log the full exception to the console
         logging.error(f"Error calling Gemini Vision API: {e}", exc_info=True)
-        # Re-raise the exception so it can be caught by the Flask app and shown in the UI
+        # Re-raise the exception so it can be caught by the server and shown in the UI
         raise
 
+
+def _raw_cache_key(image_input: Any, prompt: str, model_signature: str) -> Optional[str]:
+    """Cache key of the uploaded file bytes (paths and bytes only; None for decoded images)."""
+    if isinstance(image_input, str):
+        with open(image_input, "rb") as f:
+            return raw_cache_key(f.read(), prompt, model_signature)
+    if isinstance(image_input, (bytes, bytearray, memoryview)):
+        return raw_cache_key(bytes(image_input), prompt, model_signature)
+    return None
+
+
+async def analyze_image(image_path_or_bytes, prompt=None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Analyze an image and parse its material components, reusing cached results.
+
+    A byte-identical re-upload is answered from the cache before the image is
+    decoded. Otherwise the image is pre-processed and looked up by its
+    normalized content, prompt, model and pre-processing settings (see
+    vision_cache), so re-uploading the same photo returns without calling the
+    vision model.
+
+    Args:
+        image_path_or_bytes: Either a path to an image file or the image data as bytes
+        prompt: The text prompt to guide the analysis. If None, uses the default prompt.
+
+    Returns:
+        Tuple of (image report text, parsed materials)
+    """
+    client = get_vision_client()
+    prompt = prompt if prompt is not None else VISION_PROMPT
+
+    with span("vision", model=client.model_name) as attributes:
+        model_signature = f"{client.model_name}:{client.preprocess_config.signature()}"
+        # Lần tra đầu theo hash của file gốc: upload lại y hệt không phải giải mã/resize/nén lại
+        raw_key = await client.run_in_pool(_raw_cache_key, image_path_or_bytes, prompt, model_signature)
+        if raw_key is not None:
+            # Cache trên đĩa: đọc/ghi file trong thread pool, không chặn event loop
+            cached = await client.run_in_pool(vision_cache.get, raw_key)
+            if cached is not None:
+                attributes["cache_hit"] = "raw"
+                logging.info(f"Vision cache hit for upload {raw_key[:12]}")
+                return cached["image_report"], cached["materials"]
+
+        prepared = await client.prepare(image_path_or_bytes)
+        attributes["image_bytes"] = prepared.stats.get("processed_bytes")
+        key = await client.run_in_pool(cache_key, prepared.image, prompt, model_signature)
+        cached = await client.run_in_pool(vision_cache.get, key)
+        attributes["cache_hit"] = cached is not None
+        if cached is not None:
+            logging.info(f"Vision cache hit for image {key[:12]}")
+            if raw_key is not None:
+                await client.run_in_pool(vision_cache.put, raw_key, cached["image_report"], cached["materials"])
+            return cached["image_report"], cached["materials"]
+
+        image_report = await get_gemini_vision_report(prepared, prompt=prompt)
+        materials = parse_image_report(image_report)
+    await client.run_in_pool(vision_cache.put, key, image_report, materials)
+    if raw_key is not None:
+        await client.run_in_pool(vision_cache.put, raw_key, image_report, materials)
+    return image_report, materials
+
+
 # Example usage (for testing purposes)
 if __name__ == '__main__':
     # This part will only run when the script is executed directly
@@ -87,25 +224,25 @@ if __name__ == '__main__':
         # Test with a file path
         sample_image_path = "room_images.jpg"
         if os.path.exists(sample_image_path):
-            report = get_gemini_vision_report(sample_image_path)
+            report = asyncio.run(get_gemini_vision_report(sample_image_path))
             print("--- Gemini Vision Report (from file path) ---")
             print(report)
         else:
             print(f"Test image not found at {sample_image_path}")
-            
+
         # Test with image bytes
         try:
             with open("another_test_image.jpg", "rb") as f:
                 sample_image_bytes = f.read()
-            
+
             sample_prompt = "Describe this image and suggest a question a user might ask about it."
-            
-            report = get_gemini_vision_report(sample_image_bytes, sample_prompt)
-            
+
+            report = asyncio.run(get_gemini_vision_report(sample_image_bytes, sample_prompt))
+
             print("--- Gemini Vision Report (from bytes) ---")
             print(report)
         except FileNotFoundError:
             print("Second test image not found.")
-        
+
     except Exception as e:
-        print(f"An error occurred during the test run: {e}") 
\ No newline at end of file
+        print(f"An error occurred during the test run: {e}")
@@ -0,0 +1,161 @@
+"""Content-addressed on-disk cache of vision reports.
+
+Entries are keyed by a SHA-256 of the decoded image pixels together with the
+vision model name, a hash of the prompt text and the report parser's format
+version, so re-uploading the same photo (even re-saved with different
+metadata) skips the model call, while a prompt, model or parser change
+invalidates old reports automatically. Each report
+is also stored under a hash of the uploaded file bytes, so a byte-identical
+re-upload is found before the image is even decoded.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from .quote_parser import REPORT_FORMAT_VERSION
+
+# Defaults, overridable through the environment
+DEFAULT_CACHE_DIR = os.getenv("VISION_CACHE_DIR", "vision_cache")
+DEFAULT_MAX_ENTRIES = int(os.getenv("VISION_CACHE_MAX_ENTRIES", "2000"))
+DEFAULT_TTL_SECONDS = float(os.getenv("VISION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def prompt_version(prompt: str) -> str:
+    """Short hash identifying a prompt text."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
+def image_fingerprint(image: Image.Image) -> str:
+    """SHA-256 of the decoded pixels; independent of file format and metadata."""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.width}x{image.height}:".encode("ascii"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def cache_key(image: Image.Image, prompt: str, model_name: str) -> str:
+    """Cache key for one (image, prompt, model) analysis."""
+    combined = f"{image_fingerprint(image)}:{prompt_version(prompt)}:{model_name}:p{REPORT_FORMAT_VERSION}"
+    return hashlib.sha256(combined.encode("utf-8")).hexdigest()
+
+
+def raw_cache_key(data: bytes, prompt: str, model_name: str) -> str:
+    """Cache key for one (uploaded file bytes, prompt, model) analysis; checked before decoding."""
+    combined = f"raw:{hashlib.sha256(data).hexdigest()}:{prompt_version(prompt)}:{model_name}:p{REPORT_FORMAT_VERSION}"
+    return hashlib.sha256(combined.encode("utf-8")).hexdigest()
+
+
+class VisionReportCache:
+    """Disk cache of {image_report, materials} with LRU and TTL eviction.
+
+    Each entry is one small JSON file under ``<directory>/<key[:2]>/``. An
+    in-memory index keeps entries in least-recently-used order; it is rebuilt
+    from file modification times at start-up. The directory is created by
+    the first ``put``.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS
+    ):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, float]" = OrderedDict()
+        # Thư mục chỉ được tạo khi ghi entry đầu tiên (put), không phải lúc import
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load_index(self) -> None:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    entries.append((os.path.getmtime(path), name[:-len(".json")]))
+        for mtime, key in sorted(entries):
+            self._index[key] = mtime
+
+    def _remove(self, key: str) -> None:
+        self._index.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached analysis.
+
+        Returns:
+            {"image_report": str, "materials": list, "created_at": float}, or None on a miss
+        """
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), 'r', encoding='utf-8') as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            # Đánh dấu vừa được dùng (LRU), cả trong bộ nhớ lẫn trên đĩa
+            now = time.time()
+            os.utime(self._path(key), (now, now))
+            self._index[key] = now
+            self._index.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, image_report: str, materials: List[Dict[str, Any]]) -> None:
+        """Store an analysis and evict the least recently used entries beyond max_entries."""
+        entry = {
+            "image_report": image_report,
+            "materials": materials,
+            "created_at": time.time()
+        }
+        path = self._path(key)
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Ghi ra file tạm rồi đổi tên để không bao giờ đọc phải entry ghi dở
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+            self._index[key] = entry["created_at"]
+            self._index.move_to_end(key)
+
+            while len(self._index) > self.max_entries:
+                oldest_key = next(iter(self._index))
+                self._remove(oldest_key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            return {"entries": len(self._index), "hits": self.hits, "misses": self.misses}
+
+
+# Shared cache instance
+vision_cache = VisionReportCache()